@@ -1,10 +1,10 @@
 from tropofy.app import AppWithDataSets, Step, StepGroup
 from tropofy.widgets import SimpleGrid, ParameterForm
 
-from models import Material, Sphere, Light
+from models import Material, Sphere, Light, Keyframe
 
-from widgets import OutputImage, ExecuteRender
-from parameters import CameraParameters, ImageParameters
+from widgets import OutputImage, ExecuteRender, ExecuteAnimation
+from parameters import CameraParameters, ImageParameters, AnimationParameters
 
 
 class RaytracerApp(AppWithDataSets):
@@ -13,7 +13,7 @@ class RaytracerApp(AppWithDataSets):
         return "Raytracer"
 
     def get_parameters(self):
-        return CameraParameters.get_params() + ImageParameters.get_params()
+        return CameraParameters.get_params() + ImageParameters.get_params() + AnimationParameters.get_params()
 
     def get_examples(self):
         return {'Demo scene': self.load_demo_scene_data}
@@ -59,7 +59,11 @@ class RaytracerApp(AppWithDataSets):
                             ParameterForm(
                                 title="Rendering quality",
                                 parameter_names_filter=[
-                                    CameraParameters.depth.name
+                                    CameraParameters.depth.name,
+                                    CameraParameters.min_weight.name,
+                                    CameraParameters.roulette.name,
+                                    CameraParameters.precision.name,
+                                    CameraParameters.min_light.name
                                 ]
                             )
                         ]
@@ -102,6 +106,17 @@ class RaytracerApp(AppWithDataSets):
                     Step(
                         name="Run renderer",
                         widgets=[ExecuteRender()]
+                    ),
+                    Step(
+                        name="Animate camera",
+                        widgets=[
+                            SimpleGrid(Keyframe),
+                            ParameterForm(
+                                title='Animation',
+                                parameter_names_filter=[AnimationParameters.frames.name]
+                            ),
+                            ExecuteAnimation()
+                        ]
                     )
                 ]
             ),
@@ -0,0 +1,5 @@
+import sys
+
+from renderer.benchmarks.suite import main
+
+sys.exit(main())
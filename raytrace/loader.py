@@ -0,0 +1,104 @@
+from typing import Callable, Optional
+from collections import OrderedDict
+from time import time
+import threading
+
+from sqlalchemy import event, func
+
+import renderer
+import models
+
+# scene content columns fetched for each model, in the order SceneArrays.from_rows expects
+MATERIAL_COLUMNS = (models.Material.name, models.Material.red, models.Material.green, models.Material.blue,
+                    models.Material.reflectance)
+SPHERE_COLUMNS = (models.Sphere.x, models.Sphere.y, models.Sphere.z, models.Sphere.radius, models.Sphere.material)
+LIGHT_COLUMNS = (models.Light.x, models.Light.y, models.Light.z, models.Light.power)
+
+
+class SceneLoader(object):
+
+    def __init__(self, max_data_sets=8): # type: (int) -> None
+        """
+        Loads each data set's scene in one bulk query per table and keeps the result, so renders of an unchanged
+        data set skip the database and reuse the scene's shapes and BVH.  Cached scenes are dropped when the ORM
+        writes to one of their rows, and as a safety net for changes made elsewhere, when a data set's row counts
+        no longer match.  Safe to share between threads, load_seconds and cached describe the calling thread's last
+        load.
+        :param max_data_sets: number of data sets to keep scenes for, least recently used are dropped first
+        """
+        self.max_data_sets = max_data_sets
+        # data set id -> (row counts, SceneArrays, Scene)
+        self._scenes = OrderedDict()
+        # materials outlive the scenes built from them, so editing one sphere doesn't recreate every material
+        self.materials = renderer.MaterialRegistry(max_data_sets)
+        # guards the scenes and materials, not held while querying the database
+        self._lock = threading.Lock()
+        # time taken by each thread's last call to scene, and whether it came from the cache
+        self._last = threading.local()
+
+        for model in (models.Material, models.Sphere, models.Light):
+            for change in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(model, change, self._row_changed)
+
+    @property # type: float
+    def load_seconds(self):
+        return getattr(self._last, 'load_seconds', 0.0)
+
+    @property # type: bool
+    def cached(self):
+        return getattr(self._last, 'cached', False)
+
+    def _row_changed(self, mapper, connection, target):
+        self.invalidate(target.data_set_id)
+
+    def invalidate(self, data_set_id): # type: (int) -> None
+        """
+        Forget the cached scene for a data set
+        :param data_set_id: id of the data set
+        """
+        with self._lock:
+            self._scenes.pop(data_set_id, None)
+
+    @staticmethod
+    def row_counts(data_set): # type: (object) -> tuple
+        return tuple(data_set.query(model).with_entities(func.count()).scalar()
+                     for model in (models.Material, models.Sphere, models.Light))
+
+    def scene(self, data_set, camera, extra_shapes=None):
+        # type: (object, renderer.Camera, Optional[Callable[[renderer.MaterialTable], list]]) -> renderer.Scene
+        """
+        Scene for a data set seen through the camera
+        :param data_set: Tropofy data set to load spheres, materials and lights from
+        :param camera: Camera to render with
+        :param extra_shapes: called with the data set's MaterialTable when the scene is loaded for shapes to add to
+        it, such as the floor, with their materials interned in the table
+        :return: Scene
+        """
+        start = time()
+        counts = self.row_counts(data_set)
+        with self._lock:
+            cached = self._scenes.pop(data_set.id, None)
+        self._last.cached = cached is not None and cached[0] == counts
+
+        if self._last.cached:
+            arrays, scene = cached[1:]
+        else:
+            arrays = renderer.SceneArrays.from_rows(
+                data_set.query(models.Material).with_entities(*MATERIAL_COLUMNS).all(),
+                data_set.query(models.Sphere).with_entities(*SPHERE_COLUMNS).all(),
+                data_set.query(models.Light).with_entities(*LIGHT_COLUMNS).all(),
+            )
+            with self._lock:
+                materials = self.materials.table(data_set.id)
+                shapes = arrays.shapes(materials)
+                if extra_shapes is not None:
+                    shapes = shapes + list(extra_shapes(materials))
+            scene = renderer.Scene(shapes, arrays.lights(), camera, materials)
+
+        with self._lock:
+            self._scenes[data_set.id] = (counts, arrays, scene)
+            while len(self._scenes) > self.max_data_sets:
+                self._scenes.popitem(last=False)
+
+        self._last.load_seconds = time() - start
+        return scene.with_camera(camera)
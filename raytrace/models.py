@@ -37,3 +37,10 @@ class Light(DataSetMixin):
     y = Column(Float)
     z = Column(Float)
     power = Column(Float)
+
+
+class Keyframe(DataSetMixin):
+    time = Column(Float)
+    x = Column(Float)
+    y = Column(Float)
+    z = Column(Float)
@@ -2,17 +2,21 @@ import re
 
 from tropofy.app import Parameter, ParameterGroup
 
+from renderer.camera import PRECISIONS
+
 
 class RangeValidator(object):
     '''
-    Validator ensures that supplied value is between min_value and max_value
+    Validator ensures that supplied value is between min_value and max_value, or equal to min_value if
+    min_inclusive is set
     '''
-    def __init__(self, min_value=0, max_value=0):
+    def __init__(self, min_value=0, max_value=0, min_inclusive=False):
         self.min = min_value
         self.max = max_value
+        self.min_inclusive = min_inclusive
 
     def __call__(self, value):
-        return self.min < value < self.max
+        return (self.min <= value if self.min_inclusive else self.min < value) and value < self.max
 
 
 def image_filename_validator(value):
@@ -22,14 +26,30 @@ def image_filename_validator(value):
     return False
 
 
+def precision_validator(value):
+    '''Validator ensures a floating point precision the renderer supports is chosen'''
+    return value in PRECISIONS
+
+
 class CameraParameters(ParameterGroup):
     x = Parameter(name="x", label="X", default=0.0, allowed_type=float)
     y = Parameter(name="y", label="Y", default=0.0, allowed_type=float)
     z = Parameter(name="z", label="Z", default=-0.5, allowed_type=float)
-    depth = Parameter(name="depth", label="Recursive reflection depth", default=4, allowed_type=int, validator=RangeValidator(0, 6))
+    depth = Parameter(name="depth", label="Recursive reflection depth", default=4, allowed_type=int, validator=RangeValidator(0, 51))
+    # reflections stop once their share of the pixel colour drops below about half an 8 bit colour step, 0 turns this off
+    min_weight = Parameter(name="min_weight", label="Minimum reflection contribution", default=0.002, allowed_type=float, validator=RangeValidator(0, 1, min_inclusive=True))
+    roulette = Parameter(name="roulette", label="Russian roulette reflection termination", default=False, allowed_type=bool)
+    # float32 halves the memory and bandwidth of the batch renderers for colour errors far below an 8 bit step
+    precision = Parameter(name="precision", label="Precision ({0})".format(' or '.join(PRECISIONS)), default=PRECISIONS[0], allowed_type=str, validator=precision_validator)
+    # lights adding less than about a quarter of an 8 bit colour step to a point skip their shadow ray, 0 turns this off
+    min_light = Parameter(name="min_light", label="Minimum light contribution", default=0.001, allowed_type=float, validator=RangeValidator(0, 1, min_inclusive=True))
 
 
 class ImageParameters(ParameterGroup):
     filename = Parameter(name="filename", label="Filename", default="render.png", allowed_type=str, validator=image_filename_validator)
-    width = Parameter(name="width", label="Width", default=400, allowed_type=int, validator=RangeValidator(1, 600))
-    height = Parameter(name="height", label="Height", default=300, allowed_type=int, validator=RangeValidator(1, 600))
\ No newline at end of file
+    width = Parameter(name="width", label="Width", default=400, allowed_type=int, validator=RangeValidator(1, 8192))
+    height = Parameter(name="height", label="Height", default=300, allowed_type=int, validator=RangeValidator(1, 8192))
+
+
+class AnimationParameters(ParameterGroup):
+    frames = Parameter(name="frames", label="Number of frames", default=24, allowed_type=int, validator=RangeValidator(0, 1001))
@@ -1,7 +1,19 @@
 from scene import Scene
 from camera import Camera
 from shapes import Sphere, Plane
-from material import Material
+from material import Material, MaterialTable, MaterialRegistry
 from light import Light
-from raytracer import Raytracer
-from mathlib import Vector
\ No newline at end of file
+from raytracer import Raytracer, RenderCancelled
+from parallel import ParallelRaytracer
+from mathlib import Vector
+from cache import RenderCache, scene_key
+from record import TraceRecord
+from incremental import IncrementalRaytracer, SceneDiff
+from stats import RenderStats
+from png import PNGWriter, write_png, quantise
+from upload import FTPConnectionPool, Uploader
+from arrays import SceneArrays
+from compiled import CompiledScene
+from animation import CameraPath, Animation
+from rays import PrimaryRays
+from jobs import RenderJob, RenderScheduler
@@ -0,0 +1,119 @@
+from typing import Callable, List, Optional, Sequence, Tuple
+from time import time
+import bisect
+import multiprocessing
+
+from mathlib import Vector, lerp
+from scene import Scene
+from stats import RenderStats
+from parallel import _initialise_worker, _render_frame
+
+
+class CameraPath(object):
+
+    def __init__(self, keyframes): # type: (Sequence[Tuple[float, Vector]]) -> None
+        """
+        Camera positions at points in time, moving in straight lines between them
+        :param keyframes: (time, position) pairs in any order, at least one
+        """
+        if not keyframes:
+            raise ValueError('A camera path needs at least one keyframe')
+        self.keyframes = sorted(keyframes, key=lambda keyframe: keyframe[0])
+        self._times = [keyframe[0] for keyframe in self.keyframes]
+
+    def position(self, time): # type: (float) -> Vector
+        """
+        Camera position at a point in time, held at the first or last keyframe outside of the path
+        :param time: time to find the position for
+        :return: Vector position
+        """
+        after = bisect.bisect_right(self._times, time)
+        if after == 0:
+            first = self.keyframes[0][1]
+            return Vector(first.x, first.y, first.z)
+        if after == len(self.keyframes):
+            last = self.keyframes[-1][1]
+            return Vector(last.x, last.y, last.z)
+
+        (start, a), (end, b) = self.keyframes[after - 1], self.keyframes[after]
+        factor = (time - start) / float(end - start)
+        return Vector(lerp(a.x, b.x, factor), lerp(a.y, b.y, factor), lerp(a.z, b.z, factor))
+
+    def positions(self, frames): # type: (int) -> List[Vector]
+        """
+        Positions for frames spaced evenly in time from the first keyframe to the last
+        :param frames: number of frames
+        :return: list of Vector positions
+        """
+        start, end = self._times[0], self._times[-1]
+        if frames == 1:
+            return [self.position(start)]
+        return [self.position(start + (end - start) * frame / float(frames - 1)) for frame in range(frames)]
+
+
+class Animation(object):
+
+    def __init__(self, scene, path, frames, workers=None, instrument=False):
+        # type: (Scene, CameraPath, int, Optional[int], bool) -> None
+        """
+        Renders a camera fly-through as a numbered sequence of images, one frame per worker process at a time.
+        The scene is compiled and put in shared memory for the workers once, and each worker builds its BVH once,
+        however many frames it renders.
+        :param scene: Scene to render, its camera sets everything but the position
+        :param path: CameraPath to move the camera along
+        :param frames: number of frames
+        :param workers: number of worker processes, defaults to the number of cpus
+        :param instrument: collect the workers' RenderStats into stats
+        """
+        self.scene = scene
+        self.path = path
+        self.frames = frames
+        self.workers = workers or multiprocessing.cpu_count()
+        self.stats = RenderStats() if instrument else None
+        self.frames_per_minute = 0.0
+
+    def render(self, pattern, subsamples=0, update_callback=None, frame_callback=None):
+        # type: (str, int, Optional[Callable], Optional[Callable[[int, str], None]]) -> List[str]
+        """
+        Render every frame
+        :param pattern: output path format string, formatted with the frame number such as 'frame_{0:04d}.png'
+        :param subsamples: Number of samples per pixel
+        :param update_callback: Callback to provide progress information to as frames complete
+        :param frame_callback: called with the frame number and path of each frame as it completes, frames
+        complete out of order
+        :return: list of frame paths in order
+        """
+        tasks = [(frame, position, pattern.format(frame), subsamples)
+                 for frame, position in enumerate(self.path.positions(self.frames))]
+        paths = [None] * len(tasks) # type: List[str]
+        if not tasks:
+            return paths
+
+        start = time()
+        compiled = self.scene.compiled.share()
+        pool = multiprocessing.Pool(
+            min(self.workers, len(tasks)), _initialise_worker, (compiled, self.scene.camera, self.stats is not None)
+        )
+        try:
+            for completed, (frame, path, stats) in enumerate(pool.imap_unordered(_render_frame, tasks), 1):
+                paths[frame] = path
+                if stats is not None:
+                    self.stats.merge(stats)
+                if frame_callback:
+                    frame_callback(frame, path)
+
+                elapsed = time() - start
+                self.frames_per_minute = completed * 60.0 / elapsed if elapsed else 0.0
+                if update_callback:
+                    update_callback('Rendered frame {0} of {1}, {2:.1f} frames/minute'.format(
+                        completed, len(tasks), self.frames_per_minute
+                    ))
+        finally:
+            pool.terminate()
+            pool.join()
+            compiled.close()
+
+        if self.stats is not None:
+            self.stats.elapsed += time() - start
+
+        return paths
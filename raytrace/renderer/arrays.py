@@ -0,0 +1,90 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy
+
+from material import Material, MaterialTable
+from shapes import Shape, Sphere
+from light import Light
+
+
+class SceneArrays(object):
+
+    def __init__(self, material_names, material_colours, material_reflectance, centres, radii, sphere_materials,
+                 light_positions, light_powers):
+        # type: (List[str], numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray) -> None
+        """
+        Scene content held as columns rather than objects, as loaded in bulk from the data set
+        :param material_names: list of M material names
+        :param material_colours: (M, 3) array of material colours
+        :param material_reflectance: (M,) array of material reflectance
+        :param centres: (S, 3) array of sphere centres
+        :param radii: (S,) array of sphere radii
+        :param sphere_materials: (S,) array of indices into the materials
+        :param light_positions: (L, 3) array of light positions
+        :param light_powers: (L,) array of light powers
+        """
+        self.material_names = material_names
+        self.material_colours = material_colours
+        self.material_reflectance = material_reflectance
+        self.centres = centres
+        self.radii = radii
+        self.sphere_materials = sphere_materials
+        self.light_positions = light_positions
+        self.light_powers = light_powers
+        self._shapes = None
+        self._lights = None
+
+    @classmethod
+    def from_rows(cls, materials, spheres, lights):
+        # type: (Sequence[Tuple], Sequence[Tuple], Sequence[Tuple]) -> SceneArrays
+        """
+        Build the arrays from rows of column values.  Colours are capped at 1 and radii floored at 0 as when building
+        shapes one row at a time.
+        :param materials: (name, red, green, blue, reflectance) rows
+        :param spheres: (x, y, z, radius, material name) rows
+        :param lights: (x, y, z, power) rows
+        :return: SceneArrays
+        """
+        names = [row[0] for row in materials]
+        material_values = numpy.array([row[1:] for row in materials], dtype=float).reshape(-1, 4)
+        index = dict((name, position) for position, name in enumerate(names))
+
+        sphere_values = numpy.array([row[:4] for row in spheres], dtype=float).reshape(-1, 4)
+        # unknown material names raise KeyError, the data set's foreign key should prevent them
+        sphere_materials = numpy.array([index[row[4]] for row in spheres], dtype=int)
+
+        light_values = numpy.array(lights, dtype=float).reshape(-1, 4)
+
+        return cls(
+            names, numpy.minimum(material_values[:, :3], 1.0), material_values[:, 3],
+            sphere_values[:, :3], numpy.maximum(sphere_values[:, 3], 0.0), sphere_materials,
+            light_values[:, :3], light_values[:, 3]
+        )
+
+    def shapes(self, materials=None): # type: (Optional[MaterialTable]) -> List[Shape]
+        """
+        Sphere objects for the renderer, built on first use and shared by every later call
+        :param materials: MaterialTable to intern the materials in, so unchanged materials are reused from an
+        earlier load of the data set.  Materials no longer in the data set are dropped from it.
+        :return: list of Sphere
+        """
+        if self._shapes is None:
+            if materials is not None:
+                materials.retain(self.material_names)
+            create = Material if materials is None else materials.get_or_create
+            materials = [create(name, r, g, b, reflectance) for name, (r, g, b), reflectance
+                         in zip(self.material_names, self.material_colours.tolist(), self.material_reflectance.tolist())]
+            self._shapes = [Sphere(x, y, z, radius, materials[material]) for (x, y, z), radius, material
+                            in zip(self.centres.tolist(), self.radii.tolist(), self.sphere_materials.tolist())]
+        return self._shapes
+
+    def lights(self): # type: () -> List[Light]
+        """
+        Light objects for the renderer, built on first use and shared by every later call
+        :return: list of Light
+        """
+        if self._lights is None:
+            self._lights = [Light(x, y, z, power) for (x, y, z), power
+                            in zip(self.light_positions.tolist(), self.light_powers.tolist())]
+        return self._lights
+
@@ -0,0 +1,51 @@
+"""
+Closest hit scaling with and without the BVH for scenes of random spheres.
+
+Run from the raytrace directory with:
+
+    python -m renderer.benchmarks.bvh_benchmark
+"""
+import math
+import time
+
+import numpy
+
+from ..bvh import BVH
+from scenes import random_spheres, random_rays
+
+
+def linear_scan(shapes, origins, directions): # type: (list, numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+    t = numpy.full(len(origins), numpy.inf)
+    for shape in shapes:
+        t = numpy.minimum(t, shape.intersect_batch(origins, directions))
+    return t
+
+
+def timed(function, *args): # type: (...) -> float
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+def main(counts=(10, 100, 1000, 10000), rays=20000): # type: (tuple, int) -> None
+    origins, directions = random_rays(rays)
+    print('{0:>8} {1:>10} {2:>10} {3:>10}'.format('spheres', 'build (s)', 'linear (s)', 'bvh (s)'))
+
+    bvh_times = []
+    for count in counts:
+        shapes = random_spheres(count, radii=(0.05, 0.05))
+        start = time.time()
+        bvh = BVH(shapes)
+        build = time.time() - start
+        linear = timed(linear_scan, shapes, origins, directions)
+        accelerated = timed(bvh.intersect_batch, origins, directions)
+        bvh_times.append(accelerated)
+        print('{0:>8} {1:>10.3f} {2:>10.3f} {3:>10.3f}'.format(count, build, linear, accelerated))
+
+    # slope of log(time) against log(count), a linear scan is ~1
+    slope = (math.log(bvh_times[-1]) - math.log(bvh_times[0])) / (math.log(counts[-1]) - math.log(counts[0]))
+    print('bvh scaling exponent: {0:.2f}'.format(slope))
+
+
+if __name__ == '__main__':
+    main()
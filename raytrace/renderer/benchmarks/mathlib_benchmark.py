@@ -0,0 +1,97 @@
+"""
+Micro-benchmark of the float triple Vector against the original numpy backed implementation.
+
+Run from the raytrace directory with:
+
+    python -m renderer.benchmarks.mathlib_benchmark
+"""
+import timeit
+
+import numpy
+
+from ..mathlib import Vector, Ray
+from ..shapes import Sphere
+
+
+class LegacyVector(object):
+    """
+    The original numpy array backed Vector, kept here as the benchmark baseline
+    """
+
+    def __init__(self, x, y=0.0, z=0.0):
+        if isinstance(x, numpy.ndarray):
+            self.data = x
+        else:
+            self.data = numpy.array([x, y, z])
+
+    def __add__(self, other):
+        return LegacyVector(self.data + other.data)
+
+    def __sub__(self, other):
+        return LegacyVector(self.data - other.data)
+
+    def __mul__(self, scalar):
+        return LegacyVector(self.data * scalar)
+
+    @property
+    def magnitude(self):
+        return numpy.linalg.norm(self.data)
+
+    @property
+    def normal(self):
+        return LegacyVector(self.data / self.magnitude)
+
+    def dot(self, other):
+        return numpy.dot(self.data, other.data)
+
+
+def legacy_sphere_intersect(centre, radius, origin, direction):
+    """
+    The original Sphere.intersect written against LegacyVector
+    """
+    origin_to_centre = origin - centre
+    a = direction.dot(direction)
+    b = 2 * direction.dot(origin_to_centre)
+    c = origin_to_centre.dot(origin_to_centre) - radius * radius
+
+    discriminant = b * b - 4 * a * c
+    if discriminant <= 0:
+        return numpy.inf
+    discriminant_sqrt = numpy.sqrt(discriminant)
+
+    q = (-b - discriminant_sqrt) / 2.0 if b < 0 else (-b + discriminant_sqrt) / 2.0
+    t0, t1 = sorted((q / a, c / q))
+    if t1 >= 0:
+        return t1 if t0 < 0 else t0
+    return numpy.inf
+
+
+def main(number=100000): # type: (int) -> None
+    a, b = Vector(1.0, 2.0, 3.0), Vector(0.5, -1.0, 2.0)
+    legacy_a, legacy_b = LegacyVector(1.0, 2.0, 3.0), LegacyVector(0.5, -1.0, 2.0)
+
+    sphere = Sphere(0.0, 0.0, 2.0, 0.5, None)
+    ray = Ray(Vector(0.0, 0.0, -10.0), Vector(0.0, 0.01, 1.0))
+    legacy_centre, legacy_origin = LegacyVector(0.0, 0.0, 2.0), LegacyVector(0.0, 0.0, -10.0)
+    legacy_direction = LegacyVector(0.0, 0.01, 1.0).normal
+
+    cases = [
+        ('add', lambda: a + b, lambda: legacy_a + legacy_b),
+        ('sub', lambda: a - b, lambda: legacy_a - legacy_b),
+        ('mul', lambda: a * 2.0, lambda: legacy_a * 2.0),
+        ('dot', lambda: a.dot(b), lambda: legacy_a.dot(legacy_b)),
+        ('magnitude', lambda: a.magnitude, lambda: legacy_a.magnitude),
+        ('normal', lambda: a.normal, lambda: legacy_a.normal),
+        ('sphere intersect', lambda: sphere.intersect(ray),
+         lambda: legacy_sphere_intersect(legacy_centre, 0.5, legacy_origin, legacy_direction)),
+    ]
+
+    print('{0:>18} {1:>12} {2:>12} {3:>8}'.format('operation', 'legacy (us)', 'vector (us)', 'speedup'))
+    for name, current, legacy in cases:
+        current_time = timeit.timeit(current, number=number) / number * 1e6
+        legacy_time = timeit.timeit(legacy, number=number) / number * 1e6
+        print('{0:>18} {1:>12.3f} {2:>12.3f} {3:>7.1f}x'.format(name, legacy_time, current_time, legacy_time / current_time))
+
+
+if __name__ == '__main__':
+    main()
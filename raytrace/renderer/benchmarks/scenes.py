@@ -0,0 +1,94 @@
+from typing import List, Tuple
+import random
+
+import numpy
+
+from ..mathlib import Vector
+from ..shapes import Sphere, Plane
+from ..material import Material
+from ..light import Light
+from ..camera import Camera
+from ..scene import Scene
+
+# standard output sizes, (width, height)
+RESOLUTIONS = {
+    'small': (160, 120),
+    'default': (400, 300),
+    'large': (600, 600),
+}
+
+
+def floor(): # type: () -> Plane
+    """
+    The floor ExecuteRender adds to every scene
+    """
+    white = Material('_white', 1.0, 1.0, 1.0, 0.9)
+    return Plane(Vector(0.0, -0.5, 0.0), Vector(0.0, 1.0, 0.0), white)
+
+
+def demo_scene(width=32, height=24, depth=4): # type: (int, int, int) -> Scene
+    """
+    The scene loaded by RaytracerApp.load_demo_scene_data, with the floor and default camera.  Small by default,
+    the size the tests render it at.
+    """
+    red = Material('red', 0.8, 0.1, 0.1, 0.25)
+    green = Material('green', 0.5, 0.9, 0.1, 0.25)
+    blue = Material('blue', 0.1, 0.4, 0.8, 0.25)
+
+    shapes = [
+        Sphere(-0.5, 0.0, -2.0, 0.75, red),
+        Sphere(1.0, 0.0, -2.0, 0.5, blue),
+        Sphere(-0.5, -0.25, -1.25, 0.25, green),
+        floor()
+    ]
+    lights = [
+        Light(0.0, 2.0, -2.0, 0.75),
+        Light(0.0, 0.5, -1.0, 0.75)
+    ]
+    return Scene(shapes, lights, Camera(0.0, 0.0, -0.5, depth, width, height))
+
+
+def generated_scene(spheres, lights, width, height, depth=4, seed=0): # type: (int, int, int, int, int, int) -> Scene
+    """
+    Random spheres in front of the camera above the floor, shrinking as their number grows so the scene
+    stays about as full, lit by lights spread above them
+    :param spheres: number of spheres
+    :param lights: number of lights
+    :param seed: random seed so every run generates the same scene
+    """
+    generator = random.Random(seed)
+    materials = [Material('material{0}'.format(index), generator.random(), generator.random(), generator.random(),
+                          generator.choice((0.0, 0.25, 0.5))) for index in range(8)]
+    radius = 0.6 / spheres ** (1.0 / 3)
+
+    shapes = [Sphere(generator.uniform(-3.0, 3.0), generator.uniform(-0.5 + radius, 2.0), generator.uniform(-10.0, -2.0),
+                     radius * generator.uniform(0.5, 1.5), generator.choice(materials)) for _ in range(spheres)]
+    shapes.append(floor())
+
+    power = 1.5 / lights
+    scene_lights = [Light(generator.uniform(-4.0, 4.0), generator.uniform(2.0, 5.0), generator.uniform(-8.0, 0.0), power)
+                    for _ in range(lights)]
+    return Scene(shapes, scene_lights, Camera(0.0, 0.0, -0.5, depth, width, height))
+
+
+def random_spheres(count, seed=0, radii=(0.05, 0.5)): # type: (int, int, Tuple[float, float]) -> List[Sphere]
+    """
+    Spheres without materials scattered through a cube around the origin, for timing and testing intersection
+    queries
+    :param radii: smallest and largest radius, the same for spheres all of one size
+    """
+    generator = random.Random(seed)
+    return [Sphere(generator.uniform(-5, 5), generator.uniform(-5, 5), generator.uniform(-5, 5),
+                   generator.uniform(*radii), None) for _ in range(count)]
+
+
+def random_rays(count, seed=1): # type: (int, int) -> tuple
+    """
+    Rays from random points around the origin in random directions, for timing and testing intersection queries
+    :return: tuple of (count, 3) arrays of origins and normalised directions
+    """
+    generator = numpy.random.RandomState(seed)
+    origins = generator.uniform(-6, 6, (count, 3))
+    directions = generator.normal(size=(count, 3))
+    directions /= numpy.sqrt((directions * directions).sum(axis=1))[:, None]
+    return origins, directions
@@ -0,0 +1,205 @@
+"""
+Rendering benchmark suite.  Renders reference scenes at standard resolutions and reports rays per second, time
+per stage and peak memory as JSON, optionally flagging regressions against a saved baseline.  Runs without the
+Tropofy platform, from the raytrace directory:
+
+    python benchmark_runner.py --output results.json
+    python benchmark_runner.py --baseline results.json
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import io
+import multiprocessing
+import resource
+import sys
+import time
+
+from ..raytracer import Raytracer
+from ..parallel import ParallelRaytracer
+from ..camera import Camera
+from ..stats import RenderStats
+from ..png import write_png
+from scenes import RESOLUTIONS, demo_scene, generated_scene
+
+# metrics compared against a baseline and whether a higher value is better
+METRICS = {
+    'rays_per_second': True,
+    'render_seconds': False,
+    'peak_memory_kb': False,
+}
+
+
+def cases(quick=False): # type: (bool) -> List[Dict[str, object]]
+    """
+    Benchmark cases: the demo scene at every standard resolution, then generated scenes scaling the number of
+    spheres and the number of lights, with and without culling faint lights, then the largest demo render in each
+    precision mode
+    :param quick: only run the smaller cases
+    :return: list of case descriptions
+    """
+    resolutions = ['small'] if quick else sorted(RESOLUTIONS, key=lambda name: RESOLUTIONS[name])
+    sphere_counts = (10, 100, 1000) if quick else (10, 100, 1000, 10000)
+    light_counts = (1, 4, 64) if quick else (1, 4, 16, 64, 256)
+
+    suite = [{'name': 'demo-{0}'.format(resolution), 'scene': 'demo', 'resolution': resolution}
+             for resolution in resolutions]
+    suite += [{'name': 'spheres-{0}'.format(count), 'scene': 'generated', 'spheres': count, 'lights': 2,
+               'resolution': 'small'} for count in sphere_counts]
+    suite += [{'name': 'lights-{0}'.format(count), 'scene': 'generated', 'spheres': 100, 'lights': count,
+               'resolution': 'small'} for count in light_counts]
+    suite += [{'name': 'lights-{0}-culled'.format(count), 'scene': 'generated', 'spheres': 100, 'lights': count,
+               'min_light': 0.002, 'resolution': 'small'} for count in light_counts if count >= 16]
+    suite += [{'name': name, 'scene': 'demo', 'resolution': 'small' if quick else 'large', 'precision': precision,
+               'quantised': quantised}
+              for name, precision, quantised in (('float64', 'float64', False), ('float32', 'float32', False),
+                                                 ('float32-uint8', 'float32', True))]
+    return suite
+
+
+def run_case(case, workers=1): # type: (Dict[str, object], int) -> Dict[str, object]
+    """
+    Render one benchmark case, meant to run in a fresh process so peak memory belongs to this case alone.  Rays are
+    counted and stages timed with RenderStats, which costs a clock read per batch, rather than a TraceRecord that
+    would add its own time and memory to every ray.
+    :param case: case description from cases
+    :param workers: number of render processes, 1 renders in this process
+    :return: case description updated with its results
+    """
+    width, height = RESOLUTIONS[case['resolution']]
+    precision = case.get('precision', 'float64')
+    if case['scene'] == 'demo':
+        scene = demo_scene(width, height)
+    else:
+        scene = generated_scene(case['spheres'], case['lights'], width, height)
+    camera = scene.camera
+    stages = {}
+
+    # with_camera compiles the scene and builds its BVH to share them
+    start = time.time()
+    scene = scene.with_camera(Camera(camera.position.x, camera.position.y, camera.position.z, camera.depth,
+                                     camera.width, camera.height, camera.min_weight, camera.roulette, precision,
+                                     case.get('min_light', camera.min_light)))
+    scene.lowered(precision)
+    stages['bvh_build'] = time.time() - start
+
+    # generated once and cached for the render, forked workers inherit them
+    raytracer = Raytracer(scene, RenderStats())
+    start = time.time()
+    raytracer.rays.directions(scene.camera)
+    ray_generation = time.time() - start
+
+    quantised = case.get('quantised', False)
+    start = time.time()
+    if workers > 1:
+        parallel = ParallelRaytracer(scene, workers, instrument=True)
+        image = parallel.render(quantised=quantised)
+        stats = parallel.stats
+    else:
+        image = raytracer.render(vectorized=True, quantised=quantised)
+        stats = raytracer.stats
+    render_seconds = time.time() - start
+
+    # summed over the workers' stages, so with several workers these add up to more than render_seconds
+    stages['primary_rays'] = ray_generation + stats.stage_seconds['primary']
+    stages['reflection_rays'] = stats.stage_seconds['reflection']
+    stages['shading'] = stats.stage_seconds['shadow']
+
+    start = time.time()
+    write_png(io.BytesIO(), image)
+    stages['encode'] = time.time() - start
+
+    result = dict(case)
+    result.update({
+        'width': width,
+        'height': height,
+        'shapes': len(scene.shapes),
+        'workers': workers,
+        'primary_rays': stats.primary_rays,
+        'reflection_rays': stats.reflection_rays,
+        'shadow_rays': stats.shadow_rays,
+        # every light of every hit before culling, and the shadow rays actually cast after it
+        'unculled_shadow_rays': stats.shadow_rays + stats.culled_shadow_rays + stats.saturated_shadow_rays,
+        'image_bytes': image.nbytes,
+        'stages': stages,
+        'render_seconds': render_seconds,
+        'rays_per_second': stats.rays / render_seconds,
+        'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+    return result
+
+
+def _run_case(arguments): # type: (tuple) -> Dict[str, object]
+    return run_case(*arguments)
+
+
+def run(suite, workers=1, output=sys.stdout): # type: (List[Dict[str, object]], int, object) -> List[Dict[str, object]]
+    """
+    Run every case, each in its own process
+    :param suite: list of cases
+    :param workers: number of render processes per case
+    :param output: stream to print progress to
+    :return: list of results
+    """
+    results = []
+    for case in suite:
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        try:
+            result = pool.apply(_run_case, ((case, workers),))
+        finally:
+            pool.terminate()
+            pool.join()
+        output.write('{name:>17} {width:>4}x{height:<4} {render_seconds:>8.3f}s {rays_per_second:>12.0f} rays/s '
+                     '{peak_memory_kb:>8} KB {shadow_rays:>9}/{unculled_shadow_rays} shadow rays\n'.format(**result))
+        results.append(result)
+    return results
+
+
+def compare(results, baseline, tolerance=0.1): # type: (List[Dict[str, object]], List[Dict[str, object]], float) -> List[str]
+    """
+    Find metrics that got worse than a baseline by more than tolerance
+    :param results: results of this run
+    :param baseline: results of a previous run
+    :param tolerance: allowed relative change before flagging a regression
+    :return: list of regression descriptions, empty if there are none
+    """
+    previous = dict((result['name'], result) for result in baseline)
+    regressions = []
+    for result in results:
+        if result['name'] not in previous:
+            continue
+        for metric, higher_is_better in sorted(METRICS.items()):
+            old, new = previous[result['name']][metric], result[metric]
+            change = (new - old) / float(old) if old else 0.0
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append('{0} {1}: {2:.4g} -> {3:.4g} ({4:+.1%})'.format(result['name'], metric, old, new, change))
+    return regressions
+
+
+def main(argv=None): # type: (Optional[List[str]]) -> int
+    parser = argparse.ArgumentParser(description='Raytracer rendering benchmarks')
+    parser.add_argument('--quick', action='store_true', help='only run the smaller cases')
+    parser.add_argument('--filter', help='only run cases whose name contains this text')
+    parser.add_argument('--workers', type=int, default=1, help='render processes per case')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='flag regressions against the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='relative change allowed before a regression')
+    arguments = parser.parse_args(argv)
+
+    suite = cases(arguments.quick)
+    if arguments.filter:
+        suite = [case for case in suite if arguments.filter in case['name']]
+
+    results = run(suite, arguments.workers)
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), arguments.tolerance)
+        for regression in regressions:
+            sys.stdout.write('REGRESSION {0}\n'.format(regression))
+        return 1 if regressions else 0
+
+    return 0
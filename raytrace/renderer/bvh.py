@@ -0,0 +1,374 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy
+
+from mathlib import Ray
+from shapes import Shape
+from compiled import CompiledScene, SPHERE
+import kernels
+
+
+class _Node(object):
+
+    def __init__(self, lower, upper, left=None, right=None, shapes=None):
+        # type: (numpy.ndarray, numpy.ndarray, Optional[_Node], Optional[_Node], Optional[List[Tuple[int, Shape]]]) -> None
+        """
+        Bounding volume hierarchy node - either an interior node with two children or a leaf with shapes
+        :param lower: lower corner of the bounding box
+        :param upper: upper corner of the bounding box
+        :param left: first child node
+        :param right: second child node
+        :param shapes: list of (scene index, Shape) for leaf nodes
+        """
+        self.lower = lower
+        self.upper = upper
+        # plain float tuples for the scalar traversal, numpy indexing is slow for single rays
+        self.bounds = tuple(zip(lower.tolist(), upper.tolist()))
+        self.left = left
+        self.right = right
+        self.shapes = shapes
+        # for leaves of compiled spheres, the scene indices, centres and squared radii as arrays so the batch
+        # queries can test every sphere in the leaf at once
+        self.indices = None # type: Optional[numpy.ndarray]
+        self.centres = None # type: Optional[numpy.ndarray]
+        self.radii2 = None # type: Optional[numpy.ndarray]
+
+
+class BVH(object):
+
+    def __init__(self, shapes, leaf_size=4, compiled=None): # type: (List[Shape], int, Optional[CompiledScene]) -> None
+        """
+        Bounding volume hierarchy over the bounded shapes of a scene, split at the median centroid along the
+        longest axis.  Unbounded shapes such as planes can't be put in a box so they are tested separately
+        against every ray.  Hits are reported by index into shapes, ties go to the lowest index just like a
+        linear scan over the shapes would.
+        :param shapes: list of Shape instances, normally Scene.shapes
+        :param leaf_size: maximum number of shapes in a leaf node
+        :param compiled: CompiledScene of the shapes, the batch queries test leaves of spheres with its arrays.
+        Bounding boxes are stored in the same floating point type as its arrays.
+        """
+        self.leaf_size = leaf_size
+        self.shapes = shapes
+        self.compiled = compiled
+        self.dtype = compiled.sphere_centres.dtype if compiled is not None else numpy.dtype(float)
+        self.unbounded = []
+        bounded = []
+        for index, shape in enumerate(shapes):
+            bounds = shape.bounds()
+            if bounds is None:
+                self.unbounded.append((index, shape))
+            else:
+                bounded.append((index, shape, bounds[0], bounds[1]))
+
+        self.root = self._build(bounded) if bounded else None
+
+    def _build(self, items): # type: (List[Tuple[int, Shape, numpy.ndarray, numpy.ndarray]]) -> _Node
+        lower = numpy.min([item[2] for item in items], axis=0)
+        upper = numpy.max([item[3] for item in items], axis=0)
+        if lower.dtype != self.dtype:
+            # rounded outwards so the boxes still contain their shapes
+            lower = numpy.nextafter(lower.astype(self.dtype), numpy.array(-numpy.inf, dtype=self.dtype))
+            upper = numpy.nextafter(upper.astype(self.dtype), numpy.array(numpy.inf, dtype=self.dtype))
+
+        if len(items) <= self.leaf_size:
+            node = _Node(lower, upper, shapes=sorted((index, shape) for index, shape, _, _ in items))
+            compiled = self.compiled
+            if compiled is not None:
+                indices = numpy.array([index for index, _ in node.shapes])
+                if (compiled.shape_kinds[indices] == SPHERE).all():
+                    slots = compiled.shape_slots[indices]
+                    node.indices = indices
+                    node.centres = compiled.sphere_centres[slots]
+                    node.radii2 = compiled.sphere_radii2[slots]
+            return node
+
+        # median split along the axis with the largest spread of centroids
+        centroids = numpy.array([(item[2] + item[3]) * 0.5 for item in items])
+        axis = numpy.argmax(centroids.max(axis=0) - centroids.min(axis=0))
+        order = numpy.argsort(centroids[:, axis], kind='mergesort')
+        middle = len(items) // 2
+
+        return _Node(lower, upper,
+                     left=self._build([items[i] for i in order[:middle]]),
+                     right=self._build([items[i] for i in order[middle:]]))
+
+    @staticmethod
+    def _entry(node, origin, inverse_direction): # type: (_Node, Tuple[float, float, float], Tuple[float, float, float]) -> float
+        """
+        Slab test of a single ray against a node's bounding box
+        :return: distance at which the ray enters the box, numpy.inf if it misses
+        """
+        near, far = -numpy.inf, numpy.inf
+        for (low, high), o, inverse in zip(node.bounds, origin, inverse_direction):
+            if inverse is None:
+                # ray parallel to this pair of slabs
+                if o < low or o > high:
+                    return numpy.inf
+                continue
+            t0 = (low - o) * inverse
+            t1 = (high - o) * inverse
+            if t0 > t1:
+                t0, t1 = t1, t0
+            near = max(near, t0)
+            far = min(far, t1)
+            if near > far:
+                return numpy.inf
+
+        return near if far >= 0 else numpy.inf
+
+    def intersect(self, ray, tests=None): # type: (Ray, Optional[Dict[str, int]]) -> Tuple[float, Optional[Shape]]
+        """
+        Closest hit query for a single ray
+        :param ray: Ray to trace
+        :param tests: optional dict of shape class name to count intersection tests in
+        :return: tuple of distance to and Shape at the closest intersection, (numpy.inf, None) for a miss
+        """
+        t, hit_index, hit_object = numpy.inf, -1, None
+        for index, shape in self.unbounded:
+            if tests is not None:
+                tests[shape.__class__.__name__] += 1
+            t0 = shape.intersect(ray)
+            if t0 < t or (t0 == t and t0 < numpy.inf and index < hit_index):
+                t, hit_index, hit_object = t0, index, shape
+
+        if self.root is None:
+            return t, hit_object
+
+        origin = (ray.origin.x, ray.origin.y, ray.origin.z)
+        inverse_direction = ray.inverse_direction
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            entry = self._entry(node, origin, inverse_direction)
+            if entry == numpy.inf or entry > t:
+                continue
+            if node.shapes is None:
+                stack.append(node.right)
+                stack.append(node.left)
+                continue
+            for index, shape in node.shapes:
+                if tests is not None:
+                    tests[shape.__class__.__name__] += 1
+                t0 = shape.intersect(ray)
+                if t0 < t or (t0 == t and t0 < numpy.inf and index < hit_index):
+                    t, hit_index, hit_object = t0, index, shape
+
+        return t, hit_object
+
+    def occluded(self, ray, ignore=None, max_distance=numpy.inf): # type: (Ray, Optional[Shape], float) -> bool
+        """
+        Any hit query for a single ray, stops at the first intersection found
+        :param ray: Ray to trace
+        :param ignore: Shape to skip, normally the shape the ray starts on
+        :param max_distance: only intersections closer than this count, normally the distance to a light
+        :return: True if the ray hits any shape
+        """
+        return self.occluder(ray, ignore, max_distance) is not None
+
+    def occluder(self, ray, ignore=None, max_distance=numpy.inf, first=None, tests=None):
+        # type: (Ray, Optional[Shape], float, Optional[Shape], Optional[Dict[str, int]]) -> Optional[Shape]
+        """
+        Any hit query for a single ray that reports the shape found
+        :param ray: Ray to trace
+        :param ignore: Shape to skip, normally the shape the ray starts on
+        :param max_distance: only intersections closer than this count, normally the distance to a light
+        :param first: Shape to test before anything else, such as the last shape that blocked the same light
+        :param tests: optional dict of shape class name to count intersection tests in
+        :return: the first Shape found blocking the ray or None
+        """
+        def blocks(shape):
+            if shape is ignore:
+                return False
+            if tests is not None:
+                tests[shape.__class__.__name__] += 1
+            return shape.intersect(ray) < max_distance
+
+        if first is not None and blocks(first):
+            return first
+
+        for index, shape in self.unbounded:
+            if shape is not first and blocks(shape):
+                return shape
+
+        if self.root is None:
+            return None
+
+        origin = (ray.origin.x, ray.origin.y, ray.origin.z)
+        inverse_direction = ray.inverse_direction
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if self._entry(node, origin, inverse_direction) >= max_distance:
+                continue
+            if node.shapes is None:
+                stack.append(node.right)
+                stack.append(node.left)
+                continue
+            for index, shape in node.shapes:
+                if shape is not first and blocks(shape):
+                    return shape
+
+        return None
+
+    @staticmethod
+    def _entry_batch(node, origins, inverse_directions): # type: (_Node, numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+        """
+        Slab test of many rays against a node's bounding box
+        :return: (N,) array of distances at which the rays enter the box, numpy.inf where they miss
+        """
+        with numpy.errstate(invalid='ignore'):
+            t0 = (node.lower - origins) * inverse_directions
+            t1 = (node.upper - origins) * inverse_directions
+        # fmin/fmax drop the nan from a ray lying exactly in a slab plane, treating that axis as a pass
+        near = numpy.fmin(t0, t1).max(axis=1)
+        far = numpy.fmax(t0, t1).min(axis=1)
+        return numpy.where((far >= near) & (far >= 0), near, numpy.inf)
+
+    @staticmethod
+    def _inverse(directions): # type: (numpy.ndarray) -> numpy.ndarray
+        with numpy.errstate(divide='ignore'):
+            return 1.0 / directions
+
+    def intersect_batch(self, origins, directions, tests=None):
+        # type: (numpy.ndarray, numpy.ndarray, Optional[Dict[str, int]]) -> Tuple[numpy.ndarray, numpy.ndarray]
+        """
+        Closest hit query for many rays at once, traversing the tree with the subset of rays that reach each node
+        :param origins: (N, 3) array of ray origins
+        :param directions: (N, 3) array of normalised ray directions
+        :param tests: optional dict of shape class name to count intersection tests in
+        :return: tuple of (N,) distances and (N,) indices of the hit shapes, numpy.inf and -1 for misses
+        """
+        t = numpy.full(len(origins), numpy.inf, dtype=origins.dtype)
+        hit_index = numpy.full(len(origins), -1, dtype=int)
+
+        def update(index, shape, rays):
+            if tests is not None:
+                tests[shape.__class__.__name__] += len(rays)
+            t0 = shape.intersect_batch(origins[rays], directions[rays])
+            closer = (t0 < t[rays]) | ((t0 == t[rays]) & (t0 < numpy.inf) & (index < hit_index[rays]))
+            t[rays[closer]] = t0[closer]
+            hit_index[rays[closer]] = index
+
+        everything = numpy.arange(len(origins))
+        for index, shape in self.unbounded:
+            update(index, shape, everything)
+
+        if self.root is None or not len(origins):
+            return t, hit_index
+
+        inverse_directions = self._inverse(directions)
+        stack = [(self.root, everything)]
+        while stack:
+            node, rays = stack.pop()
+            entry = self._entry_batch(node, origins[rays], inverse_directions[rays])
+            rays = rays[(entry < numpy.inf) & (entry <= t[rays])]
+            if not len(rays):
+                continue
+            if node.shapes is None:
+                stack.append((node.right, rays))
+                stack.append((node.left, rays))
+                continue
+            if node.indices is None:
+                for index, shape in node.shapes:
+                    update(index, shape, rays)
+                continue
+
+            if tests is not None:
+                tests['Sphere'] += len(rays) * len(node.indices)
+            # leaf shapes are in index order so the first of equal distances is the lowest index
+            t0, best = kernels.backend.closest_spheres(origins[rays], directions[rays], node.centres, node.radii2)
+            index = node.indices[best]
+            closer = (t0 < t[rays]) | ((t0 == t[rays]) & (t0 < numpy.inf) & (index < hit_index[rays]))
+            t[rays[closer]] = t0[closer]
+            hit_index[rays[closer]] = index[closer]
+
+        return t, hit_index
+
+    def occluded_batch(self, origins, directions, ignore_index=None, max_distances=None):
+        # type: (numpy.ndarray, numpy.ndarray, Optional[numpy.ndarray], Optional[numpy.ndarray]) -> numpy.ndarray
+        """
+        Any hit query for many rays at once, rays drop out of the traversal as soon as they hit something
+        :param origins: (N, 3) array of ray origins
+        :param directions: (N, 3) array of normalised ray directions
+        :param ignore_index: optional (N,) array of shape indices to skip per ray, normally the shape the ray starts on
+        :param max_distances: optional (N,) array, only intersections closer than this count for each ray
+        :return: (N,) boolean array, True where the ray hits any shape
+        """
+        return self.occluders_batch(origins, directions, ignore_index, max_distances) >= 0
+
+    def occluders_batch(self, origins, directions, ignore_index=None, max_distances=None, first=(), tests=None):
+        # type: (numpy.ndarray, numpy.ndarray, Optional[numpy.ndarray], Optional[numpy.ndarray], Sequence[int], Optional[Dict[str, int]]) -> numpy.ndarray
+        """
+        Any hit query for many rays at once that also reports which shape blocked each ray
+        :param origins: (N, 3) array of ray origins
+        :param directions: (N, 3) array of normalised ray directions
+        :param ignore_index: optional (N,) array of shape indices to skip per ray, normally the shape the ray starts on
+        :param max_distances: optional (N,) array, only intersections closer than this count for each ray
+        :param first: indices of shapes to test against every ray before traversing, such as the shapes that
+        blocked the same light last time.  They're skipped during the traversal.
+        :param tests: optional dict of shape class name to count intersection tests in
+        :return: (N,) array with the index of the first shape found blocking each ray, -1 where nothing does
+        """
+        occluder = numpy.full(len(origins), -1, dtype=int)
+        if ignore_index is None:
+            ignore_index = numpy.full(len(origins), -1, dtype=int)
+        if max_distances is None:
+            max_distances = numpy.full(len(origins), numpy.inf, dtype=origins.dtype)
+
+        def update(index, shape, rays):
+            rays = rays[(occluder[rays] < 0) & (ignore_index[rays] != index)]
+            if tests is not None:
+                tests[shape.__class__.__name__] += len(rays)
+            if len(rays):
+                blocked = shape.intersect_batch(origins[rays], directions[rays]) < max_distances[rays]
+                occluder[rays[blocked]] = index
+
+        everything = numpy.arange(len(origins))
+        for index in first:
+            update(index, self.shapes[index], everything)
+
+        # already tested against every ray
+        skip = set(first)
+        for index, shape in self.unbounded:
+            if index not in skip:
+                update(index, shape, everything)
+
+        if self.root is None or not len(origins):
+            return occluder
+
+        inverse_directions = self._inverse(directions)
+        stack = [(self.root, everything)]
+        while stack:
+            node, rays = stack.pop()
+            rays = rays[occluder[rays] < 0]
+            if not len(rays):
+                continue
+            entry = self._entry_batch(node, origins[rays], inverse_directions[rays])
+            rays = rays[entry < max_distances[rays]]
+            if not len(rays):
+                continue
+            if node.shapes is None:
+                stack.append((node.right, rays))
+                stack.append((node.left, rays))
+                continue
+            if node.indices is None:
+                for index, shape in node.shapes:
+                    if index not in skip:
+                        update(index, shape, rays)
+                continue
+
+            centres, radii2, indices = node.centres, node.radii2, node.indices
+            if skip:
+                keep = numpy.array([index not in skip for index in indices.tolist()], dtype=bool)
+                if not keep.all():
+                    centres, radii2, indices = centres[keep], radii2[keep], indices[keep]
+                if not len(indices):
+                    continue
+            if tests is not None:
+                tests['Sphere'] += len(rays) * len(indices)
+            blocking = kernels.backend.first_blocking_spheres(origins[rays], directions[rays], centres, radii2, indices,
+                                                              ignore_index[rays], max_distances[rays])
+            found = blocking >= 0
+            occluder[rays[found]] = indices[blocking[found]]
+
+        return occluder
@@ -0,0 +1,124 @@
+from typing import Dict, Optional
+from collections import OrderedDict
+import hashlib
+import os
+import shutil
+import threading
+
+from scene import Scene
+
+# bump whenever a change to the renderer alters its output so stale images aren't served
+CACHE_VERSION = 4
+
+
+def scene_key(scene, **settings): # type: (Scene, **object) -> str
+    """
+    Content hash of everything that determines a rendered image
+    :param scene: Scene to be rendered
+    :param settings: render settings such as subsamples
+    :return: hex digest identifying the render
+    """
+    description = (CACHE_VERSION, scene.key(), tuple(sorted(settings.items())))
+    # repr of floats round trips exactly so equal content gives equal text
+    return hashlib.sha1(repr(description).encode('utf-8')).hexdigest()
+
+
+class RenderCache(object):
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, extension='.png'): # type: (str, int, str) -> None
+        """
+        Content addressed cache of rendered image files on local disk, evicting the least recently used
+        files once the total size goes over max_bytes.  Recency is kept in the file modification times so
+        it survives restarts.  Safe to share between threads.  Nothing touches the disk until the first lookup.
+        :param directory: directory to keep cached files in, created on first use if it doesn't exist
+        :param max_bytes: maximum total size of cached files
+        :param extension: file extension of cached files
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first, read from the directory on first use
+        self._entries = None # type: Optional[OrderedDict]
+
+    def _open(self): # type: () -> OrderedDict
+        """
+        The entries, creating the directory or reading the files already in it the first time, with the lock held
+        """
+        if self._entries is None:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            self._entries = OrderedDict()
+            files = [name for name in os.listdir(self.directory) if name.endswith(self.extension)]
+            for name in sorted(files, key=lambda name: os.path.getmtime(os.path.join(self.directory, name))):
+                self._entries[name[:-len(self.extension)]] = os.path.getsize(os.path.join(self.directory, name))
+            self._evict()
+        return self._entries
+
+    def _path(self, key): # type: (str) -> str
+        return os.path.join(self.directory, key + self.extension)
+
+    def get(self, key, path): # type: (str, str) -> bool
+        """
+        Copy a cached render to path
+        :param key: render key from scene_key
+        :param path: destination of the image file
+        :return: True on a cache hit, False if the render isn't cached
+        """
+        with self._lock:
+            entries = self._open()
+            if key not in entries or not os.path.exists(self._path(key)):
+                entries.pop(key, None)
+                self.misses += 1
+                return False
+
+            # under the lock so the file can't be evicted part way through copying it
+            shutil.copyfile(self._path(key), path)
+            entries[key] = entries.pop(key)
+            os.utime(self._path(key), None)
+            self.hits += 1
+            return True
+
+    def put(self, key, path): # type: (str, str) -> None
+        """
+        Add a rendered image file to the cache
+        :param key: render key from scene_key
+        :param path: image file to copy into the cache
+        """
+        with self._lock:
+            entries = self._open()
+            shutil.copyfile(path, self._path(key))
+            entries.pop(key, None)
+            entries[key] = os.path.getsize(self._path(key))
+            self._evict()
+
+    def _evict(self): # type: () -> None
+        # called with the lock held
+        total = sum(self._entries.values())
+        while total > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            if os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+            total -= size
+            self.evictions += 1
+
+    @property # type: Dict[str, float]
+    def stats(self):
+        """
+        Cache statistics for tuning the cache size
+        :return: dict of hits, misses, evictions, hit rate, number of entries and total bytes
+        """
+        with self._lock:
+            entries = self._open()
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+                'entries': len(entries),
+                'bytes': sum(entries.values()),
+            }
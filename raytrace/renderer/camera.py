@@ -1,8 +1,15 @@
+import numpy
+
 from mathlib import Vector
 
+# floating point types rays can be traced in, see Camera.precision
+PRECISIONS = ('float64', 'float32')
+
 
 class Camera(object):
-    def __init__(self, x, y, z, ray_depth, width, height): # type: (float, float, float, int, int, int) -> None
+    def __init__(self, x, y, z, ray_depth, width, height, min_weight=0.0, roulette=False, precision='float64',
+                 min_light=0.0):
+        # type: (float, float, float, int, int, int, float, bool, str, float) -> None
         """
         Initialise camera
         :param x: x position in 3d space
@@ -11,9 +18,40 @@ class Camera(object):
         :param ray_depth: maximum depth to recursively follow rays
         :param width: width of output
         :param height: height of output
+        :param min_weight: reflected rays whose weight in the pixel colour, the product of the reflectances along
+        their path, falls below this are terminated rather than followed to ray_depth
+        :param roulette: rather than always terminating rays below min_weight, continue them at random with
+        probability weight / min_weight and boost the survivors to min_weight, which is unbiased on average
+        :param precision: floating point type the batch renderers intersect and shade in, 'float32' halves the
+        memory and bandwidth of every ray array at the cost of about 1e-4 colour error
+        :param min_light: lights adding no more than this to a hit point's luminance, the lambertian term of the
+        light's power, are skipped without casting a shadow ray.  Lights behind the surface add nothing so are
+        always skipped.
         """
+        if precision not in PRECISIONS:
+            raise ValueError('Unknown precision {0}, choose from {1}'.format(precision, ', '.join(PRECISIONS)))
+        if min_light < 0:
+            raise ValueError('min_light must not be negative, lights behind a surface would take light away')
         self.position = Vector(x, y, z)
         self.depth = ray_depth
+        self.min_weight = min_weight
+        self.roulette = roulette
+        self.precision = precision
+        self.min_light = min_light
         self.width = width
         self.height = height
         self.background = Vector(0.0, 0.0, 0.0)
+
+    def key(self): # type: () -> tuple
+        """
+        Description of the camera's settings, equal for cameras that render identically
+        :return: tuple of position, depth, resolution, background colour, ray termination settings, precision and
+        light culling threshold
+        """
+        return (self.position.x, self.position.y, self.position.z, self.depth, self.width, self.height,
+                self.background.x, self.background.y, self.background.z, self.min_weight, self.roulette,
+                self.precision, self.min_light)
+
+    @property # type: numpy.dtype
+    def dtype(self):
+        return numpy.dtype(self.precision)
@@ -0,0 +1,232 @@
+from typing import List, Optional
+import copy
+
+import numpy
+
+from mathlib import Vector
+from shapes import Shape, Sphere, Plane
+from material import Material, MaterialTable
+from light import Light
+from shared import SharedArrays
+
+# values of CompiledScene.shape_kinds
+SPHERE = 0
+PLANE = 1
+
+
+class CompiledScene(object):
+
+    def __init__(self, shapes, lights, materials=None): # type: (List[Shape], List[Light], Optional[MaterialTable]) -> None
+        """
+        Struct of arrays form of a scene's shapes, materials and lights.  Spheres and planes are packed into their
+        own contiguous arrays and materials into a table shared by every shape, so intersection and shading can
+        work on whole arrays without touching the shape objects.  Shapes keep their scene index, hits are reported
+        by scene index just like the BVH does.
+        :param shapes: list of Sphere and Plane instances, normally Scene.shapes
+        :param lights: list of Light instances
+        :param materials: MaterialTable the shapes' materials were interned in, its ids and arrays become the
+        material table.  Other materials are numbered after its materials by content.
+        """
+        count = len(shapes)
+        self.shape_kinds = numpy.empty(count, dtype=numpy.int8)
+        # index of each shape in the arrays for its kind
+        self.shape_slots = numpy.empty(count, dtype=int)
+        self.shape_materials = numpy.empty(count, dtype=int)
+
+        table = materials if materials is not None else MaterialTable()
+        materials = {}
+        # interned materials are shared by many shapes, so look them up by identity before building their keys
+        material_ids = dict((id(material), material_id) for material_id, material in enumerate(table.materials))
+        material_values = []
+        spheres, planes = [], []
+        for index, shape in enumerate(shapes):
+            if isinstance(shape, Sphere):
+                self.shape_kinds[index] = SPHERE
+                self.shape_slots[index] = len(spheres)
+                spheres.append((index, shape.centre.x, shape.centre.y, shape.centre.z, shape.radius))
+            elif isinstance(shape, Plane):
+                self.shape_kinds[index] = PLANE
+                self.shape_slots[index] = len(planes)
+                planes.append((index, shape.position.x, shape.position.y, shape.position.z,
+                               shape.up.x, shape.up.y, shape.up.z))
+            else:
+                raise TypeError('Cannot compile shape of type {0}'.format(shape.__class__.__name__))
+
+            material_id = material_ids.get(id(shape.material))
+            if material_id is None:
+                key = shape.material.key()
+                if key not in materials:
+                    materials[key] = len(table) + len(material_values)
+                    material_values.append(key)
+                material_id = material_ids[id(shape.material)] = materials[key]
+            self.shape_materials[index] = material_id
+
+        material_values = numpy.array(material_values, dtype=float).reshape(-1, 4)
+        self.material_colours = numpy.concatenate([table.colours, material_values[:, :3]])
+        self.material_reflectance = numpy.concatenate([table.reflectance, material_values[:, 3]])
+
+        spheres = numpy.array(spheres, dtype=float).reshape(-1, 5)
+        self.sphere_indices = spheres[:, 0].astype(int)
+        self.sphere_centres = spheres[:, 1:4].copy()
+        self.sphere_radii = spheres[:, 4].copy()
+        self.sphere_radii2 = self.sphere_radii * self.sphere_radii
+
+        planes = numpy.array(planes, dtype=float).reshape(-1, 7)
+        self.plane_indices = planes[:, 0].astype(int)
+        self.plane_points = planes[:, 1:4].copy()
+        self.plane_normals = planes[:, 4:7].copy()
+
+        lights = numpy.array([(light.centre.x, light.centre.y, light.centre.z, light.power) for light in lights],
+                             dtype=float).reshape(-1, 4)
+        self.light_positions = lights[:, :3].copy()
+        self.light_powers = lights[:, 3].copy()
+
+    def __len__(self): # type: () -> int
+        return len(self.shape_kinds)
+
+    @property # type: int
+    def nbytes(self):
+        return sum(value.nbytes for value in vars(self).values() if isinstance(value, numpy.ndarray))
+
+    def astype(self, dtype): # type: (numpy.dtype) -> CompiledScene
+        """
+        The same scene with its floating point arrays converted, so batches of rays in that type stay in it
+        :param dtype: floating point type
+        :return: CompiledScene, self if it is already in dtype
+        """
+        if self.sphere_centres.dtype == dtype:
+            return self
+        compiled = copy.copy(self)
+        for name, value in vars(self).items():
+            if isinstance(value, numpy.ndarray) and value.dtype.kind == 'f':
+                setattr(compiled, name, value.astype(dtype))
+        return compiled
+
+    def share(self): # type: () -> SharedArrays
+        """
+        Copy the arrays into shared memory once, for worker processes to map rather than be sent, see attach
+        :return: SharedArrays to close once the workers are finished
+        """
+        return SharedArrays(vars(self))
+
+    @classmethod
+    def attach(cls, shared): # type: (SharedArrays) -> CompiledScene
+        """
+        A compiled scene whose arrays are those in shared memory, made read only as every worker sees them
+        :param shared: SharedArrays from share
+        :return: CompiledScene
+        """
+        compiled = cls.__new__(cls)
+        for name, array in shared.arrays.items():
+            array.setflags(write=False)
+            setattr(compiled, name, array)
+        return compiled
+
+    @property # type: numpy.ndarray
+    def shape_colours(self):
+        """
+        (shapes, 3) array of each shape's material colour
+        """
+        return self.material_colours[self.shape_materials]
+
+    @property # type: numpy.ndarray
+    def shape_reflectance(self):
+        """
+        (shapes,) array of each shape's material reflectance
+        """
+        return self.material_reflectance[self.shape_materials]
+
+    def normals(self, positions, hit_index): # type: (numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+        """
+        Surface normals of many hit points at once
+        :param positions: (N, 3) array of points on the surfaces of the shapes
+        :param hit_index: (N,) array of the scene index of the shape each point is on
+        :return: (N, 3) array of unit normals
+        """
+        normals = numpy.empty_like(positions)
+        kinds = self.shape_kinds[hit_index]
+        slots = self.shape_slots[hit_index]
+
+        on_sphere = kinds == SPHERE
+        centre_to_position = positions[on_sphere] - self.sphere_centres[slots[on_sphere]]
+        normals[on_sphere] = centre_to_position / numpy.sqrt((centre_to_position * centre_to_position).sum(axis=1))[:, None]
+
+        on_plane = kinds == PLANE
+        normals[on_plane] = self.plane_normals[slots[on_plane]]
+        return normals
+
+    def shapes(self): # type: () -> List[Shape]
+        """
+        Shape objects equivalent to the compiled shapes, in scene order
+        :return: list of Sphere and Plane
+        """
+        materials = [Material('_compiled{0}'.format(index), r, g, b, reflectance) for index, ((r, g, b), reflectance)
+                     in enumerate(zip(self.material_colours.tolist(), self.material_reflectance.tolist()))]
+        shapes = [None] * len(self) # type: List[Shape]
+        for index, (x, y, z), radius in zip(self.sphere_indices.tolist(), self.sphere_centres.tolist(),
+                                            self.sphere_radii.tolist()):
+            shapes[index] = Sphere(x, y, z, radius, materials[self.shape_materials[index]])
+        for index, position, up in zip(self.plane_indices.tolist(), self.plane_points.tolist(),
+                                       self.plane_normals.tolist()):
+            shapes[index] = Plane(Vector(*position), Vector(*up), materials[self.shape_materials[index]])
+        return shapes
+
+    def lights(self): # type: () -> List[Light]
+        """
+        Light objects equivalent to the compiled lights
+        :return: list of Light
+        """
+        return [Light(x, y, z, power) for (x, y, z), power
+                in zip(self.light_positions.tolist(), self.light_powers.tolist())]
+
+
+def sphere_distances(origins, directions, centres, radii2):
+    # type: (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+    """
+    Intersect many rays with many spheres, the same arithmetic as Sphere.intersect_batch
+    :param origins: (N, 3) array of ray origins
+    :param directions: (N, 3) array of normalised ray directions
+    :param centres: (K, 3) array of sphere centres
+    :param radii2: (K,) array of squared sphere radii
+    :return: (N, K) array of distances to the intersection points, numpy.inf where rays miss
+    """
+    ox = origins[:, 0, None] - centres[:, 0]
+    oy = origins[:, 1, None] - centres[:, 1]
+    oz = origins[:, 2, None] - centres[:, 2]
+    dx, dy, dz = directions[:, 0, None], directions[:, 1, None], directions[:, 2, None]
+    a = dx * dx + dy * dy + dz * dz
+    b = 2 * (dx * ox + dy * oy + dz * oz)
+    c = ox * ox + oy * oy + oz * oz - radii2
+
+    discriminant = b * b - 4 * a * c
+    hits = discriminant > 0
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        discriminant_sqrt = numpy.sqrt(numpy.where(hits, discriminant, 0.0))
+        q = numpy.where(b < 0, (-b - discriminant_sqrt) / 2.0, (-b + discriminant_sqrt) / 2.0)
+        t0 = q / a
+        t1 = c / q
+    # ordered the same way as the builtin min/max used by Sphere.intersect so nan edge cases agree
+    t0, t1 = numpy.where(t1 < t0, t1, t0), numpy.where(t1 > t0, t1, t0)
+
+    return numpy.where(hits & (t1 >= 0), numpy.where(t0 < 0, t1, t0), numpy.inf)
+
+
+def plane_distances(origins, directions, points, normals):
+    # type: (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+    """
+    Intersect many rays with many planes, the same arithmetic as Plane.intersect_batch
+    :param origins: (N, 3) array of ray origins
+    :param directions: (N, 3) array of normalised ray directions
+    :param points: (K, 3) array of points on the planes
+    :param normals: (K, 3) array of plane normals
+    :return: (N, K) array of distances to the intersection points, numpy.inf where rays miss
+    """
+    distances = numpy.empty((len(origins), len(points)))
+    for column, (point, normal) in enumerate(zip(points, normals)):
+        denominator = directions.dot(normal)
+        parallel = numpy.abs(denominator) < 0.0000001
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            facing = (point - origins).dot(normal) * (1 / denominator)
+            facing[parallel | (facing < 0)] = numpy.inf
+        distances[:, column] = facing
+    return distances
@@ -0,0 +1,189 @@
+from typing import Callable, List, Optional
+from collections import defaultdict
+import threading
+
+import numpy
+
+from raytracer import Raytracer, RenderCancelled, check_cancelled
+from parallel import ParallelRaytracer
+from record import TraceRecord
+from scene import Scene
+from stats import RenderStats
+
+
+class SceneDiff(object):
+
+    def __init__(self, old, new): # type: (Scene, Scene) -> None
+        """
+        Differences between two versions of a scene.  Shapes are matched by content so an edited shape shows up
+        as the old version removed and the new version added.
+        :param old: Scene that was rendered previously
+        :param new: edited Scene
+        """
+        self.camera_changed = old.camera.key() != new.camera.key()
+        self.lights_changed = [light.key() for light in old.lights] != [light.key() for light in new.lights]
+
+        unmatched = defaultdict(list)
+        for index, shape in enumerate(new.shapes):
+            unmatched[shape.key()].append(index)
+        for indices in unmatched.values():
+            indices.reverse()
+
+        # old shape index -> new shape index, -1 for shapes that are gone
+        self.old_to_new = numpy.full(len(old.shapes), -1, dtype=int)
+        for index, shape in enumerate(old.shapes):
+            indices = unmatched[shape.key()]
+            if indices:
+                self.old_to_new[index] = indices.pop()
+
+        self.removed = numpy.flatnonzero(self.old_to_new < 0)  # type: numpy.ndarray
+        self.added = sorted(index for indices in unmatched.values() for index in indices)  # type: List[int]
+
+    @property # type: bool
+    def empty(self):
+        return not (self.camera_changed or self.lights_changed or len(self.removed) or self.added)
+
+
+class IncrementalRaytracer(object):
+
+    # pixels retraced between checks for cancellation when retracing in process
+    BLOCK_PIXELS = 4096
+
+    def __init__(self, parallel_pixels=16384, workers=None): # type: (int, Optional[int]) -> None
+        """
+        Keeps the image and per ray metadata of the previous render so that after a scene edit only the pixels
+        the edit can affect are traced again.  A pixel is retraced when a ray in its reflection chain hit a
+        removed shape, had a light blocked by a removed shape, could hit an added shape before its recorded hit,
+        or could have a light blocked by an added shape.  Changing any light retraces every pixel that hit
+        something and changing the camera, or the number of lights, retraces everything.
+        :param parallel_pixels: retraces of more pixels than this run in a ParallelRaytracer pool, fewer aren't
+        worth starting the workers for
+        :param workers: number of worker processes for parallel retraces, defaults to the number of cpus
+        """
+        self.parallel_pixels = parallel_pixels
+        self.workers = workers
+        self.scene = None  # type: Optional[Scene]
+        self.image = None  # type: Optional[numpy.ndarray]
+        self.record = None  # type: Optional[TraceRecord]
+        self.retraced = 0
+
+    def reset(self, scene, image, record): # type: (Scene, numpy.ndarray, TraceRecord) -> None
+        """
+        Start from a render done elsewhere, such as a ParallelRaytracer render with a record
+        :param scene: Scene that was rendered
+        :param image: rendered image
+        :param record: TraceRecord of every pixel in the image
+        """
+        self.scene = scene
+        self.image = image
+        self.record = record
+
+    def can_update(self, scene): # type: (Scene) -> bool
+        """
+        Whether scene can be rendered by retracing part of the previous render
+        :param scene: edited Scene
+        :return: True if there is a previous render from the same camera with as many lights, the record holds
+        an occluder for each light
+        """
+        return (self.scene is not None and self.scene.camera.key() == scene.camera.key() and
+                self.record.light_count == len(scene.lights))
+
+    def render(self, scene, update_callback=None, stats=None, cancel=None):
+        # type: (Scene, Optional[Callable], Optional[RenderStats], Optional[threading.Event]) -> numpy.ndarray
+        """
+        Raytrace the scene, only retracing the pixels affected by changes since the previous render
+        :param scene: Scene to render
+        :param update_callback: Callback to provide progress information to
+        :param stats: optional RenderStats to instrument the retrace with
+        :param cancel: threading.Event checked between blocks of pixels, RenderCancelled is raised once it's set
+        and the previous render is forgotten, as its record has already been changed
+        :return: numpy.ndarray of pixels
+        """
+        try:
+            return self._render(scene, update_callback, stats, cancel)
+        except RenderCancelled:
+            self.reset(None, None, None)
+            raise
+
+    def _render(self, scene, update_callback, stats, cancel):
+        # type: (Scene, Optional[Callable], Optional[RenderStats], Optional[threading.Event]) -> numpy.ndarray
+        camera = scene.camera
+        if self.can_update(scene):
+            diff = SceneDiff(self.scene, scene)
+            pixels = self.affected_pixels(diff, scene)
+            image = self.image.copy()
+            self.record.discard(pixels)
+            self.record.remap(diff.old_to_new)
+            record = self.record
+        else:
+            pixels = numpy.arange(camera.width * camera.height)
+            image = numpy.zeros((camera.height, camera.width, 3))
+            record = TraceRecord(len(scene.lights))
+
+        if update_callback:
+            update_callback('Retracing {0} of {1} pixels'.format(len(pixels), camera.width * camera.height))
+
+        rows, columns = pixels // camera.width, pixels % camera.width
+        update = TraceRecord(len(scene.lights))
+        if len(pixels) > self.parallel_pixels:
+            raytracer = ParallelRaytracer(scene, self.workers, instrument=stats is not None)
+            image[rows, columns, :] = raytracer.render_pixels(rows, columns, record=update, cancel=cancel)
+            if stats is not None:
+                stats.merge(raytracer.stats)
+                stats.elapsed += raytracer.stats.elapsed
+        else:
+            raytracer = Raytracer(scene, stats)
+            for start in range(0, len(pixels), self.BLOCK_PIXELS):
+                check_cancelled(cancel)
+                block = slice(start, start + self.BLOCK_PIXELS)
+                image[rows[block], columns[block], :] = raytracer.render_pixels(rows[block], columns[block],
+                                                                                record=update)
+        record.extend(update)
+
+        self.retraced = len(pixels)
+        self.reset(scene, image, record)
+        return image
+
+    def affected_pixels(self, diff, scene): # type: (SceneDiff, Scene) -> numpy.ndarray
+        """
+        Find the pixels of the previous render that could change in the edited scene
+        :param diff: SceneDiff from the previous scene to scene
+        :param scene: edited Scene
+        :return: sorted array of pixel indices, row * width + column
+        """
+        record = self.record
+        if diff.camera_changed:
+            return numpy.arange(scene.camera.width * scene.camera.height)
+
+        hit = record.hit_index >= 0
+        affected = numpy.zeros(len(record.pixels), dtype=bool)
+
+        # rays that hit, or had a light blocked by, a shape that has gone
+        if len(diff.removed):
+            affected |= numpy.in1d(record.hit_index, diff.removed)
+            affected |= numpy.in1d(record.occluders, diff.removed).reshape(record.occluders.shape).any(axis=1)
+
+        if diff.lights_changed:
+            affected |= hit
+
+        for index in diff.added:
+            shape = scene.shapes[index]
+
+            # rays that would now hit the new shape first
+            candidates = numpy.flatnonzero(~affected)
+            affected[candidates] = shape.intersect_batch(record.origins[candidates], record.directions[candidates]) < record.t[candidates]
+
+            # lights that the new shape could now block, lights are unchanged or every hit is already affected
+            candidates = numpy.flatnonzero(hit & ~affected)
+            hit_points = record.origins[candidates] + record.directions[candidates] * record.t[candidates][:, None]
+            for light_index, light in enumerate(scene.lights):
+                # lights facing away or too faint stay culled, and lights skipped as the hit was already saturated
+                # can only matter once one of the lights that was tested is blocked, which this finds
+                lit = numpy.flatnonzero(record.occluders[candidates, light_index] == -1)
+                to_light = light.centre.data - hit_points[lit]
+                distances = numpy.sqrt((to_light * to_light).sum(axis=1))
+                to_light /= distances[:, None]
+                blocked = shape.intersect_batch(record.shadow_origins[candidates[lit]], to_light) < distances
+                affected[candidates[lit[blocked]]] = True
+
+        return numpy.unique(record.pixels[affected])
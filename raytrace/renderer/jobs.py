@@ -0,0 +1,232 @@
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from collections import OrderedDict, deque
+import threading
+
+from raytracer import RenderCancelled
+
+
+class RenderJob(object):
+
+    QUEUED, RUNNING, FINISHED, FAILED, CANCELLED = 'queued', 'running', 'finished', 'failed', 'cancelled'
+
+    def __init__(self, scheduler, owner, key, function):
+        # type: (RenderScheduler, Hashable, Hashable, Callable[[RenderJob], Any]) -> None
+        """
+        A render waiting for, or holding, one of a RenderScheduler's slots
+        :param scheduler: RenderScheduler the job was submitted to
+        :param owner: who the job belongs to, each owner's jobs run one at a time in the order submitted
+        :param key: description of the job's output, equal for jobs that would produce the same thing
+        :param function: called with the job on a scheduler thread to do the work.  It should pass the job's
+        progress method as its update callback and its cancelled event to the renderer.
+        """
+        self.scheduler = scheduler
+        self.owner = owner
+        self.key = key
+        self.function = function
+        self.state = self.QUEUED
+        self.result = None
+        self.error = None # type: Optional[Exception]
+        # set to ask the render to stop at its next tile, see raytracer.check_cancelled
+        self.cancelled = threading.Event()
+        self.messages = [] # type: List[str]
+        self._changed = threading.Condition(scheduler._lock)
+
+    @property # type: bool
+    def done(self):
+        return self.state in (self.FINISHED, self.FAILED, self.CANCELLED)
+
+    def progress(self, message): # type: (str) -> None
+        """
+        Record a progress message for everyone following the job
+        :param message: message text
+        """
+        with self._changed:
+            self.messages.append(message)
+            self._changed.notify_all()
+
+    def cancel(self): # type: () -> None
+        """
+        Drop the job if it's still queued, otherwise ask its render to stop
+        """
+        self.scheduler._cancel(self)
+
+    def follow(self, update_callback=None, interval=1.0): # type: (Optional[Callable[[str], Any]], float) -> Any
+        """
+        Block until the job has finished, passing on its progress messages and its place in the queue while it
+        waits.  Messages are passed on from the calling thread so callbacks that aren't thread safe are fine.
+        :param update_callback: called with each message
+        :param interval: most seconds between checks of the queue position
+        :return: the function's return value, RenderCancelled is raised if the job was cancelled and the
+        function's exception if it failed
+        """
+        read = 0
+        reported = None
+        while True:
+            with self._changed:
+                if not self.done and read == len(self.messages):
+                    self._changed.wait(interval)
+                messages = self.messages[read:]
+                read += len(messages)
+                state = self.state
+                position = self.scheduler._position(self) if state == self.QUEUED else 0
+
+            if update_callback:
+                if state == self.QUEUED and position != reported:
+                    update_callback('Waiting for a free renderer, {0} render{1} ahead in the queue'.format(
+                        position, '' if position == 1 else 's'
+                    ))
+                    reported = position
+                for message in messages:
+                    update_callback(message)
+
+            if state == self.CANCELLED:
+                raise RenderCancelled()
+            if state == self.FAILED:
+                raise self.error
+            if state == self.FINISHED:
+                return self.result
+
+
+class RenderScheduler(object):
+
+    def __init__(self, slots=2): # type: (int) -> None
+        """
+        Runs renders on a fixed number of background threads so concurrent requests queue rather than competing
+        for the cpus.  Each owner has a queue of their own, taking turns with the other owners for free slots so
+        one owner submitting many renders doesn't hold everyone else up.  Submitting a job identical to one
+        already queued or running hands back the job in flight rather than rendering the same thing twice.
+        :param slots: number of renders that run at once, each is free to use a pool of processes
+        """
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        # owner -> queued jobs oldest first, owners in the order they take turns
+        self._queues = OrderedDict() # type: Dict[Hashable, deque]
+        # key -> queued or running job
+        self._in_flight = {} # type: Dict[Hashable, RenderJob]
+        # owner -> their running job, in the order they started
+        self._running = OrderedDict() # type: Dict[Hashable, RenderJob]
+        self._threads = [] # type: List[threading.Thread]
+
+    def submit(self, owner, key, function, supersede=False):
+        # type: (Hashable, Hashable, Callable[[RenderJob], Any], bool) -> RenderJob
+        """
+        Queue a render, or join an identical one already queued or running
+        :param owner: who the job belongs to, such as a user or the data set being rendered
+        :param key: description of the job's output, see RenderJob
+        :param function: called with the job to do the work, see RenderJob
+        :param supersede: cancel the owner's other queued and running jobs, which the new job makes redundant
+        :return: RenderJob to follow
+        """
+        with self._lock:
+            job = self._in_flight.get(key)
+            if supersede:
+                for other in list(self._queues.get(owner, ())) + [self._running.get(owner)]:
+                    if other is not None and other is not job:
+                        self._cancel_locked(other)
+
+            if job is None:
+                job = self._in_flight[key] = RenderJob(self, owner, key, function)
+                self._queues.setdefault(owner, deque()).append(job)
+                self._available.notify_all()
+            if len(self._threads) < self.slots:
+                thread = threading.Thread(target=self._run, name='renderer-{0}'.format(len(self._threads)))
+                # a queued render isn't worth keeping the process alive for
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        return job
+
+    def position(self, job): # type: (RenderJob) -> int
+        """
+        :param job: a job from submit
+        :return: number of queued jobs that will start before it, 0 if it's running or done
+        """
+        with self._lock:
+            return self._position(job)
+
+    def _position(self, job): # type: (RenderJob) -> int
+        if job.state != RenderJob.QUEUED:
+            return 0
+        # play _next forward, a job starting whenever there's a free slot, otherwise once the longest running job
+        # has finished.  Until then owners with a job running are passed over.
+        queues = OrderedDict((owner, deque(queue)) for owner, queue in self._queues.items())
+        running = list(self._running)
+        order = []
+        while queues:
+            owner = next((owner for owner in queues if owner not in running), None)
+            if owner is None or len(running) >= self.slots:
+                running.pop(0)
+                continue
+            queue = queues.pop(owner)
+            order.append(queue.popleft())
+            if queue:
+                queues[owner] = queue
+            running.append(owner)
+        return order.index(job)
+
+    def _next(self): # type: () -> Optional[RenderJob]
+        """
+        Take the first queued job of the first owner in turn without a job running
+        """
+        for owner in self._queues:
+            if owner not in self._running:
+                queue = self._queues.pop(owner)
+                job = queue.popleft()
+                # the owner goes to the back for their next turn
+                if queue:
+                    self._queues[owner] = queue
+                return job
+        return None
+
+    def _run(self): # type: () -> None
+        while True:
+            with self._lock:
+                job = self._next()
+                while job is None:
+                    self._available.wait()
+                    job = self._next()
+                job.state = RenderJob.RUNNING
+                self._running[job.owner] = job
+                job._changed.notify_all()
+
+            state, result, error = RenderJob.FINISHED, None, None
+            try:
+                result = job.function(job)
+            except RenderCancelled:
+                state = RenderJob.CANCELLED
+            except Exception as error:
+                # keep the thread alive for the next render
+                state = RenderJob.FAILED
+
+            with self._lock:
+                del self._running[job.owner]
+                if self._in_flight.get(job.key) is job:
+                    del self._in_flight[job.key]
+                job.state, job.result, job.error = state, result, error
+                job._changed.notify_all()
+                # the owner's next job can go now
+                self._available.notify_all()
+
+    def _cancel(self, job): # type: (RenderJob) -> None
+        with self._lock:
+            self._cancel_locked(job)
+
+    def _cancel_locked(self, job): # type: (RenderJob) -> None
+        if job.done:
+            return
+        job.cancelled.set()
+        if self._in_flight.get(job.key) is job:
+            del self._in_flight[job.key]
+        if job.state == RenderJob.QUEUED:
+            queue = self._queues[job.owner]
+            queue.remove(job)
+            if not queue:
+                del self._queues[job.owner]
+            job.state = RenderJob.CANCELLED
+            job._changed.notify_all()
+
+    @property # type: dict
+    def stats(self):
+        with self._lock:
+            return {'running': len(self._running), 'queued': sum(len(queue) for queue in self._queues.values())}
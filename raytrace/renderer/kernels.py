@@ -0,0 +1,157 @@
+from typing import Optional, Tuple
+import math
+import os
+
+import numpy
+
+from compiled import sphere_distances
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+class NumpyKernels(object):
+    """
+    Inner loops of the batch traversal and shading written with whole array numpy operations.  Each builds
+    (rays, shapes) temporaries, which the compiled backend avoids.
+    """
+    name = 'numpy'
+
+    @staticmethod
+    def closest_spheres(origins, directions, centres, radii2):
+        # type: (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]
+        """
+        Closest hit of many rays against a group of spheres, see sphere_distances
+        :return: tuple of (N,) distances, numpy.inf for misses, and (N,) positions of the closest sphere within the
+        group, the first of equal distances and 0 for misses
+        """
+        distances = sphere_distances(origins, directions, centres, radii2)
+        best = distances.argmin(axis=1)
+        return distances[numpy.arange(len(best)), best], best
+
+    @staticmethod
+    def first_blocking_spheres(origins, directions, centres, radii2, indices, ignore_index, max_distances):
+        # type: (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+        """
+        Any hit of many shadow rays against a group of spheres
+        :param indices: (K,) array of the spheres' scene indices
+        :param ignore_index: (N,) array of the scene index each ray skips
+        :param max_distances: (N,) array, only intersections closer than this count
+        :return: (N,) array of the position of the first blocking sphere within the group, -1 where none block
+        """
+        blocked = ((sphere_distances(origins, directions, centres, radii2) < max_distances[:, None]) &
+                   (indices != ignore_index[:, None]))
+        first = blocked.argmax(axis=1)
+        return numpy.where(blocked[numpy.arange(len(first)), first], first, -1)
+
+    @staticmethod
+    def lambert(to_light, normals, power): # type: (numpy.ndarray, numpy.ndarray, float) -> numpy.ndarray
+        """
+        One light's lambertian contribution to the luminance of many hit points, negative where the light is
+        behind the surface
+        :param to_light: (N, 3) array of unit directions from the hit points to the light
+        :param normals: (N, 3) array of surface normals
+        :param power: the light's power
+        :return: (N,) array of contributions
+        """
+        return (to_light * normals).sum(axis=1) * power
+
+
+if numba is not None:
+    # numpy's error model so dividing by zero gives inf and nan like the numpy kernels rather than raising
+    _jit = numba.njit(nogil=True, error_model='numpy')
+
+    @_jit
+    def _sphere_distance(origins, directions, ray, centres, radii2, sphere):
+        ox = origins[ray, 0] - centres[sphere, 0]
+        oy = origins[ray, 1] - centres[sphere, 1]
+        oz = origins[ray, 2] - centres[sphere, 2]
+        dx, dy, dz = directions[ray, 0], directions[ray, 1], directions[ray, 2]
+        a = dx * dx + dy * dy + dz * dz
+        b = 2 * (dx * ox + dy * oy + dz * oz)
+        c = ox * ox + oy * oy + oz * oz - radii2[sphere]
+
+        discriminant = b * b - 4 * a * c
+        if not discriminant > 0:
+            return numpy.inf
+        discriminant_sqrt = math.sqrt(discriminant)
+        q = (-b - discriminant_sqrt) / 2.0 if b < 0 else (-b + discriminant_sqrt) / 2.0
+        t0 = q / a
+        t1 = c / q
+        t0, t1 = (t1 if t1 < t0 else t0), (t1 if t1 > t0 else t0)
+        if not t1 >= 0:
+            return numpy.inf
+        return t1 if t0 < 0 else t0
+
+    @_jit
+    def _closest_spheres(origins, directions, centres, radii2):
+        t = numpy.full(origins.shape[0], numpy.inf)
+        best = numpy.zeros(origins.shape[0], dtype=numpy.int64)
+        for ray in range(origins.shape[0]):
+            for sphere in range(centres.shape[0]):
+                distance = _sphere_distance(origins, directions, ray, centres, radii2, sphere)
+                if distance < t[ray]:
+                    t[ray] = distance
+                    best[ray] = sphere
+        return t, best
+
+    @_jit
+    def _first_blocking_spheres(origins, directions, centres, radii2, indices, ignore_index, max_distances):
+        first = numpy.full(origins.shape[0], -1, dtype=numpy.int64)
+        for ray in range(origins.shape[0]):
+            for sphere in range(centres.shape[0]):
+                if indices[sphere] != ignore_index[ray] and \
+                        _sphere_distance(origins, directions, ray, centres, radii2, sphere) < max_distances[ray]:
+                    first[ray] = sphere
+                    break
+        return first
+
+    @_jit
+    def _lambert(to_light, normals, power):
+        contributions = numpy.empty(to_light.shape[0], dtype=to_light.dtype)
+        for hit in range(to_light.shape[0]):
+            contributions[hit] = (to_light[hit, 0] * normals[hit, 0] + to_light[hit, 1] * normals[hit, 1] +
+                                  to_light[hit, 2] * normals[hit, 2]) * power
+        return contributions
+
+    class NumbaKernels(NumpyKernels):
+        """
+        The same kernels compiled to native loops, one ray at a time without temporary arrays
+        """
+        name = 'numba'
+
+        @staticmethod
+        def closest_spheres(origins, directions, centres, radii2):
+            return _closest_spheres(origins, directions, centres, radii2)
+
+        @staticmethod
+        def first_blocking_spheres(origins, directions, centres, radii2, indices, ignore_index, max_distances):
+            return _first_blocking_spheres(origins, directions, centres, radii2, indices, ignore_index, max_distances)
+
+        @staticmethod
+        def lambert(to_light, normals, power):
+            return _lambert(to_light, normals, power)
+else:
+    NumbaKernels = None
+
+BACKENDS = dict((kernels.name, kernels) for kernels in (NumpyKernels, NumbaKernels) if kernels is not None)
+
+
+def select(name=None): # type: (Optional[str]) -> type
+    """
+    Choose the kernels used by every raytracer in the process
+    :param name: 'numba' or 'numpy', defaults to the RAYTRACE_KERNELS environment variable, then numba when it's
+    installed
+    :return: the selected kernels
+    """
+    global backend
+    name = name or os.environ.get('RAYTRACE_KERNELS') or ('numba' if 'numba' in BACKENDS else 'numpy')
+    if name not in BACKENDS:
+        raise ValueError('Kernel backend {0} is not available, choose from {1}'.format(name, ', '.join(sorted(BACKENDS))))
+    backend = BACKENDS[name]
+    return backend
+
+
+backend = select()
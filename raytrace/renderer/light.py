@@ -1,3 +1,7 @@
+from typing import List, Optional
+
+import numpy
+
 from mathlib import Vector
 
 
@@ -12,3 +16,70 @@ class Light(object):
         """
         self.centre = Vector(x, y, z)
         self.power = power
+
+    def key(self): # type: () -> tuple
+        """
+        Description of the light's content, equal for lights that render identically
+        :return: tuple of position and power
+        """
+        return self.centre.x, self.centre.y, self.centre.z, self.power
+
+
+class LightIndex(object):
+
+    def __init__(self, positions, powers, leaf_size=16): # type: (numpy.ndarray, numpy.ndarray, int) -> None
+        """
+        Lights grouped into clusters of nearby lights so shading can skip a whole cluster when its bounding box
+        lies behind a surface, and ordered brightest first so hit points saturate with as few shadow rays as
+        possible.  The lights are split at the median of their widest axis until each cluster holds at most
+        leaf_size, so scenes with few lights have a single cluster and nothing to test per hit point.
+        :param positions: (L, 3) array of light positions, see CompiledScene.light_positions
+        :param powers: (L,) array of light powers
+        :param leaf_size: most lights in a cluster
+        """
+        clusters = []
+        pending = [numpy.arange(len(powers))]
+        while pending:
+            lights = pending.pop()
+            if len(lights) <= leaf_size:
+                if len(lights):
+                    clusters.append(lights)
+                continue
+            extent = positions[lights].max(axis=0) - positions[lights].min(axis=0)
+            lights = lights[numpy.argsort(positions[lights, extent.argmax()], kind='mergesort')]
+            pending += [lights[:len(lights) // 2], lights[len(lights) // 2:]]
+
+        # brightest first within each cluster and clusters in order of their brightest light
+        clusters = [lights[numpy.argsort(-powers[lights], kind='mergesort')] for lights in clusters]
+        clusters.sort(key=lambda lights: -powers[lights[0]])
+        self.clusters = [lights.tolist() for lights in clusters] # type: List[List[int]]
+        self.max_powers = numpy.array([powers[lights[0]] for lights in clusters])
+        self.lower = numpy.array([positions[lights].min(axis=0) for lights in clusters]).reshape(-1, 3)
+        self.upper = numpy.array([positions[lights].max(axis=0) for lights in clusters]).reshape(-1, 3)
+
+    def facing(self, points, normals): # type: (numpy.ndarray, numpy.ndarray) -> Optional[numpy.ndarray]
+        """
+        Which clusters could light each surface point, those with part of their bounding box in front of it
+        :param points: (N, 3) array of surface points
+        :param normals: (N, 3) array of surface normals
+        :return: (N, clusters) boolean array, or None if there's only one cluster and every light has to be
+        looked at anyway
+        """
+        if len(self.clusters) < 2:
+            return None
+        # the corner of each box furthest along each normal
+        reach = numpy.maximum(normals, 0).dot(self.upper.T) + numpy.minimum(normals, 0).dot(self.lower.T)
+        return reach > (points * normals).sum(axis=1)[:, None]
+
+    def lights(self, point, normal, min_light=0.0): # type: (Vector, Vector, float) -> List[int]
+        """
+        Lights worth shading a single surface point with, see facing
+        :param point: surface point
+        :param normal: surface normal
+        :param min_light: skip clusters whose brightest light is no brighter than this, see Camera.min_light
+        :return: list of light indices, brightest first within each cluster
+        """
+        facing = self.facing(point.data[None], normal.data[None])
+        return [light for cluster, lights in enumerate(self.clusters)
+                if (facing is None or facing[0, cluster]) and self.max_powers[cluster] > min_light
+                for light in lights]
@@ -1,11 +1,11 @@
+from typing import Dict, Iterable, List
+from collections import OrderedDict
+
+import numpy
+
 from mathlib import Vector
 
 class Material(object):
-    _materials = {}
-
-    @classmethod
-    def get_or_create(cls, name, r, g, b, reflectance): # type: (str, float, float, float, float) -> Material
-        return cls._materials.get(name, Material(name, r, g, b, reflectance))
 
     def __init__(self, name, r, g, b, reflectance): # type: (str, float, float, float, float) -> Material
         """
@@ -16,7 +16,117 @@ class Material(object):
         :param b: blue colour component
         :param reflectance: fraction of colour determined by reflections
         """
+        self.name = name
         self.colour = Vector(r, g, b)
         self.reflectance = reflectance
 
-        Material._materials[name] = self
+    def key(self): # type: () -> tuple
+        """
+        Description of the material's content, equal for materials that render identically
+        :return: tuple of colour components and reflectance
+        """
+        return self.colour.x, self.colour.y, self.colour.z, self.reflectance
+
+
+class MaterialTable(object):
+
+    def __init__(self): # type: () -> None
+        """
+        Interned materials numbered densely in the order they were first seen.  Asking for a material with the
+        same name and content returns the same object, a material whose content changed keeps its id.  Colours
+        and reflectance are lowered to arrays indexed by id, which CompiledScene takes as its material table so
+        shading can gather them for many hits at once.
+        """
+        self.materials = [] # type: List[Material]
+        self._ids = {} # type: Dict[str, int]
+        self._colours = None
+        self._reflectance = None
+
+    def __len__(self): # type: () -> int
+        return len(self.materials)
+
+    def get_or_create(self, name, r, g, b, reflectance): # type: (str, float, float, float, float) -> Material
+        """
+        Interned material for a name, see Material
+        :return: Material
+        """
+        material_id = self._ids.get(name)
+        if material_id is None:
+            material_id = self._ids[name] = len(self.materials)
+            self.materials.append(None)
+        elif self.materials[material_id].key() == (r, g, b, reflectance):
+            return self.materials[material_id]
+
+        material = self.materials[material_id] = Material(name, r, g, b, reflectance)
+        self._colours = self._reflectance = None
+        return material
+
+    def retain(self, names): # type: (Iterable[str]) -> None
+        """
+        Drop the materials that aren't named, such as those deleted or renamed since the last load, numbering the
+        rest densely again in the same order
+        :param names: names of the materials to keep
+        """
+        names = set(names)
+        materials = [material for material in self.materials if material.name in names]
+        if len(materials) != len(self.materials):
+            self.materials = materials
+            self._ids = dict((material.name, material_id) for material_id, material in enumerate(materials))
+            self._colours = self._reflectance = None
+
+    def id(self, name): # type: (str) -> int
+        """
+        :param name: material name
+        :return: index of the material in the tables, KeyError for unknown names
+        """
+        return self._ids[name]
+
+    def _lower(self): # type: () -> None
+        values = numpy.array([material.key() for material in self.materials], dtype=float).reshape(-1, 4)
+        self._colours, self._reflectance = values[:, :3], values[:, 3]
+
+    @property # type: numpy.ndarray
+    def colours(self):
+        """
+        (materials, 3) array of colours indexed by material id
+        """
+        if self._colours is None:
+            self._lower()
+        return self._colours
+
+    @property # type: numpy.ndarray
+    def reflectance(self):
+        """
+        (materials,) array of reflectance indexed by material id
+        """
+        if self._reflectance is None:
+            self._lower()
+        return self._reflectance
+
+
+class MaterialRegistry(object):
+
+    def __init__(self, max_data_sets=8): # type: (int) -> None
+        """
+        A MaterialTable for each data set, so reloading a data set's scene reuses its materials rather than
+        creating them again
+        :param max_data_sets: number of data sets to keep materials for, least recently used are dropped first
+        """
+        self.max_data_sets = max_data_sets
+        self._tables = OrderedDict()
+
+    def __len__(self): # type: () -> int
+        return len(self._tables)
+
+    def table(self, data_set_id): # type: (int) -> MaterialTable
+        """
+        :param data_set_id: id of the data set
+        :return: the data set's MaterialTable, new if it has none
+        """
+        table = self._tables.pop(data_set_id, None)
+        if table is None:
+            table = MaterialTable()
+        self._tables[data_set_id] = table
+        while len(self._tables) > self.max_data_sets:
+            self._tables.popitem(last=False)
+        return table
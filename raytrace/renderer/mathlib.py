@@ -1,4 +1,5 @@
 from typing import Union
+import math
 
 import numpy
 
@@ -15,6 +16,8 @@ def lerp(a, b, factor): # type: (float, float) -> float
 
 
 class Vector(object):
+    # plain float components - for three values python arithmetic is much faster than a numpy array
+    __slots__ = ('x', 'y', 'z')
 
     def __init__(self, x, y=0.0, z=0.0): # type: (Union[float, numpy.array], float, float) -> None
         """
@@ -24,18 +27,54 @@ class Vector(object):
         :param z: float z component
         """
         if isinstance(x, numpy.ndarray):
-            self.data = x
-        else:
-            self.data = numpy.array([x, y, z])
+            x, y, z = x.tolist()
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __getstate__(self): # type: () -> tuple
+        return self.x, self.y, self.z
+
+    def __setstate__(self, state): # type: (tuple) -> None
+        self.x, self.y, self.z = state
+
+    def __repr__(self): # type: () -> str
+        return 'Vector({0!r}, {1!r}, {2!r})'.format(self.x, self.y, self.z)
+
+    @property # type: numpy.ndarray
+    def data(self):
+        """
+        Components as a numpy array, for handing vectors to the batch code paths
+        :return: numpy.ndarray[x, y, z]
+        """
+        return numpy.array([self.x, self.y, self.z])
 
     def __add__(self, other): # type: (Vector) -> Vector
-        return Vector(self.data + other.data)
+        return Vector(self.x + other.x, self.y + other.y, self.z + other.z)
 
     def __sub__(self, other): # type: (Vector) -> Vector
-        return Vector(self.data - other.data)
+        return Vector(self.x - other.x, self.y - other.y, self.z - other.z)
 
     def __mul__(self, scalar): # type: (float) -> Vector
-        return Vector(self.data * scalar)
+        return Vector(self.x * scalar, self.y * scalar, self.z * scalar)
+
+    def __iadd__(self, other): # type: (Vector) -> Vector
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+
+    def __isub__(self, other): # type: (Vector) -> Vector
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        return self
+
+    def __imul__(self, scalar): # type: (float) -> Vector
+        self.x *= scalar
+        self.y *= scalar
+        self.z *= scalar
+        return self
 
     @property # type: float
     def magnitude(self):
@@ -43,7 +82,7 @@ class Vector(object):
         Length of the vector
         :return: float length
         """
-        return numpy.linalg.norm(self.data)
+        return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
 
     @property # type: Vector
     def normal(self):
@@ -51,7 +90,19 @@ class Vector(object):
         Normalised copy of vector - components are scaled such that the vector is a unit vector
         :return: normalised Vector
         """
-        return Vector(self.data / self.magnitude)
+        magnitude = self.magnitude
+        return Vector(self.x / magnitude, self.y / magnitude, self.z / magnitude)
+
+    def normalise(self): # type: () -> Vector
+        """
+        Normalise the vector in place
+        :return: self
+        """
+        magnitude = self.magnitude
+        self.x /= magnitude
+        self.y /= magnitude
+        self.z /= magnitude
+        return self
 
     def dot(self, other): # type: (Vector) -> float
         """
@@ -59,18 +110,32 @@ class Vector(object):
         :param other: other Vector
         :return: float dot product
         """
-        return numpy.dot(self.data, other.data)
+        return self.x * other.x + self.y * other.y + self.z * other.z
 
 
 class Ray(object):
+    __slots__ = ('origin', 'direction', 'depth', '_inverse_direction')
 
-    def __init__(self, origin, direction, depth=0): # type: (Vector, Vector) -> None
+    def __init__(self, origin, direction, depth=0, normalised=False): # type: (Vector, Vector, int, bool) -> None
         """
         Ray initialisation
         :param origin: position of start of ray
         :param direction: direction the ray points
         :param depth: optional depth count for use with recursive reflections
+        :param normalised: direction is already a unit vector so it can be used as is
         """
         self.origin = origin
-        self.direction = direction.normal
+        self.direction = direction if normalised else direction.normal
         self.depth = depth
+        self._inverse_direction = None
+
+    @property # type: tuple
+    def inverse_direction(self):
+        """
+        Reciprocal of each direction component, computed on first use for slab tests
+        :return: tuple of floats, None for components that are zero
+        """
+        if self._inverse_direction is None:
+            direction = self.direction
+            self._inverse_direction = tuple(1.0 / d if d != 0 else None for d in (direction.x, direction.y, direction.z))
+        return self._inverse_direction
@@ -0,0 +1,366 @@
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
+from collections import deque
+from contextlib import contextmanager
+from time import time
+import multiprocessing
+import threading
+import tempfile
+import random
+import shutil
+import copy
+
+import numpy
+
+from raytracer import Raytracer, progressive_passes, fill_preview, check_cancelled
+from rays import jitter_pattern
+from scene import Scene
+from camera import Camera
+from compiled import CompiledScene
+from shared import SharedArrays, SHARED_DIRECTORY
+from record import TraceRecord
+from stats import RenderStats
+from png import PNGWriter, write_png, quantise
+from mathlib import Vector
+
+# each worker process holds its own raytracer built from the scene it was initialised with
+_raytracer = None
+# the shared framebuffer the worker's tiles are written to, kept mapped from one tile to the next
+_framebuffer = None
+
+
+def _initialise_worker(compiled, camera, instrument=False):
+    # type: (Union[CompiledScene, SharedArrays], Camera, bool) -> None
+    """
+    Pool initialiser - the scene is shipped to each worker once rather than with every tile, as compiled arrays
+    which pickle far faster than the shape objects, or as compiled arrays in shared memory which cost the same to
+    send however big the scene is
+    :param compiled: CompiledScene to render, or SharedArrays from CompiledScene.share
+    :param camera: Camera to render with
+    :param instrument: collect RenderStats for each task
+    """
+    global _raytracer
+    # forked workers start with the parent's random state, reseed so roulette doesn't repeat the same pattern in
+    # every worker's tiles.  Jitter is a fixed pattern so renders stay reproducible.
+    random.seed()
+    if isinstance(compiled, SharedArrays):
+        compiled = CompiledScene.attach(compiled)
+    scene = Scene(compiled.shapes(), compiled.lights(), camera)
+    scene._compiled = compiled
+    _raytracer = Raytracer(scene, RenderStats() if instrument else None)
+
+
+def _take_stats(): # type: () -> Optional[RenderStats]
+    """
+    Hand back the stats collected by the worker's current task and start afresh for the next one
+    :return: RenderStats or None if not instrumented
+    """
+    stats = _raytracer.stats
+    if stats is not None:
+        _raytracer.stats = RenderStats()
+    return stats
+
+
+def _attach_framebuffer(framebuffer): # type: (SharedArrays) -> Dict[str, numpy.ndarray]
+    """
+    Map a framebuffer sent with a task, or reuse the mapping from the worker's previous task
+    :param framebuffer: SharedArrays holding the image and jitter
+    :return: name -> shared array
+    """
+    global _framebuffer
+    if _framebuffer is None or _framebuffer.path != framebuffer.path:
+        _framebuffer = framebuffer
+    return _framebuffer.arrays
+
+
+def _render_tile(task): # type: (Tuple[slice, slice, int, bool, SharedArrays, Optional[int]]) -> Tuple[slice, slice, Optional[RenderStats]]
+    """
+    Worker entry point, renders a tile straight into the framebuffer in shared memory so only its position goes
+    back
+    :param task: tuple of columns, rows and subsamples for the tile, whether to quantise it, the framebuffer and
+    the band of the framebuffer to use.  With a band the framebuffer holds a ring of bands of tiles, otherwise the
+    whole image.  Jitter, if there are subsamples, is read from the framebuffer.
+    :return: tuple of columns, rows and the tile's RenderStats if instrumented
+    """
+    columns, rows, subsamples, quantised, framebuffer, band = task
+    arrays = _attach_framebuffer(framebuffer)
+    image, jitter = arrays['image'], arrays.get('jitter')
+    target = rows
+    if band is not None:
+        image, jitter = image[band], jitter[band] if subsamples else None
+        target = slice(0, rows.stop - rows.start)
+
+    pixels = _raytracer.render_tile(columns, rows, subsamples, jitter[target, columns] if subsamples else None)
+    image[target, columns, :] = quantise(pixels) if quantised else pixels
+    return columns, rows, _take_stats()
+
+
+def _render_pixels(task): # type: (Tuple[numpy.ndarray, numpy.ndarray, int, SharedArrays, Optional[str]]) -> Tuple[Optional[SharedArrays], Optional[RenderStats]]
+    """
+    Worker entry point for a scattered set of pixels, rendered straight into the framebuffer in shared memory
+    :param task: tuple of rows, columns and subsamples for the pixels, the framebuffer holding the whole image and
+    its jitter, and the directory to write the pixels' TraceRecord to, None if not recording
+    :return: tuple of the TraceRecord in shared memory, for the caller to adopt, and RenderStats if instrumented
+    """
+    rows, columns, subsamples, framebuffer, records = task
+    arrays = _attach_framebuffer(framebuffer)
+    record = TraceRecord(len(_raytracer.scene.lights)) if records is not None else None
+    arrays['image'][rows, columns, :] = _raytracer.render_pixels(
+        rows, columns, subsamples, arrays['jitter'][rows, columns] if subsamples else None, record
+    )
+    return record.share(records) if record is not None else None, _take_stats()
+
+
+def _render_frame(task): # type: (Tuple[int, Vector, str, int]) -> Tuple[int, str, Optional[RenderStats]]
+    """
+    Worker entry point, renders one frame and writes it to disk so only the filename comes back.  The worker's
+    raytracer is kept from frame to frame so the BVH, compiled scene and the shadow occluder caches carry over.
+    :param task: tuple of frame number, camera position, output path and subsamples
+    :return: tuple of frame number, output path and the frame's RenderStats if instrumented
+    """
+    frame, position, path, subsamples = task
+    raytracer = _raytracer
+    camera = copy.copy(raytracer.scene.camera)
+    camera.position = position
+    raytracer.scene = raytracer.scene.with_camera(camera)
+    write_png(path, raytracer.render(subsamples, vectorized=True, quantised=True))
+    return frame, path, _take_stats()
+
+
+class ParallelRaytracer(object):
+
+    def __init__(self, scene, workers=None, tile_size=32, instrument=False): # type: (Scene, Optional[int], int, bool) -> None
+        """
+        Renders a scene by splitting the image into square tiles and tracing them in a pool of processes
+        :param scene: Scene object describing scene to be rendered
+        :param workers: number of worker processes, defaults to the number of cpus
+        :param tile_size: width and height of each tile in pixels
+        :param instrument: collect the workers' RenderStats into stats, with elapsed as the wall clock time
+        """
+        self.scene = scene
+        self.workers = workers or multiprocessing.cpu_count()
+        self.tile_size = tile_size
+        self.stats = RenderStats() if instrument else None
+
+    @contextmanager
+    def _pool(self): # type: () -> Iterator[multiprocessing.Pool]
+        """
+        Worker pool for one render with the compiled scene in shared memory.  The workers are stopped on the way
+        out, whether they have finished or not.
+        """
+        compiled = self.scene.compiled.share()
+        try:
+            pool = multiprocessing.Pool(self.workers, _initialise_worker,
+                                        (compiled, self.scene.camera, self.stats is not None))
+            try:
+                yield pool
+            finally:
+                pool.terminate()
+                pool.join()
+        finally:
+            compiled.close()
+
+    def _merge_stats(self, stats): # type: (Optional[RenderStats]) -> None
+        if stats is not None:
+            self.stats.merge(stats)
+
+    def tiles(self): # type: () -> Iterator[Tuple[slice, slice]]
+        """
+        Split the image into tiles
+        :return: iterator of (columns, rows) slices covering the image
+        """
+        camera = self.scene.camera
+        for y_start in range(0, camera.height, self.tile_size):
+            for x_start in range(0, camera.width, self.tile_size):
+                yield (slice(x_start, min(x_start + self.tile_size, camera.width)),
+                       slice(y_start, min(y_start + self.tile_size, camera.height)))
+
+    def render(self, subsamples=0, update_callback=None, quantised=False, cancel=None):
+        # type: (int, Optional[Callable], bool, Optional[threading.Event]) -> numpy.ndarray
+        """
+        Raytrace the scene
+        :param subsamples: Number of samples per pixel.  Significantly increases render times for large values
+        :param update_callback: Callback to provide progress information to as tiles complete
+        :param quantised: return 8 bit colours, quantised by the workers a tile at a time
+        :param cancel: threading.Event checked as each tile completes, once it's set the workers are stopped and
+        RenderCancelled is raised
+        :return: numpy.ndarray of pixels
+        """
+        camera = self.scene.camera
+        arrays = {'image': ((camera.height, camera.width, 3), numpy.uint8 if quantised else camera.dtype)}
+        if subsamples:
+            # jitter is drawn up front in this process so each worker doesn't draw whole rows for every tile
+            arrays['jitter'] = jitter_pattern(camera.width, numpy.arange(camera.height), subsamples).astype(camera.dtype)
+
+        # the workers write their tiles straight into the image, which outlives the file it was mapped from
+        framebuffer = SharedArrays(arrays)
+        tasks = [(columns, rows, subsamples, quantised, framebuffer, None) for columns, rows in self.tiles()]
+
+        start = time()
+        try:
+            with self._pool() as pool:
+                for completed, (columns, rows, stats) in enumerate(pool.imap_unordered(_render_tile, tasks), 1):
+                    check_cancelled(cancel)
+                    self._merge_stats(stats)
+                    if update_callback:
+                        update_callback('{0}% complete'.format(100.0 * completed / len(tasks)))
+            image = framebuffer.arrays['image']
+        finally:
+            framebuffer.close()
+
+        if self.stats is not None:
+            self.stats.elapsed += time() - start
+
+        return image
+
+    def render_stream(self, output, subsamples=0, update_callback=None, lookahead=2, cancel=None):
+        # type: (PNGWriter, int, Optional[Callable], int, Optional[threading.Event]) -> None
+        """
+        Raytrace the scene a band of tiles at a time, writing each band to the output as soon as it's complete.
+        Only the bands in flight are held in memory so peak memory scales with the tile size and image width
+        rather than the image size.
+        :param output: PNGWriter, or anything with a write_rows method taking (rows, width, 3) arrays top to bottom
+        :param subsamples: Number of samples per pixel
+        :param update_callback: Callback to provide progress information to as bands complete
+        :param lookahead: number of bands queued behind the one being waited on, keeping the workers busy
+        :param cancel: threading.Event checked between bands, see render
+        """
+        camera = self.scene.camera
+        bands = range(0, camera.height, self.tile_size)
+
+        # a ring of bands in shared memory, one for each band in flight, that the workers write their tiles into
+        slots = lookahead + 1
+        arrays = {'image': ((slots, self.tile_size, camera.width, 3), camera.dtype)}
+        if subsamples:
+            arrays['jitter'] = ((slots, self.tile_size, camera.width, subsamples, 2), camera.dtype)
+        framebuffer = SharedArrays(arrays)
+        ring = framebuffer.arrays
+
+        def submit(index): # type: (int) -> multiprocessing.pool.AsyncResult
+            rows = slice(bands[index], min(bands[index] + self.tile_size, camera.height))
+            band_height = rows.stop - rows.start
+            if subsamples:
+                # jitter is drawn a band at a time in this process so it never has to exist for the whole image
+                ring['jitter'][index % slots, :band_height] = jitter_pattern(
+                    camera.width, numpy.arange(rows.start, rows.stop), subsamples
+                )
+            tasks = [(columns, rows, subsamples, False, framebuffer, index % slots)
+                     for columns in (slice(x_start, min(x_start + self.tile_size, camera.width))
+                                     for x_start in range(0, camera.width, self.tile_size))]
+            return pool.map_async(_render_tile, tasks)
+
+        start = time()
+        try:
+            with self._pool() as pool:
+                pending = deque(submit(index) for index in range(min(slots, len(bands))))
+                for index in range(len(bands)):
+                    tiles = pending.popleft().get()
+                    check_cancelled(cancel)
+                    for columns, rows, stats in tiles:
+                        self._merge_stats(stats)
+                    # copied out so the slot can take the next band while this one is written
+                    band = ring['image'][index % slots, :rows.stop - rows.start].copy()
+                    if index + slots < len(bands):
+                        pending.append(submit(index + slots))
+                    output.write_rows(band)
+
+                    if update_callback:
+                        update_callback('{0}% complete'.format(100.0 * (index + 1) / len(bands)))
+        finally:
+            framebuffer.close()
+
+        if self.stats is not None:
+            self.stats.elapsed += time() - start
+
+    @contextmanager
+    def _scattered(self, subsamples, recording): # type: (int, bool) -> Iterator[Tuple[SharedArrays, Optional[str]]]
+        """
+        Framebuffer for tracing scattered pixels, holding the whole image and its jitter, and a directory in shared
+        memory for the workers to hand back their records in.  Both are removed on the way out, along with any
+        records left behind by a cancelled render.
+        :param subsamples: Number of samples per pixel
+        :param recording: whether the workers will be recording metadata
+        :return: tuple of the framebuffer and the records directory, None if not recording
+        """
+        camera = self.scene.camera
+        arrays = {'image': ((camera.height, camera.width, 3), float)}
+        if subsamples:
+            arrays['jitter'] = jitter_pattern(camera.width, numpy.arange(camera.height), subsamples).astype(camera.dtype)
+        framebuffer = SharedArrays(arrays)
+        records = tempfile.mkdtemp(prefix='raytrace-', dir=SHARED_DIRECTORY) if recording else None
+        try:
+            yield framebuffer, records
+        finally:
+            framebuffer.close()
+            if records is not None:
+                shutil.rmtree(records, ignore_errors=True)
+
+    def _trace_pixels(self, pool, framebuffer, records, rows, columns, subsamples, record, cancel):
+        # type: (multiprocessing.Pool, SharedArrays, Optional[str], numpy.ndarray, numpy.ndarray, int, Optional[TraceRecord], Optional[threading.Event]) -> None
+        """
+        Trace a scattered set of pixels into the framebuffer, grouped by the tile they fall in
+        :param pool: pool from _pool
+        :param framebuffer: framebuffer from _scattered
+        :param records: records directory from _scattered
+        :param rows: (N,) array of pixel row indices
+        :param columns: (N,) array of pixel column indices
+        :param subsamples: Number of samples per pixel
+        :param record: optional TraceRecord to collect the workers' per ray metadata in
+        :param cancel: threading.Event checked as each tile completes, see render
+        """
+        tiles_across = (self.scene.camera.width + self.tile_size - 1) // self.tile_size
+        tile = (rows // self.tile_size) * tiles_across + columns // self.tile_size
+        order = numpy.argsort(tile, kind='mergesort')
+        boundaries = numpy.flatnonzero(numpy.diff(tile[order])) + 1
+        tasks = [(rows[group], columns[group], subsamples, framebuffer, records)
+                 for group in numpy.split(order, boundaries) if len(group)]
+
+        start = time()
+        for tile_record, stats in pool.imap_unordered(_render_pixels, tasks):
+            check_cancelled(cancel)
+            if tile_record is not None:
+                # the record stays mapped once its file is gone
+                tile_record.adopt()
+                record.extend(TraceRecord.attach(tile_record))
+                tile_record.close()
+            self._merge_stats(stats)
+        if self.stats is not None:
+            self.stats.elapsed += time() - start
+
+    def render_pixels(self, rows, columns, subsamples=0, record=None, cancel=None):
+        # type: (numpy.ndarray, numpy.ndarray, int, Optional[TraceRecord], Optional[threading.Event]) -> numpy.ndarray
+        """
+        Raytrace an arbitrary set of pixels in the worker pool, see Raytracer.render_pixels
+        :param rows: (N,) array of pixel row indices
+        :param columns: (N,) array of pixel column indices
+        :param subsamples: Number of samples per pixel
+        :param record: optional TraceRecord to collect the workers' per ray metadata in
+        :param cancel: threading.Event checked as each tile completes, see render
+        :return: (N, 3) numpy.ndarray of pixels
+        """
+        with self._scattered(subsamples, record is not None) as (framebuffer, records):
+            with self._pool() as pool:
+                self._trace_pixels(pool, framebuffer, records, rows, columns, subsamples, record, cancel)
+            return framebuffer.arrays['image'][rows, columns]
+
+    def render_progressive(self, subsamples=0, coarsest=8, update_callback=None, record=None, cancel=None):
+        # type: (int, int, Optional[Callable], Optional[TraceRecord], Optional[threading.Event]) -> Iterator[numpy.ndarray]
+        """
+        Raytrace the scene in interleaved passes of halving pixel spacing, see Raytracer.render_progressive.
+        The pixels of each pass are grouped by tile and traced in the worker pool, straight into a framebuffer in
+        shared memory.
+        :param subsamples: Number of samples per pixel
+        :param coarsest: pixel spacing of the first pass, a power of two
+        :param update_callback: Callback to provide progress information to
+        :param record: optional TraceRecord to collect the workers' per ray metadata in
+        :param cancel: threading.Event checked as each tile completes, see render
+        :return: iterator of full size preview images, the last image is the finished render
+        """
+        camera = self.scene.camera
+        passes = list(progressive_passes(camera.width, camera.height, coarsest))
+        with self._scattered(subsamples, record is not None) as (framebuffer, records):
+            with self._pool() as pool:
+                for index, (stride, rows, columns) in enumerate(passes):
+                    if update_callback:
+                        update_callback('Rendering pass {0} of {1}'.format(index + 1, len(passes)))
+                    self._trace_pixels(pool, framebuffer, records, rows, columns, subsamples, record, cancel)
+                    yield fill_preview(framebuffer.arrays['image'], stride)
@@ -0,0 +1,102 @@
+from typing import BinaryIO, Union
+import struct
+import zlib
+
+import numpy
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def quantise(pixels): # type: (numpy.ndarray) -> numpy.ndarray
+    """
+    Convert floating point colours to 8 bit channels, rounding to the nearest level
+    :param pixels: array of colours with channels in [0, 1], values outside are clipped, or already quantised
+    uint8 colours which are returned as they are
+    :return: uint8 array of the same shape
+    """
+    if pixels.dtype == numpy.uint8:
+        return pixels
+    return (numpy.clip(pixels, 0, 1) * 255 + 0.5).astype(numpy.uint8)
+
+
+class PNGWriter(object):
+
+    def __init__(self, output, width, height, compression=6): # type: (Union[str, BinaryIO], int, int, int) -> None
+        """
+        Incremental encoder for 8 bit RGB PNG images.  Rows are written top to bottom in blocks of any size and
+        compressed straight to the output, so the whole image never has to be held in memory.
+        :param output: path or binary file object to write to
+        :param width: image width in pixels
+        :param height: image height in pixels
+        :param compression: zlib compression level
+        """
+        if width < 1 or height < 1:
+            raise ValueError('Image must be at least one pixel in size, got {0}x{1}'.format(width, height))
+
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._owns_file = not hasattr(output, 'write')
+        self._file = open(output, 'wb') if self._owns_file else output
+        self._compressor = zlib.compressobj(compression)
+
+        self._file.write(PNG_SIGNATURE)
+        # 8 bits per channel, colour type 2 (RGB), deflate, adaptive filtering, no interlace
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data): # type: (bytes, bytes) -> None
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(kind)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    def write_rows(self, pixels): # type: (numpy.ndarray) -> None
+        """
+        Append rows to the image
+        :param pixels: (rows, width, 3) array of floating point colours in [0, 1] or uint8 colours
+        """
+        if pixels.ndim != 3 or pixels.shape[1:] != (self.width, 3):
+            raise ValueError('Expected rows of shape (n, {0}, 3), got {1}'.format(self.width, pixels.shape))
+        if self.rows_written + len(pixels) > self.height:
+            raise ValueError('Image is only {0} rows high'.format(self.height))
+
+        # each scanline is prefixed with its filter type, 0 being no filtering
+        scanlines = numpy.zeros((len(pixels), 1 + self.width * 3), dtype=numpy.uint8)
+        scanlines[:, 1:] = (pixels if pixels.dtype == numpy.uint8 else quantise(pixels)).reshape(len(pixels), -1)
+
+        compressed = self._compressor.compress(scanlines.tobytes())
+        if compressed:
+            self._chunk(b'IDAT', compressed)
+        self.rows_written += len(pixels)
+
+    def close(self): # type: () -> None
+        """
+        Finish the image, every row must have been written
+        """
+        if self.rows_written != self.height:
+            raise ValueError('Only {0} of {1} rows were written'.format(self.rows_written, self.height))
+
+        self._chunk(b'IDAT', self._compressor.flush())
+        self._chunk(b'IEND', b'')
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self): # type: () -> PNGWriter
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._owns_file:
+            # leave the truncated file for the caller to deal with rather than masking the original error
+            self._file.close()
+
+
+def write_png(output, image): # type: (Union[str, BinaryIO], numpy.ndarray) -> None
+    """
+    Save a whole image as a PNG
+    :param output: path or binary file object to write to
+    :param image: (height, width, 3) array of colours, see PNGWriter.write_rows
+    """
+    with PNGWriter(output, image.shape[1], image.shape[0]) as writer:
+        writer.write_rows(image)
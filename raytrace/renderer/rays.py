@@ -0,0 +1,179 @@
+from typing import Optional, Tuple
+from collections import OrderedDict
+import threading
+
+import numpy
+
+from camera import Camera
+
+
+def screen_space(camera): # type: (Camera) -> Tuple[float, float, float, float]
+    """
+    Area of the z = 0 plane the image covers
+    :param camera: Camera being rendered
+    :return: tuple of left, bottom, right and top screen coordinates
+    """
+    aspect = float(camera.width) / camera.height
+    return -1.0, -1.0 / aspect + 0.25, 1.0, 1.0 / aspect + 0.25
+
+
+def strata(subsamples): # type: (int) -> Tuple[int, int]
+    """
+    Size of the grid of cells that subsamples are stratified over
+    :param subsamples: Number of samples per pixel
+    :return: tuple of columns and rows, with at least subsamples cells
+    """
+    columns = int(numpy.ceil(numpy.sqrt(subsamples)))
+    return columns, int(numpy.ceil(float(subsamples) / columns))
+
+
+def jitter_pattern(width, rows, subsamples): # type: (int, numpy.ndarray, int) -> numpy.ndarray
+    """
+    Stratified subsample offsets for whole rows of an image, where sample k is placed randomly within cell k of a
+    grid over the pixel.  Each row is drawn from its own seed so the pattern is the same for every render at a
+    resolution, whichever rows are asked for and in whatever order, which is what lets jittered directions be
+    cached.
+    :param width: image width in pixels
+    :param rows: (N,) array of row indices
+    :param subsamples: Number of samples per pixel
+    :return: (N, width, subsamples, 2) array of offsets in [0, 1)
+    """
+    strata_x, strata_y = strata(subsamples)
+    sample = numpy.arange(subsamples)
+    cells = numpy.column_stack((sample % strata_x, sample // strata_x))
+    uniform = numpy.array([numpy.random.RandomState(row).random_sample((width, subsamples, 2)) for row in rows])
+    return (cells + uniform.reshape(len(rows), width, subsamples, 2)) / numpy.array([strata_x, strata_y], dtype=float)
+
+
+def primary_directions(camera, rows, columns, jitter=None):
+    # type: (Camera, numpy.ndarray, numpy.ndarray, Optional[numpy.ndarray]) -> numpy.ndarray
+    """
+    Normalised directions of the rays from the camera through pixels, the same arithmetic as the per pixel loop
+    in Raytracer.render.  Worked out in float64 whatever the camera's precision.
+    :param camera: Camera being rendered
+    :param rows: (N,) array of pixel row indices
+    :param columns: (N,) array of pixel column indices
+    :param jitter: (N, subsamples, 2) subsample offsets for the pixels, see jitter_pattern
+    :return: (N, 3) array of directions, or (N, subsamples, 3) with jitter
+    """
+    left, bottom, right, top = screen_space(camera)
+    screen_x = numpy.linspace(left, right, camera.width)[columns]
+    screen_y = numpy.linspace(bottom, top, camera.height)[rows]
+
+    if jitter is not None:
+        pixel_x = float(right - left) / camera.width * 2.0
+        pixel_y = float(top - bottom) / camera.height * 2.0
+        screen_x = screen_x[:, None] + jitter[:, :, 0] * pixel_x
+        screen_y = screen_y[:, None] + jitter[:, :, 1] * pixel_y
+
+    directions = camera.position.data - numpy.stack((screen_x, screen_y, numpy.zeros_like(screen_x)), axis=-1)
+    directions /= numpy.sqrt((directions * directions).sum(axis=-1))[..., None]
+    return directions
+
+
+class PrimaryRays(object):
+
+    def __init__(self, max_bytes=64 * 1024 * 1024): # type: (int) -> None
+        """
+        Primary ray directions for whole images, kept between renders so repeated renders from the same camera
+        position, progressive passes and subsample passes don't generate their rays again.  Directions are keyed
+        by camera position, resolution and number of subsamples, subsamples being jittered by the fixed
+        jitter_pattern.  The least recently used are evicted once the total size goes over max_bytes.  Images too
+        big to cache have their directions generated for the pixels asked for each time.  Safe to share between
+        threads.
+        :param max_bytes: maximum total size of cached directions
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # key -> read only array of directions, least recently used first
+        self._directions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(camera, subsamples=0): # type: (Camera, int) -> tuple
+        """
+        :param camera: Camera being rendered
+        :param subsamples: Number of samples per pixel
+        :return: key identifying the image's directions
+        """
+        position = camera.position
+        return position.x, position.y, position.z, camera.width, camera.height, camera.precision, subsamples
+
+    def directions(self, camera, subsamples=0): # type: (Camera, int) -> Optional[numpy.ndarray]
+        """
+        Directions of the rays through every pixel
+        :param camera: Camera being rendered
+        :param subsamples: Number of samples per pixel, jittered by jitter_pattern
+        :return: read only (height, width, 3) array of directions in the camera's precision, (height, width,
+        subsamples, 3) with subsamples, or None if the image is too big to cache
+        """
+        samples = max(subsamples, 1)
+        if camera.width * camera.height * samples * 3 * camera.dtype.itemsize > self.max_bytes:
+            return None
+
+        # held while generating too, so renders asking for the same rays at once only generate them once
+        with self._lock:
+            key = self.key(camera, subsamples)
+            directions = self._directions.pop(key, None)
+            if directions is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                directions = numpy.empty((camera.height, camera.width) + ((samples,) if subsamples else ()) + (3,),
+                                         dtype=camera.dtype)
+                # a band of rows at a time so the float64 temporaries stay small whatever the image size
+                band = max(1, 65536 // (camera.width * samples))
+                columns = numpy.tile(numpy.arange(camera.width), band)
+                for start in range(0, camera.height, band):
+                    rows = numpy.arange(start, min(start + band, camera.height))
+                    count = len(rows) * camera.width
+                    jitter = None
+                    if subsamples:
+                        jitter = jitter_pattern(camera.width, rows, subsamples).reshape(count, samples, 2)
+                    directions[start:start + len(rows)] = primary_directions(
+                        camera, rows.repeat(camera.width), columns[:count], jitter
+                    ).reshape((len(rows),) + directions.shape[1:])
+                # shared by every render asking for the same rays so make sure none of them can change it
+                directions.setflags(write=False)
+                self._bytes += directions.nbytes
+
+            self._directions[key] = directions
+            while self._bytes > self.max_bytes:
+                self._bytes -= self._directions.popitem(last=False)[1].nbytes
+            return directions
+
+    def pixel_directions(self, camera, rows, columns, subsamples=0):
+        # type: (Camera, numpy.ndarray, numpy.ndarray, int) -> numpy.ndarray
+        """
+        Directions of the rays through some of the pixels, taken from the cached directions for the whole image
+        :param camera: Camera being rendered
+        :param rows: (N,) array of pixel row indices
+        :param columns: (N,) array of pixel column indices
+        :param subsamples: Number of samples per pixel, jittered by jitter_pattern
+        :return: (N, 3) array of directions in the camera's precision, or (N, subsamples, 3) with subsamples
+        """
+        directions = self.directions(camera, subsamples)
+        if directions is None:
+            jitter = None
+            if subsamples:
+                # only the rows the pixels are in
+                unique, inverse = numpy.unique(rows, return_inverse=True)
+                jitter = jitter_pattern(camera.width, unique, subsamples)[inverse, columns]
+            return primary_directions(camera, rows, columns, jitter).astype(camera.dtype, copy=False)
+        return directions[rows, columns]
+
+    def clear(self): # type: () -> None
+        with self._lock:
+            self._directions.clear()
+            self._bytes = 0
+
+    @property # type: dict
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._directions), 'bytes': self._bytes}
+
+
+# primary rays shared by every raytracer in the process
+primary_rays = PrimaryRays()
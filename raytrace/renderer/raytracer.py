@@ -1,36 +1,57 @@
-from typing import Callable, Optional
+from typing import Callable, Iterator, Optional, Tuple
 from random import random
+from time import time
+import threading
 
 import numpy
 
-from mathlib import Vector, Ray, lerp
+from mathlib import Vector, Ray
 from scene import Scene
+from record import TraceRecord, CULLED
+from stats import RenderStats
+from png import quantise
+from rays import PrimaryRays, primary_rays, primary_directions, strata
+import kernels
 
 
 class Raytracer(object):
 
-    def __init__(self, scene): # type: (Scene) -> None
+    def __init__(self, scene, stats=None, rays=None): # type: (Scene, Optional[RenderStats], Optional[PrimaryRays]) -> None
         """
         Algorithmically generates an image from a scene description by tracing rays into the scene
         testing whether they hit any objects.
         :param scene: Scene object describing scene to be rendered
+        :param stats: optional RenderStats to count rays and time render stages in, no instrumentation if None
+        :param rays: PrimaryRays to take primary ray directions from, defaults to the cache shared by the process
         """
         self.scene = scene
+        self.stats = stats
+        if stats is not None:
+            stats.backend = kernels.backend.name
+        self.rays = rays if rays is not None else primary_rays
+        # shapes that last blocked each light, tested first on the next shadow ray towards that light
+        self._last_occluder = {}
+        self._frequent_occluders = {}
 
-    def trace(self, ray): # type: (Ray) -> Vector
+    def trace(self, ray, weight=1.0): # type: (Ray, float) -> Vector
         """
         Traces a ray into the scene testing for intersections against shapes
         :param ray: Ray object to trace into scene
+        :param weight: weight of the ray's colour in the pixel, used to terminate rays that can't contribute
         :return: Vector colour at intersection point or background colour for no intersection
         """
-        hit_object = None
-        t = numpy.inf
+        stats = self.stats
+        if stats is not None:
+            start = time()
+            if ray.depth:
+                stats.reflection_rays += 1
+            else:
+                stats.primary_rays += 1
 
-        for scene_object in self.scene.shapes:
-            t0 = scene_object.intersect(ray)
-            if t0 < t:
-                t = t0
-                hit_object = scene_object
+        t, hit_object = self.scene.bvh.intersect(ray, stats.intersection_tests if stats is not None else None)
+
+        if stats is not None:
+            stats.stage_seconds['reflection' if ray.depth else 'primary'] += time() - start
 
         # if there were no intersections, then return the background colour
         if t == numpy.inf:
@@ -41,86 +62,566 @@ class Raytracer(object):
         luminance = 0.0
 
         # perform shading calculations
-        for light in self.scene.lights:
-            hit_point_to_light = (light.centre - hit_point).normal
-
-            #check whether this light contributes to the shading
-            in_shadow = False
-            for shadower in self.scene.shapes:
-                # we don't want to test against itself
-                if shadower == hit_object:
-                    continue
-                shadow_ray = Ray(hit_point + normal * 0.0001, hit_point_to_light)
-                if shadower.intersect(shadow_ray) < numpy.inf:
-                    in_shadow = True
-                    break
-            if in_shadow:
+        shadow_origin = hit_point + normal * 0.0001
+        lights = self.scene.lights
+        min_light = self.scene.camera.min_light
+        if stats is not None:
+            start = time()
+            shadow_rays = 0
+            saturated = 0
+        candidates = self.scene.light_index.lights(hit_point, normal, min_light)
+        for position, light_index in enumerate(candidates):
+            # lights come brightest first and the luminance is clipped at one below, so once it gets there the
+            # rest can't make any difference
+            if luminance >= 1.0:
+                if stats is not None:
+                    saturated = len(candidates) - position
+                break
+
+            light = lights[light_index]
+            hit_point_to_light = light.centre - hit_point
+            distance = hit_point_to_light.magnitude
+            hit_point_to_light.normalise()
+
+            # super simple lambertian lighting model.  Lights behind the surface, which would take light away, and
+            # lights too faint to matter are culled before casting a shadow ray.
+            contribution = hit_point_to_light.dot(normal) * light.power
+            if contribution <= min_light:
                 continue
 
-            # super simple lambertian lighting model
-            luminance += hit_point_to_light.dot(normal) * light.power
+            # check whether this light contributes to the shading - we don't want to test against itself and
+            # anything beyond the light can't cast a shadow
+            if stats is not None:
+                shadow_rays += 1
+            shadow_ray = Ray(shadow_origin, hit_point_to_light, normalised=True)
+            occluder = self.scene.bvh.occluder(shadow_ray, hit_object, distance, self._last_occluder.get(light_index),
+                                               stats.intersection_tests if stats is not None else None)
+            if occluder is not None:
+                self._last_occluder[light_index] = occluder
+                continue
+
+            luminance += contribution
+
+        if stats is not None:
+            stats.shadow_rays += shadow_rays
+            stats.saturated_shadow_rays += saturated
+            stats.culled_shadow_rays += len(lights) - shadow_rays - saturated
+            stats.stage_seconds['shadow'] += time() - start
 
         # calculate shaded colour - luminance may be over one if there are multiple light sources
         # normally this would be dealt with by HDR and tone mapping but is just clipped
         # in demo ray tracers
-        object_colour = hit_object.material.colour * min(luminance, 1.0)
+        material = hit_object.material
+        object_colour = material.colour * min(luminance, 1.0)
 
         # calculate reflection colour if material has reflectance
-        if hit_object.material.reflectance != 0.0 and ray.depth != self.scene.camera.depth:
-            reflected_direction = (ray.direction - normal * 2 * (ray.direction.dot(normal))).normal
-            # we need to 'translate' the reflection vector away from the hitpoint otherwise
-            # we risk intersecting the original hit point again which causes artifacts in the reflection
-            reflected_ray = Ray(hit_point + reflected_direction * 0.0001, reflected_direction, ray.depth + 1)
-            reflection_colour = self.trace(reflected_ray)
+        reflectance = material.reflectance
+        if reflectance == 0.0 or ray.depth == self.scene.camera.depth:
+            return object_colour
 
-            # interpolate shaded colour and reflected colour based on reflectance
-            return Vector(*[lerp(object_colour.data[i], reflection_colour.data[i], hit_object.material.reflectance) for i in range(3)])
+        camera = self.scene.camera
+        reflected_weight = weight * reflectance
+        if reflected_weight < camera.min_weight:
+            # too faint to matter, so stop here as if the depth ran out.  With roulette the ray carries on with
+            # probability reflected_weight / min_weight, the survivors standing in for the rays that didn't by
+            # scaling up their reflection so the expected colour is unchanged.
+            if not camera.roulette:
+                if self.stats is not None:
+                    self.stats.terminated_rays += 1
+                return object_colour
+            if random() * camera.min_weight >= reflected_weight:
+                if self.stats is not None:
+                    self.stats.terminated_rays += 1
+                object_colour *= 1.0 - reflectance
+                return object_colour
+            reflectance = camera.min_weight / weight
+            reflected_weight = camera.min_weight
+
+        reflected_direction = (ray.direction - normal * 2 * (ray.direction.dot(normal))).normalise()
+        # we need to 'translate' the reflection vector away from the hitpoint otherwise
+        # we risk intersecting the original hit point again which causes artifacts in the reflection
+        reflected_ray = Ray(hit_point + reflected_direction * 0.0001, reflected_direction, ray.depth + 1, normalised=True)
+        reflection_colour = self.trace(reflected_ray, reflected_weight)
+
+        # interpolate shaded colour and reflected colour based on reflectance, reusing the shaded colour vector
+        object_colour *= 1.0 - material.reflectance
+        object_colour += reflection_colour * reflectance
 
         return object_colour
 
-    def render(self, subsamples=0, update_callback=None): # type: (Optional[Callable]) -> numpy.ndarray
+    def trace_batch(self, origins, directions, depth=0, pixels=None, record=None):
+        # type: (numpy.ndarray, numpy.ndarray, int, Optional[numpy.ndarray], Optional[TraceRecord]) -> numpy.ndarray
+        """
+        Traces many rays into the scene at once, the array equivalent of trace.  Reflections are followed a bounce
+        at a time rather than recursively: every ray alive at a bounce is intersected and shaded in one batch, then
+        the reflected rays of reflective hits are compacted into the queue for the next bounce along with the
+        weight their colour carries in the final result.
+        :param origins: (N, 3) array of ray origins
+        :param directions: (N, 3) array of normalised ray directions
+        :param depth: reflection depth shared by all of the rays
+        :param pixels: (N,) array of the pixel each ray belongs to, required when recording
+        :param record: optional TraceRecord to store every ray's hit and shadow testers in
+        :return: (N, 3) array of colours at the intersection points or background colour for no intersection
+        """
+        # every array stays in the camera's precision from here on
+        dtype = self.scene.camera.dtype
+        origins, directions = origins.astype(dtype, copy=False), directions.astype(dtype, copy=False)
+        background = self.scene.camera.background.data.astype(dtype)
+        colours = numpy.zeros((len(origins), 3), dtype=dtype)
+
+        # the queue - which result each ray contributes to and how much
+        rays = numpy.arange(len(origins))
+        weights = numpy.ones(len(origins), dtype=dtype)
+
+        while len(rays):
+            hits, hit_points, normals, object_colours, reflectance = self._shade_batch(
+                origins, directions, depth, pixels, record
+            )
+
+            missed = numpy.ones(len(rays), dtype=bool)
+            missed[hits] = False
+            colours[rays[missed]] += weights[missed, None] * background
+
+            # calculate reflection colour for materials with reflectance
+            if depth == self.scene.camera.depth:
+                reflectance = numpy.zeros(len(hits), dtype=dtype)
+            reflective = numpy.flatnonzero(reflectance != 0.0)
+            reflected_weights = weights[hits[reflective]] * reflectance[reflective]
+
+            terminated = self._terminate(reflected_weights)
+            if terminated is not None:
+                if not self.scene.camera.roulette:
+                    # shaded as if the depth ran out
+                    reflectance[reflective[terminated]] = 0.0
+                reflective = reflective[~terminated]
+                reflected_weights = reflected_weights[~terminated]
+
+            colours[rays[hits]] += (weights[hits] * (1.0 - reflectance))[:, None] * object_colours
+            if not len(reflective):
+                break
+
+            incoming = directions[hits[reflective]]
+            normals = normals[reflective]
+            directions = incoming - normals * 2 * (incoming * normals).sum(axis=1)[:, None]
+            directions /= numpy.sqrt((directions * directions).sum(axis=1))[:, None]
+            origins = hit_points[reflective] + directions * 0.0001
+
+            rays = rays[hits[reflective]]
+            weights = reflected_weights
+            pixels = pixels[hits[reflective]] if record is not None else None
+            depth += 1
+
+        return colours
+
+    def _terminate(self, weights): # type: (numpy.ndarray) -> Optional[numpy.ndarray]
+        """
+        Decide which reflected rays are too faint to follow, see Camera.  With roulette the weights of the rays
+        that carry on are boosted in place.
+        :param weights: (N,) array of the weight each reflected ray would carry
+        :return: (N,) boolean array, True for rays to terminate, or None if every ray carries on
+        """
+        camera = self.scene.camera
+        faint = weights < camera.min_weight
+        if not faint.any():
+            return None
+
+        if camera.roulette:
+            faint_index = numpy.flatnonzero(faint)
+            survive = numpy.array([random() for _ in faint_index]) * camera.min_weight < weights[faint_index]
+            weights[faint_index[survive]] = camera.min_weight
+            faint[faint_index[survive]] = False
+
+        if self.stats is not None:
+            self.stats.terminated_rays += int(faint.sum())
+        return faint
+
+    def _shade_batch(self, origins, directions, depth, pixels, record):
+        # type: (numpy.ndarray, numpy.ndarray, int, Optional[numpy.ndarray], Optional[TraceRecord]) -> Tuple[numpy.ndarray, ...]
+        """
+        Intersect one bounce worth of rays with the scene and shade the hit points, see trace_batch
+        :return: tuple of the indices of rays that hit something and for each of those the hit point, surface
+        normal, shaded colour and material reflectance
+        """
+        compiled, bvh = self.scene.lowered(self.scene.camera.precision)
+
+        stats = self.stats
+        if stats is not None:
+            start = time()
+            if depth:
+                stats.reflection_rays += len(origins)
+            else:
+                stats.primary_rays += len(origins)
+
+        t, all_hit_index = bvh.intersect_batch(
+            origins, directions, stats.intersection_tests if stats is not None else None
+        )
+
+        if stats is not None:
+            stats.stage_seconds['reflection' if depth else 'primary'] += time() - start
+
+        # only rays that hit something need shading
+        hits = numpy.flatnonzero(all_hit_index >= 0)
+        if not len(hits):
+            if record is not None:
+                record.add(pixels, origins, directions, t, all_hit_index)
+            empty = numpy.empty((0, 3), dtype=origins.dtype)
+            return hits, empty, empty, empty, numpy.empty(0, dtype=origins.dtype)
+
+        hit_index = all_hit_index[hits]
+        hit_points = origins[hits] + directions[hits] * t[hits][:, None]
+        normals = compiled.normals(hit_points, hit_index)
+
+        # perform shading calculations, culling lights the same way trace does
+        luminance = numpy.zeros(len(hits), dtype=origins.dtype)
+        shadow_origins = hit_points + normals * 0.0001
+        occluders = numpy.full((len(hits), len(compiled.light_powers)), CULLED, dtype=int)
+        min_light = self.scene.camera.min_light
+        index = self.scene.light_index
+        facing = index.facing(hit_points, normals)
+        if stats is not None:
+            start = time()
+            shadow_rays = 0
+            saturated = 0
+        for cluster, lights in enumerate(index.clusters):
+            if index.max_powers[cluster] <= min_light:
+                break
+            for light in lights:
+                # hit points already saturated skip the rest of the lights
+                candidates = luminance < 1.0
+                if facing is not None:
+                    candidates &= facing[:, cluster]
+                if stats is not None:
+                    reached = len(hits) if facing is None else numpy.count_nonzero(facing[:, cluster])
+                    saturated += int(reached - numpy.count_nonzero(candidates))
+                candidates = numpy.flatnonzero(candidates)
+
+                hit_point_to_light = compiled.light_positions[light] - hit_points[candidates]
+                distances = numpy.sqrt((hit_point_to_light * hit_point_to_light).sum(axis=1))
+                hit_point_to_light /= distances[:, None]
+                contributions = kernels.backend.lambert(hit_point_to_light, normals[candidates],
+                                                        compiled.light_powers[light])
+                shaded = numpy.flatnonzero(contributions > min_light)
+                if not len(shaded):
+                    continue
+                candidates = candidates[shaded]
+
+                # check whether this light contributes to the shading - we don't want to test against itself and
+                # anything beyond the light can't cast a shadow.  All the hit points are tested against the light
+                # in one batch, starting with the shapes that blocked it most often last time.
+                light_occluders = bvh.occluders_batch(
+                    shadow_origins[candidates], hit_point_to_light[shaded], hit_index[candidates], distances[shaded],
+                    self._frequent_occluders.get(light, ()), stats.intersection_tests if stats is not None else None
+                )
+                occluders[candidates, light] = light_occluders
+                self._frequent_occluders[light] = frequent_occluders(light_occluders)
+
+                lit = light_occluders < 0
+                luminance[candidates[lit]] += contributions[shaded[lit]]
+                if stats is not None:
+                    shadow_rays += len(candidates)
+
+        if stats is not None:
+            stats.shadow_rays += shadow_rays
+            stats.saturated_shadow_rays += saturated
+            stats.culled_shadow_rays += len(hits) * len(compiled.light_powers) - shadow_rays - saturated
+            stats.stage_seconds['shadow'] += time() - start
+
+        if record is not None:
+            record.add(pixels, origins, directions, t, all_hit_index, hits, shadow_origins, occluders)
+
+        # gather from the material table through each hit shape's material index
+        materials = compiled.shape_materials[hit_index]
+        object_colours = compiled.material_colours[materials] * numpy.minimum(luminance, 1.0)[:, None]
+
+        return hits, hit_points, normals, object_colours, compiled.material_reflectance[materials]
+
+    def render(self, subsamples=0, update_callback=None, vectorized=False, quantised=False, cancel=None):
+        # type: (int, Optional[Callable], bool, bool, Optional[threading.Event]) -> numpy.ndarray
         """
         Raytrace the scene
         :param subsamples: Number of samples per pixel.  Significantly increases render times for large values
         :param update_callback: Callback to provide progress information to
+        :param vectorized: trace whole batches of rays as numpy arrays rather than one ray at a time
+        :param quantised: return 8 bit colours, each part of the image is quantised as soon as it's traced so no
+        floating point copy of the whole image is ever held
+        :param cancel: threading.Event checked between columns, RenderCancelled is raised once it's set
         :return: numpy.ndarray of pixels
         """
+        if vectorized:
+            return self._render_vectorized(subsamples, update_callback, quantised, cancel)
+
+        start = time()
 
         # make camera local so we're not doing millions of attribute look ups for no reason
         camera = self.scene.camera
-        aspect = float(camera.width) / camera.height
-        screen_space = (-1.0, -1.0 / aspect + 0.25, 1.0, 1.0 / aspect + 0.25)
+        image = numpy.zeros((camera.height, camera.width, 3), dtype=numpy.uint8 if quantised else float)
+        column = numpy.zeros((camera.height, 3))
 
-        image = numpy.zeros((camera.height, camera.width, 3))
+        # multiple samples per pixel averaged for antialiasing - requires at least 12 samples
+        # to look decent - multiplies render time.  Each sample is jittered within its own cell of
+        # a grid over the pixel so the samples can't clump together
+        inv_subsample = 1.0 / subsamples if subsamples else 1.0
+        rows = numpy.arange(camera.height)
 
-        # we need pixel size scaled to screen space for subsampling
-        if subsamples:
-            inv_subsample = 1.0 / subsamples
-            screen_x = float(screen_space[2] - screen_space[0]) / camera.width * 2.0
-            screen_y = float(screen_space[3] - screen_space[1]) / camera.height * 2.0
-
-        for x_index, x in enumerate(numpy.linspace(screen_space[0], screen_space[2], camera.width)):
+        for x_index in range(camera.width):
+            check_cancelled(cancel)
             if update_callback and x_index % 10 == 0:
                 update_callback('{0}% complete'.format(100.0 * x_index / camera.width))
 
-            for y_index, y in enumerate(numpy.linspace(screen_space[1], screen_space[3], camera.height)):
+            columns = numpy.full(camera.height, x_index, dtype=int)
+            for y_index, direction in enumerate(self.rays.pixel_directions(camera, rows, columns, subsamples).tolist()):
                 # single sample per pixel through top left of pixel
                 if subsamples == 0:
-                    screen_coords = Vector(x, y, 0.0)
-                    camera_to_screen = (camera.position - screen_coords).normal
-                    ray = Ray(camera.position, camera_to_screen)
-                    colour = self.trace(ray)
-
-                # multiple samples per pixel averaged for antialiasing - requires at least 12 samples
-                # to look decent - multiplies render time
+                    colour = self.trace(Ray(camera.position, Vector(*direction), normalised=True))
                 else:
                     colour = Vector(0.0, 0.0, 0.0)
-                    for sample in range(subsamples):
-                        screen_coords = Vector(x + random() * screen_x, y + random() * screen_y, 0.0)
-                        camera_to_screen = (camera.position - screen_coords).normal
-                        ray = Ray(camera.position, camera_to_screen)
-                        colour = colour + self.trace(ray) * inv_subsample
+                    for sample_direction in direction:
+                        colour += self.trace(Ray(camera.position, Vector(*sample_direction), normalised=True)) * inv_subsample
+
+                column[y_index, :] = numpy.clip(colour.data, 0, 1)
+
+            image[:, x_index, :] = quantise(column) if quantised else column
+
+        if self.stats is not None:
+            self.stats.elapsed += time() - start
+
+        return image
+
+    def _render_vectorized(self, subsamples, update_callback, quantised=False, cancel=None):
+        # type: (int, Optional[Callable], bool, Optional[threading.Event]) -> numpy.ndarray
+        """
+        Raytrace the scene tracing a band of columns at a time with trace_batch
+        :param subsamples: Number of samples per pixel
+        :param update_callback: Callback to provide progress information to
+        :param quantised: quantise each band to 8 bit colours as it's traced
+        :param cancel: threading.Event checked between bands
+        :return: numpy.ndarray of pixels
+        """
+        camera = self.scene.camera
+        image = numpy.zeros((camera.height, camera.width, 3), dtype=numpy.uint8 if quantised else camera.dtype)
+
+        for x_start in range(0, camera.width, 10):
+            check_cancelled(cancel)
+            if update_callback:
+                update_callback('{0}% complete'.format(100.0 * x_start / camera.width))
+
+            columns = slice(x_start, min(x_start + 10, camera.width))
+            rows = numpy.arange(camera.height).repeat(columns.stop - columns.start)
+            band_columns = numpy.tile(numpy.arange(columns.start, columns.stop), camera.height)
+            band = self.render_pixels(
+                rows, band_columns, subsamples, directions=self.rays.pixel_directions(camera, rows, band_columns, subsamples)
+            ).reshape(camera.height, -1, 3)
+            image[:, columns, :] = quantise(band) if quantised else band
+
+        return image
+
+    def render_tile(self, columns, rows, subsamples=0, jitter=None): # type: (slice, slice, int, Optional[numpy.ndarray]) -> numpy.ndarray
+        """
+        Raytrace a rectangular region of the image
+        :param columns: slice of image columns to render
+        :param rows: slice of image rows to render
+        :param subsamples: Number of samples per pixel
+        :param jitter: (rows, columns, subsamples, 2) subsample offsets for the region, defaults to the fixed pattern
+        from rays.jitter_pattern
+        :return: (rows, columns, 3) numpy.ndarray of pixels
+        """
+        camera = self.scene.camera
+        row_indices, column_indices = numpy.meshgrid(
+            numpy.arange(camera.height)[rows], numpy.arange(camera.width)[columns], indexing='ij'
+        )
+        colour = self.render_pixels(
+            row_indices.ravel(), column_indices.ravel(), subsamples,
+            jitter.reshape((-1,) + jitter.shape[2:]) if jitter is not None else None
+        )
+        return colour.reshape(row_indices.shape + (3,))
+
+    def render_pixels(self, rows, columns, subsamples=0, jitter=None, record=None, directions=None):
+        # type: (numpy.ndarray, numpy.ndarray, int, Optional[numpy.ndarray], Optional[TraceRecord], Optional[numpy.ndarray]) -> numpy.ndarray
+        """
+        Raytrace an arbitrary set of pixels
+        :param rows: (N,) array of pixel row indices
+        :param columns: (N,) array of pixel column indices
+        :param subsamples: Number of samples per pixel
+        :param jitter: (N, subsamples, 2) subsample offsets for the pixels, see stratified_jitter
+        :param record: optional TraceRecord to store per ray metadata in, see trace_batch
+        :param directions: (N, 3) or with subsamples (N, subsamples, 3) primary ray directions for the pixels from
+        rays, in place of jitter.  Without either the directions come from rays, jittered by the fixed
+        rays.jitter_pattern.
+        :return: (N, 3) numpy.ndarray of pixels
+        """
+        start = time()
+        pixels = rows * self.scene.camera.width + columns if record is not None else None
+        camera = self.scene.camera
+
+        if directions is None:
+            directions = (primary_directions(camera, rows, columns, jitter) if jitter is not None
+                          else self.rays.pixel_directions(camera, rows, columns, subsamples))
+
+        if subsamples == 0:
+            colour = self._trace_primary(directions, pixels, record)
+        else:
+            inv_subsample = 1.0 / subsamples
+            colour = numpy.zeros((len(rows), 3), dtype=camera.dtype)
+            for sample in range(subsamples):
+                colour += self._trace_primary(directions[:, sample], pixels, record) * inv_subsample
+
+        if self.stats is not None:
+            self.stats.elapsed += time() - start
+
+        return numpy.clip(colour, 0, 1)
+
+    def render_progressive(self, subsamples=0, coarsest=8, update_callback=None): # type: (int, int, Optional[Callable]) -> Iterator[numpy.ndarray]
+        """
+        Raytrace the scene in interleaved passes, starting with one pixel in every coarsest x coarsest block and
+        halving the spacing each pass until every pixel has been traced.  Each pass only traces the pixels that
+        earlier passes skipped.
+        :param subsamples: Number of samples per pixel
+        :param coarsest: pixel spacing of the first pass, a power of two
+        :param update_callback: Callback to provide progress information to
+        :return: iterator of full size preview images, pixels not yet traced are filled from their block's
+        traced pixel.  The last image is the finished render.
+        """
+        camera = self.scene.camera
+        traced = numpy.zeros((camera.height, camera.width, 3))
+
+        passes = list(progressive_passes(camera.width, camera.height, coarsest))
+        for index, (stride, rows, columns) in enumerate(passes):
+            if update_callback:
+                update_callback('Rendering pass {0} of {1}'.format(index + 1, len(passes)))
+            traced[rows, columns, :] = self.render_pixels(
+                rows, columns, subsamples, directions=self.rays.pixel_directions(camera, rows, columns, subsamples)
+            )
+            yield fill_preview(traced, stride)
+
+    def render_adaptive(self, subsamples=12, threshold=0.05, update_callback=None): # type: (int, float, Optional[Callable]) -> numpy.ndarray
+        """
+        Raytrace the scene with one ray per pixel, then antialias only the pixels that differ from a neighbour
+        by more than threshold in any colour channel.  Flat regions cost a single ray per pixel while edges get
+        the full number of stratified samples.
+        :param subsamples: Number of samples for pixels that need antialiasing
+        :param threshold: colour difference to a neighbouring pixel above which a pixel is antialiased
+        :param update_callback: Callback to provide progress information to
+        :return: numpy.ndarray of pixels
+        """
+        camera = self.scene.camera
+        row_indices, column_indices = numpy.meshgrid(numpy.arange(camera.height), numpy.arange(camera.width), indexing='ij')
+
+        # the single sample goes through the centre of the area the subsamples are spread over, so flat regions
+        # come out the same as the average of the subsamples would
+        if update_callback:
+            update_callback('Rendering single sample pass')
+        centre = numpy.full((row_indices.size, 1, 2), 0.5)
+        image = self.render_pixels(row_indices.ravel(), column_indices.ravel(), 1, centre)
+        image = image.reshape(camera.height, camera.width, 3)
+
+        rows, columns = numpy.nonzero(edge_pixels(image, threshold))
+        if update_callback:
+            update_callback('Antialiasing {0} of {1} pixels'.format(len(rows), image.shape[0] * image.shape[1]))
+        if len(rows):
+            image[rows, columns, :] = self.render_pixels(rows, columns, subsamples, stratified_jitter(len(rows), subsamples))
+
+        return image
+
+    def _trace_primary(self, directions, pixels=None, record=None):
+        # type: (numpy.ndarray, Optional[numpy.ndarray], Optional[TraceRecord]) -> numpy.ndarray
+        """
+        Trace primary rays from the camera
+        :param directions: (N, 3) array of normalised ray directions
+        :param pixels: (N,) array of the pixel each ray belongs to, required when recording
+        :param record: optional TraceRecord to store per ray metadata in
+        :return: (N, 3) array of colours
+        """
+        position = self.scene.camera.position.data
+        return self.trace_batch(numpy.tile(position, (len(directions), 1)), directions, 0, pixels, record)
+
+
+class RenderCancelled(Exception):
+    """
+    Raised from a render whose cancel event was set part way through
+    """
+
+
+def check_cancelled(cancel): # type: (Optional[threading.Event]) -> None
+    """
+    Stop a render between units of work once it has been cancelled
+    :param cancel: threading.Event set to cancel the render, or None if it can't be cancelled
+    """
+    if cancel is not None and cancel.is_set():
+        raise RenderCancelled()
+
+
+def frequent_occluders(occluders, count=4): # type: (numpy.ndarray, int) -> numpy.ndarray
+    """
+    Shapes that blocked the most shadow rays
+    :param occluders: array of shape indices from an any hit query, -1 where nothing blocked the ray
+    :param count: maximum number of shapes to return
+    :return: array of up to count shape indices, most frequent first
+    """
+    counts = numpy.bincount(occluders[occluders >= 0])
+    order = numpy.argsort(counts, kind='mergesort')[::-1][:count]
+    return order[counts[order] > 0]
+
+
+def progressive_passes(width, height, coarsest=8): # type: (int, int, int) -> Iterator[Tuple[int, numpy.ndarray, numpy.ndarray]]
+    """
+    Split an image into interleaved passes of halving pixel spacing, each pixel appearing in exactly one pass
+    :param width: image width
+    :param height: image height
+    :param coarsest: pixel spacing of the first pass, a power of two
+    :return: iterator of (stride, rows, columns) with the row and column indices of the pixels new to each pass
+    """
+    row_indices, column_indices = numpy.meshgrid(numpy.arange(height), numpy.arange(width), indexing='ij')
+    stride = coarsest
+    previous = None
+    while stride >= 1:
+        on_grid = (row_indices % stride == 0) & (column_indices % stride == 0)
+        new = on_grid if previous is None else on_grid & ~previous
+        yield stride, row_indices[new], column_indices[new]
+        previous = on_grid
+        stride //= 2
+
+
+def fill_preview(traced, stride): # type: (numpy.ndarray, int) -> numpy.ndarray
+    """
+    Fill each stride x stride block of an image with the colour of its top left pixel
+    :param traced: image where at least every pixel on the stride grid has been traced
+    :param stride: pixel spacing of the traced grid
+    :return: new preview image the same size as traced
+    """
+    if stride == 1:
+        return traced.copy()
+    height, width = traced.shape[:2]
+    blocks = traced[::stride, ::stride]
+    return blocks.repeat(stride, axis=0).repeat(stride, axis=1)[:height, :width]
+
+
+def stratified_jitter(count, subsamples): # type: (int, int) -> numpy.ndarray
+    """
+    Subsample offsets within a pixel where sample k is placed randomly within cell k of a grid over the pixel.
+    Random numbers are drawn pixel by pixel, sample by sample, x then y like the per pixel loop in render.
+    :param count: number of pixels
+    :param subsamples: Number of samples per pixel
+    :return: (count, subsamples, 2) array of offsets in [0, 1)
+    """
+    strata_x, strata_y = strata(subsamples)
+    sample = numpy.arange(subsamples)
+    cells = numpy.column_stack((sample % strata_x, sample // strata_x))
+    uniform = numpy.array([random() for _ in range(count * subsamples * 2)]).reshape(count, subsamples, 2)
+    return (cells + uniform) / numpy.array([strata_x, strata_y], dtype=float)
 
-                image[y_index, x_index, :] = numpy.clip(colour.data, 0, 1)
 
-        return image
\ No newline at end of file
+def edge_pixels(image, threshold): # type: (numpy.ndarray, float) -> numpy.ndarray
+    """
+    Find pixels whose colour differs from a horizontal or vertical neighbour by more than threshold
+    :param image: (height, width, 3) image
+    :param threshold: colour difference in any channel that marks an edge
+    :return: (height, width) boolean array, True for pixels on either side of an edge
+    """
+    edges = numpy.zeros(image.shape[:2], dtype=bool)
+    vertical = (numpy.abs(numpy.diff(image, axis=0)) > threshold).any(axis=2)
+    horizontal = (numpy.abs(numpy.diff(image, axis=1)) > threshold).any(axis=2)
+    edges[1:] |= vertical
+    edges[:-1] |= vertical
+    edges[:, 1:] |= horizontal
+    edges[:, :-1] |= horizontal
+    return edges
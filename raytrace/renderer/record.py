@@ -0,0 +1,128 @@
+from typing import List, Optional
+
+import numpy
+
+from shared import SharedArrays, SHARED_DIRECTORY
+
+# TraceRecord.occluders value for a light culled without a shadow ray, see Camera.min_light
+CULLED = -2
+
+# names of the per ray fields in the order they're stored
+FIELDS = ('pixels', 'origins', 'directions', 't', 'hit_index', 'shadow_origins', 'occluders')
+
+
+class TraceRecord(object):
+
+    def __init__(self, light_count): # type: (int) -> None
+        """
+        Per ray metadata kept from a batch trace so later renders can work out which pixels a scene edit affects.
+        One entry is stored for every primary and reflected ray: the pixel it belongs to, the ray itself, its
+        closest hit and, for rays that hit something, the shadow ray origin and the shape that blocked each light.
+        :param light_count: number of lights in the scene being traced
+        """
+        self.light_count = light_count
+        self._chunks = []
+
+    def add(self, pixels, origins, directions, t, hit_index, hits=None, shadow_origins=None, occluders=None):
+        # type: (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, Optional[numpy.ndarray], Optional[numpy.ndarray], Optional[numpy.ndarray]) -> None
+        """
+        Store a batch of traced rays
+        :param pixels: (N,) pixel index of each ray, row * width + column
+        :param origins: (N, 3) ray origins
+        :param directions: (N, 3) ray directions
+        :param t: (N,) distance to the closest hit, numpy.inf for misses
+        :param hit_index: (N,) index of the shape hit, -1 for misses
+        :param hits: (H,) indices of the rays that hit something
+        :param shadow_origins: (H, 3) origins of the shadow rays cast from the hits
+        :param occluders: (H, lights) index of the shape blocking each light, -1 where the light is visible and
+        CULLED where no shadow ray was cast
+        """
+        full_shadow_origins = numpy.full((len(pixels), 3), numpy.nan)
+        full_occluders = numpy.full((len(pixels), self.light_count), -1, dtype=int)
+        if hits is not None:
+            full_shadow_origins[hits] = shadow_origins
+            full_occluders[hits] = occluders
+        self._chunks.append([pixels, origins, directions, t, hit_index, full_shadow_origins, full_occluders])
+
+    def _collapse(self): # type: () -> List[numpy.ndarray]
+        if len(self._chunks) != 1:
+            if self._chunks:
+                self._chunks = [[numpy.concatenate(field) for field in zip(*self._chunks)]]
+            else:
+                self._chunks = [[numpy.zeros(0, dtype=int), numpy.zeros((0, 3)), numpy.zeros((0, 3)), numpy.zeros(0),
+                                 numpy.zeros(0, dtype=int), numpy.zeros((0, 3)),
+                                 numpy.zeros((0, self.light_count), dtype=int)]]
+        return self._chunks[0]
+
+    @property # type: numpy.ndarray
+    def pixels(self):
+        return self._collapse()[0]
+
+    @property # type: numpy.ndarray
+    def origins(self):
+        return self._collapse()[1]
+
+    @property # type: numpy.ndarray
+    def directions(self):
+        return self._collapse()[2]
+
+    @property # type: numpy.ndarray
+    def t(self):
+        return self._collapse()[3]
+
+    @property # type: numpy.ndarray
+    def hit_index(self):
+        return self._collapse()[4]
+
+    @property # type: numpy.ndarray
+    def shadow_origins(self):
+        return self._collapse()[5]
+
+    @property # type: numpy.ndarray
+    def occluders(self):
+        return self._collapse()[6]
+
+    def discard(self, pixels): # type: (numpy.ndarray) -> None
+        """
+        Drop every entry belonging to the given pixels
+        :param pixels: array of pixel indices
+        """
+        keep = ~numpy.in1d(self.pixels, pixels)
+        self._chunks = [[field[keep] for field in self._collapse()]]
+
+    def remap(self, old_to_new): # type: (numpy.ndarray) -> None
+        """
+        Renumber shape indices after the scene's shape list has changed
+        :param old_to_new: array mapping old shape index to new shape index
+        """
+        fields = self._collapse()
+        for position in (4, 6):
+            indices = fields[position]
+            fields[position] = numpy.where(indices >= 0, old_to_new[numpy.maximum(indices, 0)], indices)
+
+    def extend(self, other): # type: (TraceRecord) -> None
+        """
+        Append the entries of another record of the same scene
+        :param other: TraceRecord to take entries from
+        """
+        self._chunks.extend(other._chunks)
+
+    def share(self, directory=SHARED_DIRECTORY): # type: (Optional[str]) -> SharedArrays
+        """
+        Copy the entries into shared memory, so a worker can hand them back without pickling them, see attach
+        :param directory: directory to create the file in, see SharedArrays
+        :return: SharedArrays holding the entries
+        """
+        return SharedArrays(dict(zip(FIELDS, self._collapse())), directory)
+
+    @classmethod
+    def attach(cls, shared): # type: (SharedArrays) -> TraceRecord
+        """
+        A record whose entries are those in shared memory
+        :param shared: SharedArrays from share
+        :return: TraceRecord
+        """
+        arrays = shared.arrays
+        record = cls(arrays['occluders'].shape[1])
+        record._chunks = [[arrays[name] for name in FIELDS]]
+        return record
@@ -1,19 +1,100 @@
-from typing import List
+from typing import List, Optional, Tuple
+
+import numpy
 
 from mathlib import Vector
 from shapes import Shape
-from light import Light
+from light import Light, LightIndex
+from material import MaterialTable
 from camera import Camera
+from bvh import BVH
+from compiled import CompiledScene
 
 
 class Scene(object):
-    def __init__(self, shapes, lights, camera): # type: (List[Shape], List[Light], Camera) -> None
+    def __init__(self, shapes, lights, camera, materials=None):
+        # type: (List[Shape], List[Light], Camera, Optional[MaterialTable]) -> None
         """
         Scene initialisation
         :param shapes: list of Shape instances in the scene
         :param lights: list of Light instances in the scene
         :param camera: Camera instance defining the camera
+        :param materials: MaterialTable the shapes' materials were interned in, see CompiledScene
         """
         self.shapes = shapes
         self.lights = lights
         self.camera = camera
+        self.materials = materials
+        self._bvh = None
+        self._compiled = None
+        self._light_index = None
+        # precision -> (CompiledScene, BVH) in precisions other than float64
+        self._lowered = {}
+
+    def key(self): # type: () -> tuple
+        """
+        Description of the scene's content, equal for scenes that render identically
+        :return: tuple of camera, shape and light keys
+        """
+        return (self.camera.key(),
+                tuple(shape.key() for shape in self.shapes),
+                tuple(light.key() for light in self.lights))
+
+    @property # type: BVH
+    def bvh(self):
+        """
+        Acceleration structure over the scene's shapes, built on first use
+        :return: BVH of shapes
+        """
+        if self._bvh is None:
+            self._bvh = BVH(self.shapes, compiled=self.compiled)
+        return self._bvh
+
+    @property # type: CompiledScene
+    def compiled(self):
+        """
+        The scene's shapes, materials and lights lowered to arrays, compiled on first use
+        :return: CompiledScene
+        """
+        if self._compiled is None:
+            self._compiled = CompiledScene(self.shapes, self.lights, self.materials)
+        return self._compiled
+
+    @property # type: LightIndex
+    def light_index(self):
+        """
+        Clusters of the scene's lights for culling and ordering them while shading, built on first use
+        :return: LightIndex
+        """
+        if self._light_index is None:
+            compiled = self.compiled
+            self._light_index = LightIndex(compiled.light_positions, compiled.light_powers)
+        return self._light_index
+
+    def lowered(self, precision): # type: (str) -> Tuple[CompiledScene, BVH]
+        """
+        The compiled arrays and a BVH over them in a floating point type, see Camera.precision.  Built on first use
+        and shared like the float64 ones.
+        :param precision: name of the floating point type
+        :return: tuple of CompiledScene and BVH
+        """
+        if precision == 'float64':
+            return self.compiled, self.bvh
+        if precision not in self._lowered:
+            compiled = self.compiled.astype(numpy.dtype(precision))
+            self._lowered[precision] = compiled, BVH(self.shapes, compiled=compiled)
+        return self._lowered[precision]
+
+    def with_camera(self, camera): # type: (Camera) -> Scene
+        """
+        The same shapes and lights seen from another camera.  The BVH, compiled arrays and light index are built
+        here if need be and shared, so they're only built once however many cameras look at the scene.
+        :param camera: Camera for the new scene
+        :return: Scene
+        """
+        scene = Scene(self.shapes, self.lights, camera, self.materials)
+        scene._bvh = self.bvh
+        scene._compiled = self.compiled
+        scene._light_index = self.light_index
+        scene._lowered = self._lowered
+        return scene
@@ -1,4 +1,6 @@
 from abc import ABCMeta, abstractmethod
+from typing import Optional, Tuple
+import math
 
 import numpy
 
@@ -30,6 +32,40 @@ class Shape(object):
         """
         pass
 
+    @abstractmethod
+    def key(self): # type: () -> tuple
+        """
+        Description of the shape's content, equal for shapes that render identically
+        :return: tuple of the shape type, geometry and material key
+        """
+        pass
+
+    def bounds(self): # type: () -> Optional[Tuple[numpy.ndarray, numpy.ndarray]]
+        """
+        Axis aligned bounding box of the shape
+        :return: tuple of lower and upper corner arrays, or None for shapes that are unbounded
+        """
+        return None
+
+    @abstractmethod
+    def intersect_batch(self, origins, directions): # type: (numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+        """
+        Intersect many rays with shape at once
+        :param origins: (N, 3) array of ray origins
+        :param directions: (N, 3) array of normalised ray directions
+        :return: (N,) array of distances to the intersection points, numpy.inf where rays miss
+        """
+        pass
+
+    @abstractmethod
+    def normal_batch(self, positions): # type: (numpy.ndarray) -> numpy.ndarray
+        """
+        Get the normals at many positions at once
+        :param positions: (N, 3) array of intersection points
+        :return: (N, 3) array of surface normals
+        """
+        pass
+
 
 class Sphere(Shape):
 
@@ -47,18 +83,26 @@ class Sphere(Shape):
         self.radius = radius
 
     def intersect(self, ray): # type: (Ray) -> float
-        origin_to_centre = ray.origin - self.centre
-        a = ray.direction.dot(ray.direction)
-        b = 2 * ray.direction.dot(origin_to_centre)
-        c = origin_to_centre.dot(origin_to_centre) - self.radius * self.radius
+        direction = ray.direction
+        centre = self.centre
+        ox = ray.origin.x - centre.x
+        oy = ray.origin.y - centre.y
+        oz = ray.origin.z - centre.z
+        a = direction.x * direction.x + direction.y * direction.y + direction.z * direction.z
+        b = 2 * (direction.x * ox + direction.y * oy + direction.z * oz)
+        c = ox * ox + oy * oy + oz * oz - self.radius * self.radius
 
         discriminant = b * b - 4 * a * c
         # no real solutions - we didn't intersect the sphere
         if discriminant <= 0:
             return numpy.inf
-        discriminantSqrt = numpy.sqrt(discriminant)
+        discriminantSqrt = math.sqrt(discriminant)
 
         q = (-b - discriminantSqrt) / 2.0 if b < 0 else (-b + discriminantSqrt) / 2.0
+        # q is only zero when the ray starts exactly on the surface, where one root is zero and c / q below would
+        # raise ZeroDivisionError, so the hit is where the ray starts
+        if q == 0:
+            return 0.0
         t0 = q / a
         t1 = c / q
         t0, t1 = min(t0, t1), max(t0, t1)
@@ -70,7 +114,43 @@ class Sphere(Shape):
         return numpy.inf
 
     def normal(self, position): # type: (Vector) -> Vector
-        return Vector(position.data - self.centre.data).normal
+        return (position - self.centre).normalise()
+
+    def key(self): # type: () -> tuple
+        return 'sphere', self.centre.x, self.centre.y, self.centre.z, self.radius, self.material.key()
+
+    def bounds(self): # type: () -> Tuple[numpy.ndarray, numpy.ndarray]
+        return self.centre.data - self.radius, self.centre.data + self.radius
+
+    def intersect_batch(self, origins, directions): # type: (numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+        origin_to_centre = origins - self.centre.data
+        a = (directions * directions).sum(axis=1)
+        b = 2 * (directions * origin_to_centre).sum(axis=1)
+        c = (origin_to_centre * origin_to_centre).sum(axis=1) - self.radius * self.radius
+
+        distances = numpy.full(len(origins), numpy.inf)
+        discriminant = b * b - 4 * a * c
+        # only solve for rays with real solutions
+        hits = numpy.flatnonzero(discriminant > 0)
+        if not len(hits):
+            return distances
+
+        a, b, c = a[hits], b[hits], c[hits]
+        discriminant_sqrt = numpy.sqrt(discriminant[hits])
+        q = numpy.where(b < 0, (-b - discriminant_sqrt) / 2.0, (-b + discriminant_sqrt) / 2.0)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            t0 = q / a
+            t1 = c / q
+        # ordered the same way as the builtin min/max used by intersect so nan edge cases agree
+        t0, t1 = numpy.where(t1 < t0, t1, t0), numpy.where(t1 > t0, t1, t0)
+
+        # closest intersection that is in front of the ray origin
+        distances[hits] = numpy.where(t1 >= 0, numpy.where(t0 < 0, t1, t0), numpy.inf)
+        return distances
+
+    def normal_batch(self, positions): # type: (numpy.ndarray) -> numpy.ndarray
+        centre_to_position = positions - self.centre.data
+        return centre_to_position / numpy.sqrt((centre_to_position * centre_to_position).sum(axis=1))[:, None]
 
 
 class Plane(Shape):
@@ -87,15 +167,34 @@ class Plane(Shape):
         self.up = up
 
     def intersect(self, ray): # type: (Ray) -> float
-        denominator = ray.direction.dot(self.up)
+        up = self.up
+        denominator = ray.direction.dot(up)
         if abs(denominator) < 0.0000001:
             return numpy.inf
-        # vector division is icky
-        facing = (self.position - ray.origin).dot(self.up) * (1 /  denominator)
+        origin = ray.origin
+        position = self.position
+        facing = ((position.x - origin.x) * up.x + (position.y - origin.y) * up.y +
+                  (position.z - origin.z) * up.z) / denominator
         if facing < 0:
             return numpy.inf
 
         return facing
 
     def normal(self, position): # type: (Vector) -> Vector
-        return self.up
\ No newline at end of file
+        return self.up
+
+    def key(self): # type: () -> tuple
+        return ('plane', self.position.x, self.position.y, self.position.z,
+                self.up.x, self.up.y, self.up.z, self.material.key())
+
+    def intersect_batch(self, origins, directions): # type: (numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+        denominator = directions.dot(self.up.data)
+        parallel = numpy.abs(denominator) < 0.0000001
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            facing = (self.position.data - origins).dot(self.up.data) * (1 / denominator)
+            facing[parallel | (facing < 0)] = numpy.inf
+
+        return facing
+
+    def normal_batch(self, positions): # type: (numpy.ndarray) -> numpy.ndarray
+        return numpy.tile(self.up.data, (len(positions), 1))
@@ -0,0 +1,91 @@
+from typing import Dict, List, Optional, Tuple, Union
+import os
+import tempfile
+
+import numpy
+
+# memory backed where there is one so shared arrays never touch a disk
+SHARED_DIRECTORY = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# byte alignment of each array in the file
+ALIGNMENT = 64
+
+
+class SharedArrays(object):
+
+    def __init__(self, arrays, directory=SHARED_DIRECTORY):
+        # type: (Dict[str, Union[numpy.ndarray, Tuple[tuple, numpy.dtype]]], Optional[str]) -> None
+        """
+        Named arrays laid out one after another in a memory mapped file, so worker processes map the same memory
+        rather than being sent copies and can write results straight into it.  Pickling only sends the file's path
+        and layout, which costs the same however big the arrays are.  The process that creates the arrays owns the
+        file and removes it on close, arrays already mapped stay usable.
+        :param arrays: name -> array to copy into the file, or a (shape, dtype) pair for a zeroed array
+        :param directory: directory to create the file in, the system temporary directory if None
+        """
+        self.layout = [] # type: List[Tuple[str, int, tuple, str]]
+        size = 0
+        for name, array in sorted(arrays.items()):
+            shape, dtype = (array.shape, array.dtype) if isinstance(array, numpy.ndarray) else array
+            dtype = numpy.dtype(dtype)
+            size = -(-size // ALIGNMENT) * ALIGNMENT
+            self.layout.append((name, size, tuple(shape), dtype.str))
+            size += int(numpy.prod(shape)) * dtype.itemsize
+
+        descriptor, self.path = tempfile.mkstemp(prefix='raytrace-', suffix='.shared', dir=directory)
+        try:
+            # a mapping can't be empty
+            os.ftruncate(descriptor, max(size, 1))
+        finally:
+            os.close(descriptor)
+        # only the creating process removes the file, not forked workers holding a copy of this object
+        self._owner = os.getpid()
+        self._arrays = None # type: Optional[Dict[str, numpy.ndarray]]
+
+        for name, array in arrays.items():
+            if isinstance(array, numpy.ndarray):
+                self.arrays[name][...] = array
+
+    @property # type: Dict[str, numpy.ndarray]
+    def arrays(self):
+        """
+        name -> array in the shared memory, mapped on first use
+        """
+        if self._arrays is None:
+            memory = numpy.memmap(self.path, dtype=numpy.uint8, mode='r+')
+            self._arrays = dict((name, numpy.ndarray(shape, numpy.dtype(dtype), buffer=memory, offset=offset))
+                                for name, offset, shape, dtype in self.layout)
+        return self._arrays
+
+    @property # type: int
+    def nbytes(self):
+        return os.path.getsize(self.path)
+
+    def __getstate__(self): # type: () -> dict
+        return {'path': self.path, 'layout': self.layout}
+
+    def __setstate__(self, state): # type: (dict) -> None
+        self.path = state['path']
+        self.layout = state['layout']
+        self._owner = None
+        self._arrays = None
+
+    def adopt(self): # type: () -> None
+        """
+        Take over removing the file from the process that created it, for arrays handed back by a worker
+        """
+        self._owner = os.getpid()
+
+    def close(self): # type: () -> None
+        """
+        Stop mapping the file, and remove it if this process created it
+        """
+        self._arrays = None
+        if self._owner == os.getpid() and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self): # type: () -> SharedArrays
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,91 @@
+from typing import Dict
+from collections import defaultdict
+
+
+class RenderStats(object):
+
+    def __init__(self): # type: () -> None
+        """
+        Counters and stage timings collected by an instrumented Raytracer.  Stage times are summed over every
+        call, so with several worker processes they add up to more than the elapsed wall clock time.
+        """
+        self.primary_rays = 0
+        self.shadow_rays = 0
+        # shadow rays not cast because their light was culled, too faint to matter (see Camera.min_light) or in a
+        # cluster of lights behind the surface (see LightIndex)
+        self.culled_shadow_rays = 0
+        # shadow rays not cast because the hit point was already fully lit by brighter lights
+        self.saturated_shadow_rays = 0
+        self.reflection_rays = 0
+        # reflected rays not followed because their contribution was too small, see Camera.min_weight
+        self.terminated_rays = 0
+        # shape class name -> number of ray/shape intersection tests
+        self.intersection_tests = defaultdict(int)
+        # stage name -> seconds
+        self.stage_seconds = defaultdict(float)
+        self.elapsed = 0.0
+        # name of the kernels the rays were traced with, see kernels.select
+        self.backend = None
+
+    def merge(self, other): # type: (RenderStats) -> None
+        """
+        Add the counters and stage times from another set of stats, such as a worker's
+        :param other: RenderStats to add
+        """
+        self.primary_rays += other.primary_rays
+        self.shadow_rays += other.shadow_rays
+        self.culled_shadow_rays += other.culled_shadow_rays
+        self.saturated_shadow_rays += other.saturated_shadow_rays
+        self.reflection_rays += other.reflection_rays
+        self.terminated_rays += other.terminated_rays
+        for name, count in other.intersection_tests.items():
+            self.intersection_tests[name] += count
+        for name, seconds in other.stage_seconds.items():
+            self.stage_seconds[name] += seconds
+        self.backend = self.backend or other.backend
+
+    @property # type: int
+    def rays(self):
+        return self.primary_rays + self.shadow_rays + self.reflection_rays
+
+    @property # type: float
+    def rays_per_second(self):
+        return self.rays / self.elapsed if self.elapsed else 0.0
+
+    @property # type: float
+    def average_reflection_depth(self):
+        """
+        Mean number of reflection bounces followed per primary ray
+        """
+        return float(self.reflection_rays) / self.primary_rays if self.primary_rays else 0.0
+
+    def as_dict(self): # type: () -> Dict[str, object]
+        return {
+            'primary_rays': self.primary_rays,
+            'shadow_rays': self.shadow_rays,
+            'culled_shadow_rays': self.culled_shadow_rays,
+            'saturated_shadow_rays': self.saturated_shadow_rays,
+            'reflection_rays': self.reflection_rays,
+            'terminated_rays': self.terminated_rays,
+            'rays': self.rays,
+            'rays_per_second': self.rays_per_second,
+            'average_reflection_depth': self.average_reflection_depth,
+            'intersection_tests': dict(self.intersection_tests),
+            'stage_seconds': dict(self.stage_seconds),
+            'elapsed': self.elapsed,
+            'backend': self.backend,
+        }
+
+    def summary(self): # type: () -> str
+        """
+        One line description for progress messages
+        """
+        stages = ', '.join('{0} {1:.2f}s'.format(name, seconds) for name, seconds in sorted(self.stage_seconds.items()))
+        tests = ', '.join('{0} {1}'.format(name, count) for name, count in sorted(self.intersection_tests.items()))
+        return ('{0} rays ({1} primary, {2} shadow, {3} reflection, {4} terminated early) in {5:.2f}s, {6:.0f} rays/s, '
+                'average reflection depth {7:.2f}; shadow rays culled: {8}, skipped as saturated: {9}, of {10}; '
+                'intersection tests: {11}; stages: {12}; kernels: {13}').format(
+            self.rays, self.primary_rays, self.shadow_rays, self.reflection_rays, self.terminated_rays, self.elapsed,
+            self.rays_per_second, self.average_reflection_depth, self.culled_shadow_rays, self.saturated_shadow_rays,
+            self.shadow_rays + self.culled_shadow_rays + self.saturated_shadow_rays, tests, stages,
+            self.backend or 'none')
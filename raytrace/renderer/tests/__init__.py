@@ -1,2 +1,19 @@
 from mathlib_tests import *
-from intersection_tests import *
\ No newline at end of file
+from intersection_tests import *
+from raytracer_tests import *
+from bvh_tests import *
+from cache_tests import *
+from incremental_tests import *
+from benchmark_tests import *
+from stats_tests import *
+from png_tests import *
+from upload_tests import *
+from arrays_tests import *
+from compiled_tests import *
+from animation_tests import *
+from rays_tests import *
+from material_tests import *
+from kernels_tests import *
+from jobs_tests import *
+from light_tests import *
+from shared_tests import *
@@ -0,0 +1,65 @@
+import unittest
+import shutil
+import tempfile
+import os
+
+from ..mathlib import Vector
+from ..camera import Camera
+from ..raytracer import Raytracer
+from ..animation import CameraPath, Animation
+from ..png import quantise
+from raytracer_tests import demo_scene
+from png_tests import read_png
+
+
+class CameraPathTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path = CameraPath([(2.0, Vector(1.0, 0.0, -0.5)), (0.0, Vector(-1.0, 0.0, -0.5)),
+                                (3.0, Vector(1.0, 1.0, -0.5))])
+
+    def test_interpolates_between_keyframes(self):
+        self.assertEqual(self.path.position(1.0).data.tolist(), [0.0, 0.0, -0.5])
+        self.assertEqual(self.path.position(2.5).data.tolist(), [1.0, 0.5, -0.5])
+
+    def test_held_outside_path(self):
+        self.assertEqual(self.path.position(-1.0).data.tolist(), [-1.0, 0.0, -0.5])
+        self.assertEqual(self.path.position(10.0).data.tolist(), [1.0, 1.0, -0.5])
+
+    def test_positions_span_path(self):
+        positions = self.path.positions(4)
+        self.assertEqual([position.x for position in positions], [-1.0, 0.0, 1.0, 1.0])
+        self.assertEqual(positions[-1].y, 1.0)
+        self.assertEqual(len(CameraPath([(0.0, Vector(0.0, 0.0, 0.0))]).positions(1)), 1)
+
+    def test_needs_keyframes(self):
+        self.assertRaises(ValueError, CameraPath, [])
+
+
+class AnimationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_frames_match_stills(self):
+        scene = demo_scene(16, 12)
+        camera_path = CameraPath([(0.0, Vector(-0.25, 0.0, -0.5)), (1.0, Vector(0.25, 0.25, -0.25))])
+        completed = []
+        animation = Animation(scene, camera_path, 3, workers=2, instrument=True)
+        paths = animation.render(os.path.join(self.directory, 'frame_{0:04d}.png'),
+                                 frame_callback=lambda frame, _: completed.append(frame))
+
+        self.assertEqual(map(os.path.basename, paths),
+                         ['frame_0000.png', 'frame_0001.png', 'frame_0002.png'])
+        self.assertEqual(sorted(completed), [0, 1, 2])
+        self.assertGreater(animation.frames_per_minute, 0)
+        self.assertEqual(animation.stats.primary_rays, 3 * 16 * 12)
+
+        for path, position in zip(paths, camera_path.positions(3)):
+            camera = Camera(position.x, position.y, position.z, 4, 16, 12)
+            with open(path, 'rb') as image:
+                self.assertEqual(read_png(image.read()).tolist(),
+                                 quantise(Raytracer(scene.with_camera(camera)).render(vectorized=True)).tolist())
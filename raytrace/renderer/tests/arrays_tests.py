@@ -0,0 +1,63 @@
+import unittest
+
+import numpy
+
+from ..arrays import SceneArrays
+from ..camera import Camera
+from ..scene import Scene
+from ..raytracer import Raytracer
+from raytracer_tests import demo_scene
+
+MATERIALS = [('red', 0.8, 0.1, 0.1, 0.25), ('bright', 1.5, 0.9, 0.1, 0.25)]
+SPHERES = [(-0.5, 0.0, -2.0, 0.75, 'red'), (1.0, 0.0, -2.0, -0.5, 'bright'), (0.0, 1.0, -3.0, 0.5, 'red')]
+LIGHTS = [(0.0, 2.0, -2.0, 0.75), (0.0, 0.5, -1.0, 0.75)]
+
+
+class SceneArraysTests(unittest.TestCase):
+
+    def test_from_rows(self):
+        arrays = SceneArrays.from_rows(MATERIALS, SPHERES, LIGHTS)
+        self.assertEqual(arrays.material_names, ['red', 'bright'])
+        numpy.testing.assert_array_equal(arrays.material_colours[1], [1.0, 0.9, 0.1])
+        numpy.testing.assert_array_equal(arrays.radii, [0.75, 0.0, 0.5])
+        numpy.testing.assert_array_equal(arrays.sphere_materials, [0, 1, 0])
+        numpy.testing.assert_array_equal(arrays.light_powers, [0.75, 0.75])
+        self.assertEqual(arrays.centres.shape, (3, 3))
+
+    def test_empty(self):
+        arrays = SceneArrays.from_rows([], [], [])
+        self.assertEqual(arrays.centres.shape, (0, 3))
+        self.assertEqual(arrays.shapes(), [])
+        self.assertEqual(arrays.lights(), [])
+
+    def test_unknown_material(self):
+        self.assertRaises(KeyError, SceneArrays.from_rows, MATERIALS, [(0.0, 0.0, 0.0, 1.0, 'blue')], LIGHTS)
+
+    def test_objects_match_rows(self):
+        arrays = SceneArrays.from_rows(MATERIALS, SPHERES, LIGHTS)
+        shapes = arrays.shapes()
+        self.assertIs(shapes, arrays.shapes())
+        self.assertEqual([shape.key() for shape in shapes], [
+            ('sphere', -0.5, 0.0, -2.0, 0.75, (0.8, 0.1, 0.1, 0.25)),
+            ('sphere', 1.0, 0.0, -2.0, 0.0, (1.0, 0.9, 0.1, 0.25)),
+            ('sphere', 0.0, 1.0, -3.0, 0.5, (0.8, 0.1, 0.1, 0.25)),
+        ])
+        self.assertIs(shapes[0].material, shapes[2].material)
+        self.assertEqual([light.key() for light in arrays.lights()], [row for row in LIGHTS])
+
+
+class SceneWithCameraTests(unittest.TestCase):
+
+    def test_shares_bvh(self):
+        scene = demo_scene()
+        moved = scene.with_camera(Camera(0.25, 0.0, -0.5, 4, 32, 24))
+        self.assertIs(moved.bvh, scene.bvh)
+        self.assertIs(moved.shapes, scene.shapes)
+
+    def test_renders_as_new_scene(self):
+        scene = demo_scene()
+        camera = Camera(0.25, 0.0, -0.5, 4, 32, 24)
+        numpy.testing.assert_array_equal(
+            Raytracer(scene.with_camera(camera)).render(vectorized=True),
+            Raytracer(Scene(scene.shapes, scene.lights, camera)).render(vectorized=True)
+        )
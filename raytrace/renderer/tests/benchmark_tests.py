@@ -0,0 +1,30 @@
+import unittest
+
+from ..benchmarks.suite import compare, run_case
+
+
+class BenchmarkTests(unittest.TestCase):
+
+    def test_compare_flags_regressions(self):
+        baseline = [{'name': 'a', 'rays_per_second': 1000.0, 'render_seconds': 1.0, 'peak_memory_kb': 100}]
+        results = [{'name': 'a', 'rays_per_second': 800.0, 'render_seconds': 1.05, 'peak_memory_kb': 100}]
+        regressions = compare(results, baseline, tolerance=0.1)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('a rays_per_second'))
+        self.assertEqual(compare(results, baseline, tolerance=0.25), [])
+
+    def test_run_case_counts_rays(self):
+        result = run_case({'name': 'demo-small', 'scene': 'demo', 'resolution': 'small'})
+        self.assertEqual(result['primary_rays'], 160 * 120)
+        self.assertGreater(result['shadow_rays'], 0)
+        self.assertLessEqual(result['shadow_rays'], result['unculled_shadow_rays'])
+        self.assertGreater(result['rays_per_second'], 0)
+        self.assertEqual(sorted(result['stages']), ['bvh_build', 'encode', 'primary_rays', 'reflection_rays', 'shading'])
+        self.assertTrue(all(seconds > 0 for seconds in result['stages'].values()))
+
+    def test_parallel_case_counts_rays(self):
+        single = run_case({'name': 'float32', 'scene': 'demo', 'resolution': 'small', 'precision': 'float32'})
+        parallel = run_case({'name': 'float32', 'scene': 'demo', 'resolution': 'small', 'precision': 'float32'},
+                            workers=2)
+        for count in ('primary_rays', 'reflection_rays', 'shadow_rays', 'unculled_shadow_rays'):
+            self.assertEqual(parallel[count], single[count])
@@ -0,0 +1,64 @@
+import unittest
+from collections import defaultdict
+
+import numpy
+
+from ..mathlib import Vector, Ray
+from ..shapes import Plane
+from ..bvh import BVH
+from ..benchmarks.scenes import random_spheres, random_rays
+
+
+class BVHTests(unittest.TestCase):
+
+    def setUp(self):
+        self.shapes = random_spheres(200) + [Plane(Vector(0.0, -0.5, 0.0), Vector(0.0, 1.0, 0.0), None)]
+        self.bvh = BVH(self.shapes)
+        self.origins, self.directions = random_rays(500)
+
+    def brute_force(self):
+        t = numpy.full(len(self.origins), numpy.inf)
+        hit_index = numpy.full(len(self.origins), -1, dtype=int)
+        for index, shape in enumerate(self.shapes):
+            t0 = shape.intersect_batch(self.origins, self.directions)
+            closer = t0 < t
+            t[closer] = t0[closer]
+            hit_index[closer] = index
+        return t, hit_index
+
+    def test_closest_hit_batch_matches_linear_scan(self):
+        expected_t, expected_index = self.brute_force()
+        t, hit_index = self.bvh.intersect_batch(self.origins, self.directions)
+        self.assertTrue(numpy.array_equal(t, expected_t))
+        self.assertTrue(numpy.array_equal(hit_index, expected_index))
+
+    def test_closest_hit_matches_linear_scan(self):
+        expected_t, expected_index = self.brute_force()
+        for i in range(0, len(self.origins), 10):
+            t, hit_object = self.bvh.intersect(Ray(Vector(self.origins[i]), Vector(self.directions[i])))
+            self.assertAlmostEqual(t, expected_t[i])
+            if expected_index[i] >= 0:
+                self.assertIs(hit_object, self.shapes[expected_index[i]])
+            else:
+                self.assertIsNone(hit_object)
+
+    def test_any_hit_matches_closest_hit(self):
+        ignore = numpy.arange(len(self.origins)) % len(self.shapes)
+        occluded = self.bvh.occluded_batch(self.origins, self.directions, ignore)
+        for i in range(0, len(self.origins), 10):
+            ray = Ray(Vector(self.origins[i]), Vector(self.directions[i]))
+            expected = any(shape.intersect(ray) < numpy.inf
+                           for index, shape in enumerate(self.shapes) if index != ignore[i])
+            self.assertEqual(occluded[i], expected)
+            self.assertEqual(self.bvh.occluded(ray, self.shapes[ignore[i]]), expected)
+
+    def test_first_shapes_tested_once(self):
+        # rays nothing blocks, so the scalar query tests every shape it reaches just like the batch one does
+        unblocked = self.bvh.occluders_batch(self.origins, self.directions) < 0
+        origins, directions = self.origins[unblocked], self.directions[unblocked]
+        for first in (0, 57, 133, 200):
+            batch, scalar = defaultdict(int), defaultdict(int)
+            self.bvh.occluders_batch(origins, directions, first=[first], tests=batch)
+            for origin, direction in zip(origins, directions):
+                self.bvh.occluder(Ray(Vector(origin), Vector(direction)), first=self.shapes[first], tests=scalar)
+            self.assertEqual(batch, scalar)
@@ -0,0 +1,100 @@
+import unittest
+import threading
+import shutil
+import tempfile
+import os
+
+from ..cache import RenderCache, scene_key
+from raytracer_tests import demo_scene
+
+
+class SceneKeyTests(unittest.TestCase):
+
+    def test_equal_content_equal_key(self):
+        self.assertEqual(scene_key(demo_scene(), subsamples=0), scene_key(demo_scene(), subsamples=0))
+
+    def test_changes_alter_key(self):
+        key = scene_key(demo_scene(), subsamples=0)
+        self.assertNotEqual(key, scene_key(demo_scene(), subsamples=4))
+        self.assertNotEqual(key, scene_key(demo_scene(depth=3), subsamples=0))
+
+        scene = demo_scene()
+        scene.shapes[0].radius = 0.7
+        self.assertNotEqual(key, scene_key(scene, subsamples=0))
+
+        scene = demo_scene()
+        scene.lights[1].power = 0.5
+        self.assertNotEqual(key, scene_key(scene, subsamples=0))
+
+
+class RenderCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_directory = os.path.join(self.directory, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, size): # type: (str, int) -> str
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as image_file:
+            image_file.write(b'x' * size)
+        return path
+
+    def test_directory_created_on_first_use(self):
+        cache = RenderCache(self.cache_directory)
+        self.assertFalse(os.path.exists(self.cache_directory))
+        self.assertFalse(cache.get('a', os.path.join(self.directory, 'out.png')))
+        self.assertTrue(os.path.isdir(self.cache_directory))
+
+    def test_hit_and_miss(self):
+        cache = RenderCache(self.cache_directory)
+        output = os.path.join(self.directory, 'out.png')
+        self.assertFalse(cache.get('a', output))
+
+        cache.put('a', self.write('a.png', 10))
+        self.assertTrue(cache.get('a', output))
+        self.assertEqual(os.path.getsize(output), 10)
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 1)
+        self.assertEqual(cache.stats['hit_rate'], 0.5)
+
+    def test_least_recently_used_evicted(self):
+        cache = RenderCache(self.cache_directory, max_bytes=25)
+        output = os.path.join(self.directory, 'out.png')
+        cache.put('a', self.write('a.png', 10))
+        cache.put('b', self.write('b.png', 10))
+        cache.get('a', output)
+        cache.put('c', self.write('c.png', 10))
+
+        self.assertTrue(cache.get('a', output))
+        self.assertFalse(cache.get('b', output))
+        self.assertTrue(cache.get('c', output))
+        self.assertEqual(cache.stats['evictions'], 1)
+        self.assertEqual(cache.stats['bytes'], 20)
+
+    def test_threads_share_cache(self):
+        cache = RenderCache(self.cache_directory, max_bytes=45)
+        sources = [self.write('{0}.png'.format(index), 10) for index in range(8)]
+
+        def render(index):
+            output = os.path.join(self.directory, 'out{0}.png'.format(index))
+            for repeat in range(10):
+                key = str((index + repeat) % 8)
+                if not cache.get(key, output):
+                    cache.put(key, sources[int(key)])
+
+        threads = [threading.Thread(target=render, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = cache.stats
+        self.assertEqual(stats['hits'] + stats['misses'], 80)
+        self.assertEqual(stats['bytes'], 10 * len(os.listdir(self.cache_directory)))
+        self.assertLessEqual(stats['bytes'], 45)
+
+    def test_entries_survive_restart(self):
+        RenderCache(self.cache_directory).put('a', self.write('a.png', 10))
+        self.assertTrue(RenderCache(self.cache_directory).get('a', os.path.join(self.directory, 'out.png')))
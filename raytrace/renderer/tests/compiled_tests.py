@@ -0,0 +1,86 @@
+import unittest
+import pickle
+
+import numpy
+
+from ..mathlib import Vector
+from ..shapes import Sphere, Plane
+from ..material import Material
+from ..light import Light
+from ..bvh import BVH
+from ..compiled import CompiledScene, sphere_distances, plane_distances
+from bvh_tests import random_spheres, random_rays
+
+
+def material_spheres(count, seed=0): # type: (int, int) -> list
+    materials = [Material('red', 0.8, 0.1, 0.1, 0.25), Material('blue', 0.1, 0.4, 0.8, 0.0)]
+    spheres = random_spheres(count, seed)
+    for index, sphere in enumerate(spheres):
+        sphere.material = materials[index % 2]
+    return spheres
+
+
+class CompiledSceneTests(unittest.TestCase):
+
+    def setUp(self):
+        floor = Plane(Vector(0.0, -0.5, 0.0), Vector(0.0, 1.0, 0.0), Material('white', 1.0, 1.0, 1.0, 0.9))
+        self.shapes = material_spheres(50)
+        self.shapes.insert(10, floor)
+        self.lights = [Light(0.0, 2.0, -2.0, 0.75), Light(0.0, 0.5, -1.0, 0.5)]
+        self.compiled = CompiledScene(self.shapes, self.lights)
+        self.origins, self.directions = random_rays(300)
+
+    def test_layout(self):
+        compiled = self.compiled
+        self.assertEqual(len(compiled), 51)
+        self.assertEqual(compiled.sphere_centres.shape, (50, 3))
+        numpy.testing.assert_array_equal(compiled.plane_indices, [10])
+        numpy.testing.assert_array_equal(compiled.sphere_radii2, compiled.sphere_radii ** 2)
+        # materials are shared by content
+        self.assertEqual(len(compiled.material_colours), 3)
+        numpy.testing.assert_array_equal(compiled.shape_colours[10], [1.0, 1.0, 1.0])
+        self.assertEqual(compiled.shape_reflectance[12], 0.0)
+        numpy.testing.assert_array_equal(compiled.light_powers, [0.75, 0.5])
+
+    def test_kernels_match_shapes(self):
+        compiled = self.compiled
+        spheres = sphere_distances(self.origins, self.directions, compiled.sphere_centres, compiled.sphere_radii2)
+        planes = plane_distances(self.origins, self.directions, compiled.plane_points, compiled.plane_normals)
+        for column, index in enumerate(compiled.sphere_indices):
+            numpy.testing.assert_array_equal(spheres[:, column],
+                                             self.shapes[index].intersect_batch(self.origins, self.directions))
+        numpy.testing.assert_array_equal(planes[:, 0], self.shapes[10].intersect_batch(self.origins, self.directions))
+
+    def test_normals_match_shapes(self):
+        hit_index = numpy.arange(len(self.origins)) % len(self.shapes)
+        points = self.origins
+        expected = numpy.array([self.shapes[index].normal_batch(point[None])[0]
+                                for index, point in zip(hit_index, points)])
+        numpy.testing.assert_array_equal(self.compiled.normals(points, hit_index), expected)
+
+    def test_shapes_round_trip(self):
+        self.assertEqual([shape.key() for shape in self.compiled.shapes()], [shape.key() for shape in self.shapes])
+        self.assertEqual([light.key() for light in self.compiled.lights()], [light.key() for light in self.lights])
+
+    def test_pickles_as_arrays(self):
+        data = pickle.dumps(self.compiled, pickle.HIGHEST_PROTOCOL)
+        self.assertLess(len(data), self.compiled.nbytes + 4096)
+        numpy.testing.assert_array_equal(pickle.loads(data).sphere_centres, self.compiled.sphere_centres)
+
+    def test_unsupported_shape(self):
+        self.assertRaises(TypeError, CompiledScene, [object()], [])
+
+    def test_compiled_bvh_matches(self):
+        compiled_bvh = BVH(self.shapes, compiled=self.compiled)
+        bvh = BVH(self.shapes)
+
+        t, hit_index = compiled_bvh.intersect_batch(self.origins, self.directions)
+        expected_t, expected_index = bvh.intersect_batch(self.origins, self.directions)
+        numpy.testing.assert_array_equal(t, expected_t)
+        numpy.testing.assert_array_equal(hit_index, expected_index)
+
+        distances = numpy.full(len(self.origins), 4.0)
+        numpy.testing.assert_array_equal(
+            compiled_bvh.occluders_batch(self.origins, self.directions, hit_index, distances),
+            bvh.occluders_batch(self.origins, self.directions, hit_index, distances)
+        )
@@ -0,0 +1,92 @@
+import unittest
+
+import numpy
+
+from ..shapes import Sphere
+from ..material import Material
+from ..light import Light
+from ..raytracer import Raytracer
+from ..incremental import IncrementalRaytracer, SceneDiff
+from ..stats import RenderStats
+from raytracer_tests import demo_scene
+
+
+class SceneDiffTests(unittest.TestCase):
+
+    def test_edited_shape_is_removed_and_added(self):
+        old, new = demo_scene(), demo_scene()
+        new.shapes[1] = Sphere(1.0, 0.25, -2.0, 0.5, new.shapes[1].material)
+        diff = SceneDiff(old, new)
+        self.assertEqual(list(diff.removed), [1])
+        self.assertEqual(diff.added, [1])
+        self.assertEqual(list(diff.old_to_new), [0, -1, 2, 3])
+        self.assertFalse(diff.lights_changed or diff.camera_changed)
+
+    def test_unchanged_scene_is_empty(self):
+        self.assertTrue(SceneDiff(demo_scene(), demo_scene()).empty)
+
+
+class IncrementalRenderTests(unittest.TestCase):
+
+    def assert_matches_full_render(self, raytracer, scene):
+        image = raytracer.render(scene)
+        self.assertTrue(numpy.allclose(image, Raytracer(scene).render(vectorized=True), atol=1e-9))
+        return raytracer.retraced
+
+    def test_moved_sphere(self):
+        raytracer = IncrementalRaytracer()
+        raytracer.render(demo_scene())
+        scene = demo_scene()
+        scene.shapes[2] = Sphere(-0.25, -0.25, -1.25, 0.25, scene.shapes[2].material)
+        retraced = self.assert_matches_full_render(raytracer, scene)
+        self.assertLess(retraced, 0.5 * 32 * 24)
+
+    def test_added_and_removed_spheres(self):
+        raytracer = IncrementalRaytracer()
+        raytracer.render(demo_scene())
+
+        scene = demo_scene()
+        scene.shapes.insert(0, Sphere(0.25, 0.5, -1.5, 0.2, Material('grey', 0.5, 0.5, 0.5, 0.0)))
+        self.assert_matches_full_render(raytracer, scene)
+
+        scene = demo_scene()
+        del scene.shapes[1]
+        self.assert_matches_full_render(raytracer, scene)
+
+    def test_changed_light_and_unchanged_scene(self):
+        raytracer = IncrementalRaytracer()
+        raytracer.render(demo_scene())
+
+        scene = demo_scene()
+        scene.lights[0] = Light(0.5, 2.0, -2.0, 0.5)
+        self.assert_matches_full_render(raytracer, scene)
+
+        self.assertEqual(self.assert_matches_full_render(raytracer, scene), 0)
+
+    def test_added_light_then_moved_sphere(self):
+        raytracer = IncrementalRaytracer()
+        raytracer.render(demo_scene())
+
+        scene = demo_scene()
+        scene.lights.append(Light(0.5, 2.0, -2.0, 0.5))
+        # the record has no occluders for the new light, so it starts over
+        self.assertFalse(raytracer.can_update(scene))
+        self.assertEqual(self.assert_matches_full_render(raytracer, scene), 32 * 24)
+
+        moved = demo_scene()
+        moved.lights = scene.lights
+        moved.shapes[2] = Sphere(-0.25, -0.25, -1.25, 0.25, moved.shapes[2].material)
+        self.assertLess(self.assert_matches_full_render(raytracer, moved), 0.5 * 32 * 24)
+
+    def test_large_retrace_in_parallel(self):
+        raytracer = IncrementalRaytracer(parallel_pixels=0, workers=2)
+        stats = RenderStats()
+        raytracer.render(demo_scene(), stats=stats)
+        self.assertEqual(stats.primary_rays, 32 * 24)
+
+        scene = demo_scene()
+        scene.shapes[2] = Sphere(-0.25, -0.25, -1.25, 0.25, scene.shapes[2].material)
+        self.assert_matches_full_render(raytracer, scene)
+        scene = demo_scene()
+        del scene.shapes[1]
+        self.assert_matches_full_render(raytracer, scene)
@@ -16,3 +16,16 @@ class IntersectionTests(unittest.TestCase):
 
         t = sphere.intersect(ray)
         self.assertAlmostEqual(t, 11.5)
+
+    def test_ray_grazing_sphere(self):
+        sphere = Sphere(0.0, 0.0, 0.0, 1.0, None)
+        # a tangent ray touches the sphere at a single point, which doesn't count as a hit
+        tangent = Ray(Vector(1.0, -5.0, 0.0), Vector(0.0, 1.0, 0.0))
+        self.assertEqual(sphere.intersect(tangent), numpy.inf)
+
+        # rays starting exactly on the surface, going in or out, hit it where they start without dividing by zero
+        for direction in (-1.0, 1.0):
+            ray = Ray(Vector(1.0, 0.0, 0.0), Vector(direction, 0.0, 0.0))
+            self.assertEqual(sphere.intersect(ray), 0.0)
+            t = sphere.intersect_batch(numpy.array([[1.0, 0.0, 0.0]]), numpy.array([[direction, 0.0, 0.0]]))
+            self.assertEqual(list(t), [0.0])
@@ -0,0 +1,211 @@
+import unittest
+import threading
+
+from ..raytracer import Raytracer, RenderCancelled, check_cancelled
+from ..parallel import ParallelRaytracer
+from ..jobs import RenderJob, RenderScheduler
+from ..incremental import IncrementalRaytracer
+from ..shapes import Sphere
+from raytracer_tests import demo_scene
+
+
+class Gate(object):
+    """
+    Job function that records its calls and blocks until released or its job is cancelled
+    """
+
+    def __init__(self, result=None):
+        self.result = result
+        self.started = threading.Event()
+        self.released = threading.Event()
+        self.calls = 0
+
+    def __call__(self, job):
+        self.calls += 1
+        self.started.set()
+        while not self.released.wait(0.01):
+            check_cancelled(job.cancelled)
+        job.progress('rendered')
+        return self.result
+
+
+class RenderSchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = RenderScheduler(slots=1)
+
+    def test_runs_job(self):
+        gate = Gate(result='image')
+        gate.released.set()
+        messages = []
+        self.assertEqual(self.scheduler.submit('alice', 'a', gate).follow(messages.append, interval=0.01), 'image')
+        self.assertEqual(messages[-1], 'rendered')
+
+    def test_slots_bound_running_jobs(self):
+        first, second = Gate(), Gate()
+        first_job = self.scheduler.submit('alice', 'a', first)
+        second_job = self.scheduler.submit('bob', 'b', second)
+        self.assertTrue(first.started.wait(5))
+        self.assertFalse(second.started.wait(0.1))
+        self.assertEqual(second_job.state, RenderJob.QUEUED)
+        self.assertEqual(self.scheduler.stats, {'running': 1, 'queued': 1})
+
+        first.released.set()
+        second.released.set()
+        second_job.follow(interval=0.01)
+        self.assertEqual(first_job.state, RenderJob.FINISHED)
+
+    def test_owners_take_turns(self):
+        running = Gate()
+        self.scheduler.submit('carol', 'running', running)
+        self.assertTrue(running.started.wait(5))
+
+        order = []
+
+        def record(name):
+            def function(job):
+                order.append(name)
+            return function
+
+        alice = [self.scheduler.submit('alice', 'alice {0}'.format(index), record('alice {0}'.format(index)))
+                 for index in range(3)]
+        bob = self.scheduler.submit('bob', 'bob', record('bob'))
+        self.assertEqual([self.scheduler.position(job) for job in alice + [bob]], [0, 2, 3, 1])
+
+        messages = []
+        follower = threading.Thread(target=bob.follow, args=(messages.append, 0.01))
+        follower.start()
+        while not messages:
+            follower.join(0.01)
+        running.released.set()
+        follower.join(5)
+        alice[-1].follow(interval=0.01)
+        self.assertEqual(order, ['alice 0', 'bob', 'alice 1', 'alice 2'])
+        self.assertEqual(messages[0], 'Waiting for a free renderer, 1 render ahead in the queue')
+
+    def test_position_passes_over_running_owners(self):
+        scheduler = RenderScheduler(slots=2)
+        dave, carol = Gate(), Gate()
+        scheduler.submit('dave', 'dave', dave)
+        self.assertTrue(dave.started.wait(5))
+        scheduler.submit('carol', 'carol', carol)
+        self.assertTrue(carol.started.wait(5))
+
+        later, alice = Gate(), Gate()
+        later_job = scheduler.submit('carol', 'carol later', later)
+        alice_job = scheduler.submit('alice', 'alice', alice)
+        # dave's slot frees up first, while carol is still rendering
+        self.assertEqual([scheduler.position(later_job), scheduler.position(alice_job)], [1, 0])
+
+        dave.released.set()
+        self.assertTrue(alice.started.wait(5))
+        self.assertEqual(later_job.state, RenderJob.QUEUED)
+        for gate in (carol, later, alice):
+            gate.released.set()
+        later_job.follow(interval=0.01)
+
+    def test_identical_jobs_share_render(self):
+        gate = Gate(result='image')
+        job = self.scheduler.submit('alice', 'a', gate)
+        self.assertIs(self.scheduler.submit('alice', 'a', Gate()), job)
+        self.assertIs(self.scheduler.submit('bob', 'a', Gate()), job)
+        gate.released.set()
+        self.assertEqual(job.follow(interval=0.01), 'image')
+        self.assertEqual(gate.calls, 1)
+
+        # finished jobs aren't shared, the render cache is there for those
+        again = Gate()
+        again.released.set()
+        self.assertIsNot(self.scheduler.submit('alice', 'a', again), job)
+
+    def test_cancel_queued_job(self):
+        running, queued = Gate(), Gate()
+        self.scheduler.submit('alice', 'a', running)
+        job = self.scheduler.submit('bob', 'b', queued)
+        job.cancel()
+        self.assertRaises(RenderCancelled, job.follow, interval=0.01)
+        running.released.set()
+        self.scheduler.submit('carol', 'c', Gate()).cancel()
+        self.assertEqual(queued.calls, 0)
+
+    def test_cancel_running_job(self):
+        gate = Gate()
+        job = self.scheduler.submit('alice', 'a', gate)
+        self.assertTrue(gate.started.wait(5))
+        job.cancel()
+        self.assertRaises(RenderCancelled, job.follow, interval=0.01)
+        self.assertEqual(job.state, RenderJob.CANCELLED)
+
+    def test_supersede_cancels_owners_jobs(self):
+        running, queued, other = Gate(), Gate(), Gate()
+        first = self.scheduler.submit('alice', 'a', running)
+        self.assertTrue(running.started.wait(5))
+        second = self.scheduler.submit('alice', 'b', queued)
+        bob = self.scheduler.submit('bob', 'c', other)
+
+        latest = Gate(result='latest')
+        latest.released.set()
+        other.released.set()
+        job = self.scheduler.submit('alice', 'd', latest, supersede=True)
+        self.assertRaises(RenderCancelled, first.follow, interval=0.01)
+        self.assertRaises(RenderCancelled, second.follow, interval=0.01)
+        self.assertEqual(job.follow(interval=0.01), 'latest')
+        self.assertEqual(bob.state, RenderJob.FINISHED)
+        self.assertEqual(queued.calls, 0)
+
+    def test_failure_reaches_follower(self):
+        def fail(job):
+            raise IOError('disk full')
+
+        self.assertRaises(IOError, self.scheduler.submit('alice', 'a', fail).follow, interval=0.01)
+        gate = Gate(result='image')
+        gate.released.set()
+        self.assertEqual(self.scheduler.submit('alice', 'b', gate).follow(interval=0.01), 'image')
+
+
+class CancellationTests(unittest.TestCase):
+
+    def test_render_stops_between_columns(self):
+        cancel = threading.Event()
+        raytracer = Raytracer(demo_scene())
+        for vectorized in (False, True):
+            cancel.clear()
+            messages = []
+
+            def update(message):
+                messages.append(message)
+                cancel.set()
+
+            self.assertRaises(RenderCancelled, raytracer.render, update_callback=update, vectorized=vectorized,
+                              cancel=cancel)
+            self.assertEqual(messages, ['0.0% complete'])
+
+    def test_parallel_render_stops_between_tiles(self):
+        cancel = threading.Event()
+        raytracer = ParallelRaytracer(demo_scene(64, 48), workers=1, tile_size=8)
+        messages = []
+
+        def update(message):
+            messages.append(message)
+            cancel.set()
+
+        self.assertRaises(RenderCancelled, raytracer.render, update_callback=update, cancel=cancel)
+        self.assertEqual(len(messages), 1)
+        self.assertRaises(RenderCancelled, lambda: list(raytracer.render_progressive(cancel=cancel)))
+
+    def test_incremental_render_stops(self):
+        cancel = threading.Event()
+        cancel.set()
+        for raytracer in (IncrementalRaytracer(), IncrementalRaytracer(parallel_pixels=0, workers=1)):
+            raytracer.render(demo_scene())
+            scene = demo_scene()
+            scene.shapes[2] = Sphere(-0.25, -0.25, -1.25, 0.25, scene.shapes[2].material)
+            self.assertRaises(RenderCancelled, raytracer.render, scene, cancel=cancel)
+            # the record was part way through being updated so the next render starts over
+            self.assertFalse(raytracer.can_update(scene))
+            self.assertEqual(raytracer.render(scene, cancel=threading.Event()).shape, (24, 32, 3))
+            self.assertEqual(raytracer.retraced, 32 * 24)
+
+    def test_unset_event_renders(self):
+        scene = demo_scene()
+        self.assertEqual(Raytracer(scene).render(vectorized=True, cancel=threading.Event()).shape, (24, 32, 3))
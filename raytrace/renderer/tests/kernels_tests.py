@@ -0,0 +1,97 @@
+import unittest
+
+import numpy
+
+from .. import kernels
+from ..kernels import NumpyKernels, NumbaKernels, BACKENDS
+from ..mathlib import Vector, Ray
+from ..raytracer import Raytracer
+from ..stats import RenderStats
+from bvh_tests import random_spheres, random_rays
+from raytracer_tests import demo_scene
+
+
+class KernelParityTests(unittest.TestCase):
+    """
+    Every available backend against the scalar Sphere.intersect and each other
+    """
+
+    def setUp(self):
+        self.spheres = random_spheres(20)
+        self.centres = numpy.array([sphere.centre.data for sphere in self.spheres])
+        self.radii2 = numpy.array([sphere.radius ** 2 for sphere in self.spheres])
+        self.origins, self.directions = random_rays(200)
+        self.original = kernels.backend
+
+    def tearDown(self):
+        kernels.backend = self.original
+
+    def scalar_distances(self):
+        return numpy.array([[sphere.intersect(Ray(Vector(*origin), Vector(*direction), normalised=True))
+                             for sphere in self.spheres]
+                            for origin, direction in zip(self.origins.tolist(), self.directions.tolist())])
+
+    def test_closest_spheres(self):
+        distances = self.scalar_distances()
+        for backend in BACKENDS.values():
+            t, best = backend.closest_spheres(self.origins, self.directions, self.centres, self.radii2)
+            numpy.testing.assert_allclose(t, distances.min(axis=1), rtol=1e-12)
+            hits = t < numpy.inf
+            self.assertTrue(hits.any())
+            numpy.testing.assert_array_equal(best[hits], distances.argmin(axis=1)[hits])
+
+    def test_first_blocking_spheres(self):
+        distances = self.scalar_distances()
+        indices = numpy.arange(len(self.spheres)) * 2
+        ignore = indices[numpy.arange(len(self.origins)) % len(self.spheres)]
+        max_distances = numpy.linspace(0.5, 10.0, len(self.origins))
+        blocked = (distances < max_distances[:, None]) & (indices != ignore[:, None])
+        expected = numpy.where(blocked.any(axis=1), blocked.argmax(axis=1), -1)
+        self.assertTrue((expected >= 0).any() and (expected < 0).any())
+        for backend in BACKENDS.values():
+            numpy.testing.assert_array_equal(backend.first_blocking_spheres(
+                self.origins, self.directions, self.centres, self.radii2, indices, ignore, max_distances
+            ), expected)
+
+    def test_lambert(self):
+        to_light, normals = random_rays(50)[1], random_rays(50, seed=2)[1]
+        expected = [Vector(*to_light[index]).dot(Vector(*normals[index])) * 0.75 for index in range(50)]
+        for backend in BACKENDS.values():
+            numpy.testing.assert_allclose(backend.lambert(to_light, normals, 0.75), expected, rtol=1e-12)
+
+    @unittest.skipIf(NumbaKernels is None, 'numba is not installed')
+    def test_backends_render_alike(self):
+        scene = demo_scene(24, 18)
+        images = []
+        for name in ('numpy', 'numba'):
+            kernels.select(name)
+            images.append(Raytracer(scene).render(vectorized=True))
+        numpy.testing.assert_allclose(images[0], images[1], atol=1e-9)
+
+
+class KernelSelectionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.original = kernels.backend
+
+    def tearDown(self):
+        kernels.backend = self.original
+
+    def test_automatic_selection(self):
+        self.assertIs(self.original, NumbaKernels or NumpyKernels)
+
+    def test_select(self):
+        self.assertIs(kernels.select('numpy'), NumpyKernels)
+        self.assertIs(kernels.backend, NumpyKernels)
+        self.assertRaises(ValueError, kernels.select, 'fortran')
+
+    def test_backend_reported_in_stats(self):
+        kernels.select('numpy')
+        stats = RenderStats()
+        Raytracer(demo_scene(8, 6), stats).render(vectorized=True)
+        self.assertEqual(stats.as_dict()['backend'], 'numpy')
+        self.assertTrue(stats.summary().endswith('kernels: numpy'))
+
+        merged = RenderStats()
+        merged.merge(stats)
+        self.assertEqual(merged.backend, 'numpy')
@@ -0,0 +1,136 @@
+import unittest
+import random
+
+import numpy
+
+from ..mathlib import Vector
+from ..shapes import Sphere, Plane
+from ..material import Material
+from ..light import Light, LightIndex
+from ..camera import Camera
+from ..scene import Scene
+from ..raytracer import Raytracer
+from ..record import TraceRecord, CULLED
+from ..stats import RenderStats
+from raytracer_tests import demo_scene
+
+
+def many_lights_scene(lights=100, min_light=0.0, seed=0): # type: (int, float, int) -> Scene
+    """
+    Spheres on a floor lit by faint lights scattered all around them, above and below the floor
+    """
+    generator = random.Random(seed)
+    grey = Material('grey', 0.7, 0.7, 0.7, 0.25)
+    shapes = [Sphere(generator.uniform(-1.5, 1.5), generator.uniform(-0.25, 1.0), generator.uniform(-4.0, -2.0), 0.3,
+                     grey) for _ in range(6)]
+    shapes.append(Plane(Vector(0.0, -0.5, 0.0), Vector(0.0, 1.0, 0.0), Material('_white', 1.0, 1.0, 1.0, 0.5)))
+    scene_lights = [Light(generator.uniform(-5.0, 5.0), generator.uniform(-3.0, 4.0), generator.uniform(-8.0, 1.0),
+                          generator.uniform(0.0, 3.0 / lights)) for _ in range(lights)]
+    return Scene(shapes, scene_lights, Camera(0.0, 0.0, -0.5, 2, 32, 24, min_light=min_light))
+
+
+class LightIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        generator = numpy.random.RandomState(0)
+        self.positions = generator.uniform(-5.0, 5.0, (100, 3))
+        self.powers = generator.uniform(0.0, 1.0, 100)
+        self.index = LightIndex(self.positions, self.powers, leaf_size=8)
+
+    def test_clusters_partition_lights_brightest_first(self):
+        self.assertEqual(sorted(light for lights in self.index.clusters for light in lights), range(100))
+        self.assertTrue(all(0 < len(lights) <= 8 for lights in self.index.clusters))
+        for lights in self.index.clusters:
+            self.assertEqual(lights, sorted(lights, key=lambda light: -self.powers[light]))
+        self.assertEqual(list(self.index.max_powers), sorted(self.index.max_powers, reverse=True))
+
+    def test_facing_keeps_every_light_in_front(self):
+        generator = numpy.random.RandomState(1)
+        points = generator.uniform(-5.0, 5.0, (200, 3))
+        normals = generator.normal(size=(200, 3))
+        normals /= numpy.sqrt((normals * normals).sum(axis=1))[:, None]
+
+        facing = self.index.facing(points, normals)
+        self.assertFalse(facing.all())
+        for cluster, lights in enumerate(self.index.clusters):
+            in_front = (((self.positions[lights][None] - points[:, None]) * normals[:, None]).sum(axis=2) > 0).any(axis=1)
+            self.assertTrue(facing[in_front, cluster].all())
+
+    def test_single_cluster_skips_facing(self):
+        index = LightIndex(self.positions[:4], self.powers[:4])
+        self.assertEqual(len(index.clusters), 1)
+        self.assertIsNone(index.facing(self.positions[:2], self.positions[:2]))
+        self.assertEqual(sorted(index.lights(Vector(0.0, 0.0, 0.0), Vector(0.0, 1.0, 0.0))), range(4))
+        self.assertEqual(index.lights(Vector(0.0, 0.0, 0.0), Vector(0.0, 1.0, 0.0), min_light=1.0), [])
+
+
+class LightCullingTests(unittest.TestCase):
+
+    def test_lights_behind_surface_add_nothing(self):
+        scene = demo_scene()
+        # below the floor, where it used to darken everything on the floor it could reach through the floor
+        below = Scene(scene.shapes, scene.lights + [Light(0.0, -3.0, -2.0, 0.75)], scene.camera)
+        for vectorized in (False, True):
+            numpy.testing.assert_allclose(Raytracer(below).render(vectorized=vectorized),
+                                          Raytracer(scene).render(vectorized=vectorized), atol=1e-12)
+
+    def test_scalar_and_vectorized_cull_alike(self):
+        for min_light in (0.0, 0.01):
+            scalar, vectorized = RenderStats(), RenderStats()
+            image = Raytracer(many_lights_scene(min_light=min_light), scalar).render()
+            numpy.testing.assert_allclose(
+                Raytracer(many_lights_scene(min_light=min_light), vectorized).render(vectorized=True), image, atol=1e-6
+            )
+            self.assertEqual(vectorized.shadow_rays, scalar.shadow_rays)
+            self.assertEqual(vectorized.culled_shadow_rays, scalar.culled_shadow_rays)
+            self.assertEqual(vectorized.saturated_shadow_rays, scalar.saturated_shadow_rays)
+            self.assertGreater(scalar.culled_shadow_rays, 0)
+            self.assertIn('shadow rays culled: {0}, skipped as saturated: {1}'.format(
+                scalar.culled_shadow_rays, scalar.saturated_shadow_rays), scalar.summary())
+
+    def test_threshold_culls_faint_lights(self):
+        exact, culled = RenderStats(), RenderStats()
+        reference = Raytracer(many_lights_scene(), exact).render(vectorized=True)
+        image = Raytracer(many_lights_scene(min_light=0.001), culled).render(vectorized=True)
+        self.assertEqual(exact.shadow_rays + exact.culled_shadow_rays + exact.saturated_shadow_rays,
+                         culled.shadow_rays + culled.culled_shadow_rays + culled.saturated_shadow_rays)
+        self.assertLess(culled.shadow_rays, exact.shadow_rays * 0.9)
+        self.assertGreater(culled.culled_shadow_rays, exact.culled_shadow_rays)
+        # each culled light could have added at most min_light to a hit point's luminance
+        self.assertLess(numpy.abs(image - reference).max(), 0.001 * 100)
+
+    def test_saturated_hits_skip_remaining_lights(self):
+        scene = demo_scene()
+        bright = Scene(scene.shapes, [Light(0.0, 2.0, -1.0, 2.0)] + scene.lights, scene.camera)
+        for vectorized in (False, True):
+            stats, dim = RenderStats(), RenderStats()
+            Raytracer(bright, stats).render(vectorized=vectorized)
+            Raytracer(scene, dim).render(vectorized=vectorized)
+            self.assertGreater(stats.saturated_shadow_rays, 0)
+            self.assertEqual(dim.saturated_shadow_rays, 0)
+            # every light at every hit point is traced, culled or skipped, and only once
+            hits = (dim.shadow_rays + dim.culled_shadow_rays) / len(scene.lights)
+            self.assertEqual(stats.shadow_rays + stats.culled_shadow_rays + stats.saturated_shadow_rays,
+                             hits * len(bright.lights))
+
+    def test_light_index_leaves_image_unchanged(self):
+        scene = many_lights_scene()
+        self.assertGreater(len(scene.light_index.clusters), 1)
+        single = many_lights_scene()
+        compiled = single.compiled
+        single._light_index = LightIndex(compiled.light_positions, compiled.light_powers, leaf_size=len(single.lights))
+        numpy.testing.assert_allclose(Raytracer(scene).render(vectorized=True),
+                                      Raytracer(single).render(vectorized=True), atol=1e-12)
+
+    def test_record_marks_culled_lights(self):
+        scene = demo_scene()
+        scene = Scene(scene.shapes, scene.lights + [Light(0.0, -3.0, -2.0, 0.75)], scene.camera)
+        record = TraceRecord(len(scene.lights))
+        camera = scene.camera
+        pixels = numpy.arange(camera.width * camera.height)
+        Raytracer(scene).render_pixels(pixels // camera.width, pixels % camera.width, record=record)
+
+        hits = record.hit_index >= 0
+        self.assertTrue((record.occluders[hits, 2] == CULLED).any())
+        record.remap(numpy.arange(len(scene.shapes)))
+        self.assertTrue((record.occluders[hits, 2] == CULLED).any())
@@ -0,0 +1,104 @@
+import unittest
+
+import numpy
+
+from ..material import Material, MaterialTable, MaterialRegistry
+from ..arrays import SceneArrays
+from ..compiled import CompiledScene
+from ..shapes import Plane
+from ..mathlib import Vector
+from arrays_tests import MATERIALS, SPHERES, LIGHTS
+
+
+class MaterialTests(unittest.TestCase):
+
+    def test_key_describes_content(self):
+        white = Material('_white', 1.0, 1.0, 1.0, 0.9)
+        self.assertEqual(white.key(), (1.0, 1.0, 1.0, 0.9))
+        self.assertEqual(Material('snow', 1.0, 1.0, 1.0, 0.9).key(), white.key())
+        self.assertNotEqual(Material('_white', 1.0, 0.5, 1.0, 0.9).key(), white.key())
+
+
+class MaterialTableTests(unittest.TestCase):
+
+    def test_dense_ids(self):
+        table = MaterialTable()
+        red = table.get_or_create('red', 0.8, 0.1, 0.1, 0.25)
+        blue = table.get_or_create('blue', 0.1, 0.4, 0.8, 0.5)
+        self.assertIs(table.get_or_create('red', 0.8, 0.1, 0.1, 0.25), red)
+        self.assertEqual((table.id('red'), table.id('blue'), len(table)), (0, 1, 2))
+        self.assertEqual(table.materials, [red, blue])
+        numpy.testing.assert_array_equal(table.colours, [[0.8, 0.1, 0.1], [0.1, 0.4, 0.8]])
+        numpy.testing.assert_array_equal(table.reflectance[[1, 0, 1]], [0.5, 0.25, 0.5])
+
+    def test_changed_material_keeps_id(self):
+        table = MaterialTable()
+        table.get_or_create('red', 0.8, 0.1, 0.1, 0.25)
+        table.get_or_create('blue', 0.1, 0.4, 0.8, 0.5)
+        colours = table.colours
+        table.get_or_create('red', 0.9, 0.1, 0.1, 0.25)
+        self.assertEqual(table.id('red'), 0)
+        self.assertEqual(table.colours[0, 0], 0.9)
+        self.assertEqual(colours[0, 0], 0.8)
+        self.assertRaises(KeyError, table.id, 'green')
+
+    def test_scene_reload_reuses_materials(self):
+        table = MaterialTable()
+        shapes = SceneArrays.from_rows(MATERIALS, SPHERES, LIGHTS).shapes(table)
+        changed = [MATERIALS[0], ('bright', 1.0, 0.5, 0.1, 0.25)]
+        reloaded = SceneArrays.from_rows(changed, SPHERES, LIGHTS).shapes(table)
+        self.assertIs(reloaded[0].material, shapes[0].material)
+        self.assertIsNot(reloaded[1].material, shapes[1].material)
+        self.assertEqual(reloaded[1].material.key(), (1.0, 0.5, 0.1, 0.25))
+
+        compiled = CompiledScene(reloaded, [])
+        numpy.testing.assert_array_equal(compiled.shape_materials, [0, 1, 0])
+        numpy.testing.assert_array_equal(compiled.material_colours, table.colours)
+
+    def test_reload_drops_removed_materials(self):
+        table = MaterialTable()
+        SceneArrays.from_rows(MATERIALS, SPHERES, LIGHTS).shapes(table)
+        renamed = [('crimson',) + MATERIALS[0][1:], MATERIALS[1]]
+        spheres = [sphere[:4] + ('crimson' if sphere[4] == 'red' else sphere[4],) for sphere in SPHERES]
+        for _ in range(3):
+            SceneArrays.from_rows(renamed, spheres, LIGHTS).shapes(table)
+        self.assertEqual([material.name for material in table.materials], ['bright', 'crimson'])
+        self.assertEqual((table.id('crimson'), len(table.colours)), (1, 2))
+        self.assertRaises(KeyError, table.id, 'red')
+
+    def test_floor_interned_after_spheres(self):
+        table = MaterialTable()
+        shapes = SceneArrays.from_rows(MATERIALS, SPHERES, LIGHTS).shapes(table)
+        white = table.get_or_create('_white', 1.0, 1.0, 1.0, 0.9)
+        self.assertIs(table.get_or_create('_white', 1.0, 1.0, 1.0, 0.9), white)
+        floor = Plane(Vector(0.0, -0.5, 0.0), Vector(0.0, 1.0, 0.0), white)
+        compiled = CompiledScene(shapes + [floor], [], table)
+        self.assertEqual(compiled.shape_materials[-1], table.id('_white'))
+        numpy.testing.assert_array_equal(compiled.material_reflectance, table.reflectance)
+
+    def test_compiled_scene_indexes_by_table_id(self):
+        table = MaterialTable()
+        shapes = SceneArrays.from_rows(MATERIALS, SPHERES, LIGHTS).shapes(table)
+        # an unused material keeps its id and a material from outside the table is numbered after them
+        table.get_or_create('unused', 0.0, 0.0, 0.0, 0.0)
+        floor = Plane(Vector(0.0, -0.5, 0.0), Vector(0.0, 1.0, 0.0), Material('_white', 1.0, 1.0, 1.0, 0.9))
+        compiled = CompiledScene(list(reversed(shapes)) + [floor], [], table)
+        numpy.testing.assert_array_equal(compiled.shape_materials,
+                                         [table.id(shape.material.name) for shape in reversed(shapes)] + [3])
+        numpy.testing.assert_array_equal(compiled.material_colours[:3], table.colours)
+        numpy.testing.assert_array_equal(compiled.material_reflectance, list(table.reflectance) + [0.9])
+        self.assertEqual(compiled.shape_reflectance[-1], 0.9)
+
+
+class MaterialRegistryTests(unittest.TestCase):
+
+    def test_table_per_data_set(self):
+        registry = MaterialRegistry(max_data_sets=2)
+        first = registry.table(1)
+        self.assertIs(registry.table(1), first)
+        self.assertIsNot(registry.table(2), first)
+
+        registry.table(1)
+        registry.table(3)
+        self.assertEqual(len(registry), 2)
+        self.assertIs(registry.table(1), first)
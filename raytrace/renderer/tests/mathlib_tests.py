@@ -1,6 +1,6 @@
 import unittest
 
-from ..mathlib import Vector
+from ..mathlib import Vector, Ray
 
 
 class VectorTest(unittest.TestCase):
@@ -41,3 +41,29 @@ class VectorTest(unittest.TestCase):
         b = Vector(0, 1, 0)
         self.assertTrue(a.dot(b) == 0)
 
+    def test_in_place_operations(self):
+        a = Vector(1, 1, 1)
+        b = a
+        a += Vector(1, 2, 3)
+        a -= Vector(1, 1, 1)
+        a *= 2
+        self.assertIs(a, b)
+        self.assertEqual((a.x, a.y, a.z), (2, 4, 6))
+
+    def test_normalise(self):
+        a = Vector(3, 0, 4)
+        self.assertIs(a.normalise(), a)
+        self.assertAlmostEqual(a.magnitude, 1.0)
+
+
+class RayTest(unittest.TestCase):
+
+    def test_direction_normalised(self):
+        ray = Ray(Vector(0, 0, 0), Vector(0, 0, 2))
+        self.assertEqual(ray.direction.z, 1)
+
+    def test_normalised_direction_used_as_is(self):
+        direction = Vector(0, 0, 1)
+        ray = Ray(Vector(0, 0, 0), direction, normalised=True)
+        self.assertIs(ray.direction, direction)
+        self.assertEqual(ray.inverse_direction, (None, None, 1.0))
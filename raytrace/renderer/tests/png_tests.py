@@ -0,0 +1,95 @@
+import unittest
+import struct
+import zlib
+import io
+
+import numpy
+
+from ..png import PNGWriter, write_png, quantise
+from ..parallel import ParallelRaytracer
+from ..raytracer import Raytracer
+from raytracer_tests import demo_scene, with_precision
+
+
+def read_png(data): # type: (bytes) -> numpy.ndarray
+    """
+    Minimal decoder for the unfiltered 8 bit RGB images PNGWriter produces, checking chunk crcs on the way
+    """
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    position, idat = 8, b''
+    while position < len(data):
+        length, = struct.unpack('>I', data[position:position + 4])
+        kind = data[position + 4:position + 8]
+        body = data[position + 8:position + 8 + length]
+        crc, = struct.unpack('>I', data[position + 8 + length:position + 12 + length])
+        assert crc == zlib.crc32(kind + body) & 0xffffffff
+        if kind == b'IHDR':
+            width, height, bit_depth, colour_type = struct.unpack('>IIBB', body[:10])
+            assert (bit_depth, colour_type) == (8, 2)
+        elif kind == b'IDAT':
+            idat += body
+        position += 12 + length
+
+    scanlines = numpy.frombuffer(zlib.decompress(idat), dtype=numpy.uint8).reshape(height, 1 + width * 3)
+    assert not scanlines[:, 0].any()
+    return scanlines[:, 1:].reshape(height, width, 3)
+
+
+class PNGWriterTests(unittest.TestCase):
+
+    def test_round_trip_in_blocks(self):
+        image = numpy.random.RandomState(0).uniform(-0.1, 1.1, (23, 17, 3))
+        output = io.BytesIO()
+        with PNGWriter(output, 17, 23) as writer:
+            for start in range(0, 23, 5):
+                writer.write_rows(image[start:start + 5])
+
+        numpy.testing.assert_array_equal(read_png(output.getvalue()), quantise(image))
+
+    def test_quantise_rounds(self):
+        numpy.testing.assert_array_equal(quantise(numpy.array([-1.0, 0.0, 0.499 / 255, 0.501 / 255, 1.0, 2.0])),
+                                         [0, 0, 0, 1, 255, 255])
+
+    def test_rejects_bad_rows(self):
+        writer = PNGWriter(io.BytesIO(), 4, 2)
+        self.assertRaises(ValueError, writer.write_rows, numpy.zeros((1, 5, 3)))
+        writer.write_rows(numpy.zeros((2, 4, 3)))
+        self.assertRaises(ValueError, writer.write_rows, numpy.zeros((1, 4, 3)))
+
+    def test_close_requires_every_row(self):
+        writer = PNGWriter(io.BytesIO(), 4, 2)
+        writer.write_rows(numpy.zeros((1, 4, 3)))
+        self.assertRaises(ValueError, writer.close)
+
+
+class StreamingRenderTests(unittest.TestCase):
+
+    def test_stream_matches_render(self):
+        scene = demo_scene(width=37, height=29)
+        output = io.BytesIO()
+        writer = PNGWriter(output, 37, 29)
+        ParallelRaytracer(scene, workers=2, tile_size=8).render_stream(writer, lookahead=1)
+        writer.close()
+
+        expected = io.BytesIO()
+        write_png(expected, Raytracer(scene).render(vectorized=True))
+        self.assertEqual(output.getvalue(), expected.getvalue())
+
+    def test_stream_with_subsamples(self):
+        scene = demo_scene(width=20, height=12)
+        rows = []
+
+        class Rows(object):
+            def write_rows(self, pixels):
+                rows.append(pixels)
+
+        for precision in ('float64', 'float32'):
+            del rows[:]
+            scene = with_precision(scene, precision)
+            raytracer = ParallelRaytracer(scene, workers=2, tile_size=5)
+            raytracer.render_stream(Rows(), subsamples=4)
+            image = numpy.concatenate(rows)
+            self.assertEqual([len(band) for band in rows], [5, 5, 2])
+            self.assertEqual(image.dtype, scene.camera.dtype)
+            # each band's jitter is its rows of the same fixed pattern a whole image render uses
+            numpy.testing.assert_array_equal(image, raytracer.render(subsamples=4))
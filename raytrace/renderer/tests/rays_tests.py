@@ -0,0 +1,104 @@
+import unittest
+import threading
+import random
+
+import numpy
+
+from ..mathlib import Vector
+from ..camera import Camera
+from ..raytracer import Raytracer
+from ..rays import PrimaryRays, primary_directions, jitter_pattern, screen_space
+from raytracer_tests import demo_scene
+
+
+class PrimaryRaysTests(unittest.TestCase):
+
+    def setUp(self):
+        self.camera = Camera(0.25, 0.0, -0.5, 4, 8, 6)
+
+    def test_directions_match_per_pixel_vectors(self):
+        left, bottom, right, top = screen_space(self.camera)
+        directions = PrimaryRays().directions(self.camera)
+        for x_index, x in enumerate(numpy.linspace(left, right, self.camera.width)):
+            for y_index, y in enumerate(numpy.linspace(bottom, top, self.camera.height)):
+                expected = (self.camera.position - Vector(x, y, 0.0)).normalise()
+                self.assertTrue(numpy.allclose(directions[y_index, x_index], expected.data, atol=1e-12))
+
+    def test_repeated_requests_reuse_directions(self):
+        rays = PrimaryRays()
+        directions = rays.directions(self.camera)
+        self.assertIs(rays.directions(Camera(0.25, 0.0, -0.5, 8, 8, 6)), directions)
+        self.assertIsNot(rays.directions(Camera(0.0, 0.0, -0.5, 4, 8, 6)), directions)
+        self.assertEqual((rays.hits, rays.misses), (1, 2))
+        self.assertFalse(directions.flags.writeable)
+
+    def test_keyed_by_subsamples(self):
+        rays = PrimaryRays()
+        directions = rays.directions(self.camera, 4)
+        self.assertEqual(directions.shape, (6, 8, 4, 3))
+        self.assertIs(rays.directions(self.camera, 4), directions)
+        self.assertIsNot(rays.directions(self.camera, 5), directions)
+
+        jitter = jitter_pattern(8, numpy.arange(6), 4)
+        rows, columns = numpy.array([0, 5, 2]), numpy.array([7, 0, 3])
+        self.assertTrue(numpy.array_equal(
+            rays.pixel_directions(self.camera, rows, columns, 4),
+            primary_directions(self.camera, rows, columns, jitter[rows, columns])
+        ))
+        self.assertTrue(numpy.array_equal(
+            PrimaryRays(max_bytes=1024).pixel_directions(self.camera, rows, columns, 4),
+            primary_directions(self.camera, rows, columns, jitter[rows, columns])
+        ))
+
+    def test_jitter_pattern_fixed_per_row(self):
+        jitter = jitter_pattern(8, numpy.arange(6), 6)
+        numpy.testing.assert_array_equal(jitter_pattern(8, numpy.array([4, 1]), 6), jitter[[4, 1]])
+        cells = numpy.floor(jitter * numpy.array([3, 2])).astype(int)
+        self.assertTrue(numpy.array_equal(cells[..., 0], numpy.tile([0, 1, 2, 0, 1, 2], (6, 8, 1))))
+        self.assertTrue(numpy.array_equal(cells[..., 1], numpy.tile([0, 0, 0, 1, 1, 1], (6, 8, 1))))
+
+    def test_evicts_least_recently_used(self):
+        rays = PrimaryRays(max_bytes=2 * 8 * 6 * 3 * 8)
+        first = rays.directions(Camera(0.0, 0.0, -0.5, 4, 8, 6))
+        rays.directions(Camera(0.1, 0.0, -0.5, 4, 8, 6))
+        rays.directions(Camera(0.0, 0.0, -0.5, 4, 8, 6))
+        rays.directions(Camera(0.2, 0.0, -0.5, 4, 8, 6))
+        self.assertIs(rays.directions(Camera(0.0, 0.0, -0.5, 4, 8, 6)), first)
+        self.assertEqual(rays.stats['entries'], 2)
+        self.assertEqual(rays.stats['bytes'], 2 * first.nbytes)
+
+    def test_threads_share_directions(self):
+        rays = PrimaryRays(max_bytes=3 * 8 * 6 * 3 * 8)
+        cameras = [Camera(0.1 * (index % 4), 0.0, -0.5, 4, 8, 6) for index in range(32)]
+        threads = [threading.Thread(target=rays.directions, args=(camera,)) for camera in cameras]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(rays.hits + rays.misses, 32)
+        self.assertEqual(rays.stats['entries'], 3)
+        self.assertEqual(rays.stats['bytes'], 3 * 8 * 6 * 3 * 8)
+
+    def test_images_too_big_to_cache(self):
+        rays = PrimaryRays(max_bytes=1024)
+        self.assertIsNone(rays.directions(self.camera))
+        rows, columns = numpy.array([1, 4]), numpy.array([6, 2])
+        self.assertTrue(numpy.array_equal(rays.pixel_directions(self.camera, rows, columns),
+                                          primary_directions(self.camera, rows, columns)))
+        self.assertEqual(rays.stats['entries'], 0)
+
+    def test_repeated_renders_skip_ray_generation(self):
+        rays = PrimaryRays()
+        scene = demo_scene(16, 12)
+        first = Raytracer(scene, rays=rays).render(vectorized=True)
+        misses = rays.misses
+        self.assertTrue(numpy.array_equal(Raytracer(scene, rays=rays).render(vectorized=True), first))
+        list(Raytracer(scene, rays=rays).render_progressive())
+        self.assertEqual(rays.misses, misses)
+
+        random.seed(1)
+        jittered = Raytracer(scene, rays=rays).render(subsamples=4, vectorized=True)
+        misses = rays.misses
+        random.seed(2)
+        self.assertTrue(numpy.array_equal(Raytracer(scene, rays=rays).render(subsamples=4, vectorized=True), jittered))
+        self.assertEqual(rays.misses, misses)
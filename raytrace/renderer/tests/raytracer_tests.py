@@ -0,0 +1,265 @@
+import unittest
+import random
+
+import numpy
+
+from ..mathlib import Vector, Ray
+from ..shapes import Sphere, Plane
+from ..material import Material
+from ..light import Light
+from ..camera import Camera
+from ..scene import Scene
+from ..raytracer import Raytracer, progressive_passes, stratified_jitter, edge_pixels, frequent_occluders
+from ..parallel import ParallelRaytracer
+from ..stats import RenderStats
+from ..png import quantise
+from ..benchmarks.scenes import demo_scene
+
+
+class VectorizedRenderTests(unittest.TestCase):
+
+    def test_matches_scalar_render(self):
+        raytracer = Raytracer(demo_scene())
+        scalar = raytracer.render()
+        vectorized = raytracer.render(vectorized=True)
+        self.assertTrue(numpy.allclose(scalar, vectorized, atol=1e-6))
+
+    def test_matches_scalar_render_with_subsamples(self):
+        raytracer = Raytracer(demo_scene(16, 12, 2))
+        random.seed(42)
+        scalar = raytracer.render(subsamples=2)
+        random.seed(42)
+        vectorized = raytracer.render(subsamples=2, vectorized=True)
+        self.assertTrue(numpy.allclose(scalar, vectorized, atol=1e-6))
+
+    def test_sphere_batch_intersection(self):
+        sphere = Sphere(0, 0, 2, 0.5, None)
+        origins = numpy.array([[0.0, 0.0, -10.0], [0.0, 5.0, -10.0], [0.0, 0.0, 2.0]])
+        directions = numpy.array([[0.0, 0.0, 1.0], [0.0, 0.0, 1.0], [0.0, 0.0, 1.0]])
+
+        t = sphere.intersect_batch(origins, directions)
+        self.assertAlmostEqual(t[0], 11.5)
+        self.assertEqual(t[1], numpy.inf)
+        self.assertAlmostEqual(t[2], 0.5)
+
+
+class ParallelRenderTests(unittest.TestCase):
+
+    def test_matches_single_process_render(self):
+        scene = demo_scene(20, 15, 2)
+        random.seed(7)
+        single = Raytracer(scene).render(subsamples=2, vectorized=True)
+        random.seed(7)
+        updates = []
+        parallel = ParallelRaytracer(scene, workers=2, tile_size=8).render(subsamples=2, update_callback=updates.append)
+        self.assertTrue(numpy.array_equal(single, parallel))
+        self.assertEqual(len(updates), 6)
+
+
+class ProgressiveRenderTests(unittest.TestCase):
+
+    def test_passes_cover_every_pixel_once(self):
+        covered = numpy.zeros((13, 21), dtype=int)
+        for stride, rows, columns in progressive_passes(21, 13, 8):
+            covered[rows, columns] += 1
+        self.assertTrue((covered == 1).all())
+
+    def test_final_frame_matches_render(self):
+        raytracer = Raytracer(demo_scene())
+        frames = list(raytracer.render_progressive(coarsest=4))
+        self.assertEqual(len(frames), 3)
+        self.assertTrue(numpy.array_equal(frames[-1], raytracer.render(vectorized=True)))
+        # coarse frames are filled in blocks from their traced pixels
+        self.assertTrue(numpy.array_equal(frames[0][:4, :4], numpy.tile(frames[-1][0, 0], (4, 4, 1))))
+
+    def test_parallel_final_frame_matches_render(self):
+        scene = demo_scene()
+        frames = list(ParallelRaytracer(scene, workers=2, tile_size=8).render_progressive(coarsest=4))
+        self.assertTrue(numpy.array_equal(frames[-1], Raytracer(scene).render(vectorized=True)))
+
+
+class AntialiasingTests(unittest.TestCase):
+
+    def test_stratified_samples_stay_in_their_cell(self):
+        jitter = stratified_jitter(50, 6)
+        cells = numpy.floor(jitter * numpy.array([3, 2])).astype(int)
+        self.assertTrue(numpy.array_equal(cells[:, :, 0], numpy.tile([0, 1, 2, 0, 1, 2], (50, 1))))
+        self.assertTrue(numpy.array_equal(cells[:, :, 1], numpy.tile([0, 0, 0, 1, 1, 1], (50, 1))))
+
+    def test_edge_pixels(self):
+        image = numpy.zeros((4, 4, 3))
+        image[:, 2:, 0] = 1.0
+        edges = edge_pixels(image, 0.5)
+        self.assertTrue(edges[:, 1:3].all())
+        self.assertFalse(edges[:, 0].any() or edges[:, 3].any())
+
+    def test_adaptive_close_to_uniform_quality(self):
+        raytracer = Raytracer(demo_scene(48, 36, 2))
+        random.seed(1)
+        reference = raytracer.render(subsamples=36, vectorized=True)
+        random.seed(2)
+        uniform = raytracer.render(subsamples=12, vectorized=True)
+        random.seed(3)
+        adaptive = raytracer.render_adaptive(subsamples=12, threshold=0.05)
+        self.assertLess(numpy.abs(adaptive - reference).mean(), 1.5 * numpy.abs(uniform - reference).mean())
+
+
+class ShadowTests(unittest.TestCase):
+
+    def scene(self, blocker_y): # type: (float) -> Scene
+        """
+        Floor lit by a single light at y = 1 with a sphere above the centre of the floor at blocker_y
+        """
+        white = Material('_white', 1.0, 1.0, 1.0, 0.0)
+        shapes = [
+            Plane(Vector(0.0, -0.5, 0.0), Vector(0.0, 1.0, 0.0), white),
+            Sphere(0.0, blocker_y, -2.0, 0.2, white)
+        ]
+        return Scene(shapes, [Light(0.0, 1.0, -2.0, 1.0)], Camera(0.0, 0.0, -0.5, 0, 8, 6))
+
+    def test_shapes_beyond_light_do_not_occlude(self):
+        raytracer = Raytracer(self.scene(3.0))
+        origins = numpy.array([[0.0, 0.0, -0.5]])
+        directions = numpy.array([[0.0, -0.5, -1.5]]) / numpy.sqrt(0.25 + 2.25)
+        colour = raytracer.trace_batch(origins, directions)
+        self.assertTrue((colour > 0).all())
+        self.assertEqual(raytracer.trace(Ray(Vector(origins[0]), Vector(directions[0]))).x, colour[0, 0])
+
+    def test_shapes_between_hit_and_light_occlude(self):
+        raytracer = Raytracer(self.scene(0.25))
+        origins = numpy.array([[0.0, 0.0, -0.5]])
+        directions = numpy.array([[0.0, -0.5, -1.5]]) / numpy.sqrt(0.25 + 2.25)
+        self.assertTrue((raytracer.trace_batch(origins, directions) == 0).all())
+        self.assertEqual(raytracer.trace(Ray(Vector(origins[0]), Vector(directions[0]))).x, 0)
+
+    def test_frequent_occluders(self):
+        self.assertEqual(list(frequent_occluders(numpy.array([-1, 3, 3, 1, -1, 3, 1, 0]), 2)), [3, 1])
+        self.assertEqual(len(frequent_occluders(numpy.array([-1, -1]))), 0)
+
+
+def mirror_scene(depth): # type: (int) -> Scene
+    """
+    Two facing half mirrors with a light between them, a ray from mirror_ray at a shallow angle bounces between
+    them until the depth runs out
+    """
+    mirror = Material('mirror', 0.9, 0.8, 0.7, 0.5)
+    shapes = [
+        Plane(Vector(0.0, -1.0, 0.0), Vector(0.0, 1.0, 0.0), mirror),
+        Plane(Vector(0.0, 1.0, 0.0), Vector(0.0, -1.0, 0.0), mirror)
+    ]
+    camera = Camera(0.0, 0.0, 0.0, depth, 8, 6)
+    camera.background = Vector(0.2, 0.3, 0.4)
+    return Scene(shapes, [Light(0.0, 0.0, -1.0, 1.0)], camera)
+
+
+def mirror_ray(): # type: () -> tuple
+    direction = numpy.array([0.0, 1.0, -0.05])
+    return numpy.zeros((1, 3)), (direction / numpy.sqrt((direction * direction).sum()))[None]
+
+
+class WavefrontTests(unittest.TestCase):
+
+    def test_matches_recursive_trace(self):
+        raytracer = Raytracer(mirror_scene(20))
+        origins, directions = mirror_ray()
+        colour = raytracer.trace_batch(origins, directions)
+        expected = raytracer.trace(Ray(Vector(origins[0]), Vector(directions[0]), normalised=True))
+        self.assertTrue(numpy.allclose(colour[0], expected.data, atol=1e-9))
+
+    def test_depth_beyond_recursion_limit(self):
+        stats = RenderStats()
+        origins, directions = mirror_ray()
+        Raytracer(mirror_scene(3000), stats).trace_batch(origins, directions)
+        self.assertEqual(stats.primary_rays, 1)
+        self.assertEqual(stats.reflection_rays, 3000)
+
+
+class TerminationTests(unittest.TestCase):
+
+    def test_threshold_error_bounded(self):
+        exact = RenderStats()
+        reference = Raytracer(demo_scene(depth=8), exact).render(vectorized=True)
+
+        scene = demo_scene(depth=8)
+        scene.camera.min_weight = 0.01
+        stats = RenderStats()
+        image = Raytracer(scene, stats).render(vectorized=True)
+
+        self.assertLess(stats.reflection_rays, exact.reflection_rays)
+        self.assertGreater(stats.terminated_rays, 0)
+        # whatever was cut off carried less than min_weight of the pixel colour
+        self.assertLessEqual(numpy.abs(image - reference).max(), 0.01)
+        self.assertTrue(numpy.allclose(image, Raytracer(scene).render(), atol=1e-6))
+
+    def test_roulette_unbiased(self):
+        scene = mirror_scene(20)
+        origins, directions = mirror_ray()
+        exact = Raytracer(scene).trace_batch(origins, directions)[0]
+
+        scene.camera.min_weight = 0.2
+        scene.camera.roulette = True
+        random.seed(0)
+        stats = RenderStats()
+        samples = Raytracer(scene, stats).trace_batch(numpy.tile(origins, (20000, 1)), numpy.tile(directions, (20000, 1)))
+        self.assertGreater(stats.terminated_rays, 0)
+        self.assertTrue(numpy.allclose(samples.mean(axis=0), exact, rtol=0.01))
+
+        # cutting off at the same weight without roulette loses the tail of the reflections
+        scene.camera.roulette = False
+        self.assertFalse(numpy.allclose(Raytracer(scene).trace_batch(origins, directions)[0], exact, rtol=0.01))
+
+    def test_settings_in_camera_key(self):
+        scene = demo_scene()
+        key = scene.camera.key()
+        scene.camera.min_weight = 0.01
+        self.assertNotEqual(scene.camera.key(), key)
+
+
+def with_precision(scene, precision): # type: (Scene, str) -> Scene
+    camera = scene.camera
+    return scene.with_camera(Camera(camera.position.x, camera.position.y, camera.position.z, camera.depth,
+                                    camera.width, camera.height, precision=precision))
+
+
+class PrecisionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.scene = demo_scene(64, 48)
+        self.reference = Raytracer(self.scene).render(vectorized=True)
+
+    def test_float32_error_bounded(self):
+        image = Raytracer(with_precision(self.scene, 'float32')).render(vectorized=True)
+        self.assertEqual(image.dtype, numpy.float32)
+        error = numpy.abs(image - self.reference)
+        self.assertLess(error.mean(), 1e-6)
+        self.assertLess(error.max(), 1e-4)
+
+    def test_float32_arrays(self):
+        scene = with_precision(self.scene, 'float32')
+        compiled, bvh = scene.lowered('float32')
+        self.assertIs(scene.lowered('float32')[0], compiled)
+        self.assertIs(scene.with_camera(scene.camera).lowered('float32')[1], bvh)
+        self.assertEqual(compiled.sphere_centres.dtype, numpy.float32)
+        self.assertEqual(compiled.shape_materials.dtype, self.scene.compiled.shape_materials.dtype)
+        # bounding boxes are rounded outwards so they still hold their shapes
+        self.assertEqual(bvh.root.lower.dtype, numpy.float32)
+        self.assertTrue((bvh.root.lower <= self.scene.bvh.root.lower).all())
+        self.assertTrue((bvh.root.upper >= self.scene.bvh.root.upper).all())
+        self.assertEqual(Raytracer(scene).trace_batch(*mirror_ray()).dtype, numpy.float32)
+
+    def test_quantised_output(self):
+        raytracer = Raytracer(self.scene)
+        quantised = raytracer.render(vectorized=True, quantised=True)
+        self.assertEqual(quantised.dtype, numpy.uint8)
+        numpy.testing.assert_array_equal(quantised, quantise(self.reference))
+        numpy.testing.assert_array_equal(raytracer.render(quantised=True), quantise(raytracer.render()))
+        numpy.testing.assert_array_equal(ParallelRaytracer(self.scene, workers=2, tile_size=16).render(quantised=True),
+                                         quantised)
+
+        lean = Raytracer(with_precision(self.scene, 'float32')).render(vectorized=True, quantised=True)
+        # colours sitting exactly between two levels can round either way
+        self.assertLessEqual(numpy.abs(lean.astype(int) - quantised).max(), 1)
+
+    def test_precision_in_key(self):
+        self.assertNotEqual(with_precision(self.scene, 'float32').key(), self.scene.key())
+        self.assertRaises(ValueError, Camera, 0.0, 0.0, -0.5, 4, 32, 24, precision='float16')
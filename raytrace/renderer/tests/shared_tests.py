@@ -0,0 +1,122 @@
+import unittest
+import cPickle
+import threading
+import tempfile
+import shutil
+import os
+
+import numpy
+
+from ..shared import SharedArrays, SHARED_DIRECTORY
+from ..compiled import CompiledScene
+from ..raytracer import Raytracer, RenderCancelled
+from ..parallel import ParallelRaytracer, _initialise_worker, _render_tile, _render_pixels
+from ..record import TraceRecord
+from raytracer_tests import demo_scene
+
+
+def shared_files(): # type: () -> set
+    directory = SHARED_DIRECTORY or tempfile.gettempdir()
+    return set(name for name in os.listdir(directory) if name.startswith('raytrace-'))
+
+
+class SharedArraysTests(unittest.TestCase):
+
+    def setUp(self):
+        self.shared = SharedArrays({'values': numpy.arange(10.0), 'zeros': ((2, 3), numpy.uint8),
+                                    'empty': numpy.zeros((0, 3))})
+
+    def tearDown(self):
+        self.shared.close()
+
+    def test_copies_and_allocates(self):
+        arrays = self.shared.arrays
+        numpy.testing.assert_array_equal(arrays['values'], numpy.arange(10.0))
+        self.assertEqual(arrays['zeros'].dtype, numpy.uint8)
+        self.assertFalse(arrays['zeros'].any())
+        self.assertEqual(arrays['empty'].shape, (0, 3))
+        self.assertEqual(arrays['values'].ctypes.data % 64, 0)
+
+    def test_pickle_sends_handle_to_same_memory(self):
+        big = SharedArrays({'values': numpy.zeros(100000)})
+        try:
+            # only the path and layout, not the 800kB of values
+            self.assertLess(len(cPickle.dumps(big, 2)), 256)
+
+            other = cPickle.loads(cPickle.dumps(big, 2))
+            other.arrays['values'][5] = 3.0
+            self.assertEqual(big.arrays['values'][5], 3.0)
+            # only the creator removes the file
+            other.close()
+            self.assertTrue(os.path.exists(big.path))
+        finally:
+            big.close()
+        self.assertFalse(os.path.exists(big.path))
+
+    def test_arrays_outlive_file(self):
+        values = self.shared.arrays['values']
+        self.shared.close()
+        self.assertEqual(values.sum(), 45.0)
+
+
+class SharedRenderTests(unittest.TestCase):
+
+    def test_compiled_scene_attached_read_only(self):
+        compiled = demo_scene().compiled
+        with compiled.share() as shared:
+            attached = CompiledScene.attach(cPickle.loads(cPickle.dumps(shared, 2)))
+            for name, value in vars(compiled).items():
+                numpy.testing.assert_array_equal(getattr(attached, name), value)
+            self.assertFalse(attached.sphere_centres.flags.writeable)
+            self.assertEqual(len(attached.shapes()), len(compiled.shapes()))
+
+    def test_tile_written_to_framebuffer(self):
+        scene = demo_scene()
+        expected = Raytracer(scene).render(vectorized=True)
+        with scene.compiled.share() as compiled:
+            with SharedArrays({'image': ((24, 32, 3), float)}) as framebuffer:
+                _initialise_worker(cPickle.loads(cPickle.dumps(compiled, 2)), scene.camera)
+                task = (slice(8, 16), slice(4, 12), 0, False, framebuffer, None)
+                # only the tile's position comes back
+                self.assertEqual(_render_tile(cPickle.loads(cPickle.dumps(task, 2)))[:2], (slice(8, 16), slice(4, 12)))
+                image = framebuffer.arrays['image']
+                numpy.testing.assert_allclose(image[4:12, 8:16], expected[4:12, 8:16], atol=1e-12)
+                self.assertFalse(image[:4].any())
+
+    def test_pixels_written_to_framebuffer(self):
+        scene = demo_scene()
+        rows, columns = numpy.array([0, 3, 10]), numpy.array([5, 5, 20])
+        expected = TraceRecord(len(scene.lights))
+        pixels = Raytracer(scene).render_pixels(rows, columns, record=expected)
+        directory = tempfile.mkdtemp(prefix='raytrace-', dir=SHARED_DIRECTORY)
+        try:
+            with SharedArrays({'image': ((24, 32, 3), float)}) as framebuffer:
+                _initialise_worker(scene.compiled, scene.camera)
+                task = (rows, columns, 0, framebuffer, directory)
+                shared, stats = cPickle.loads(cPickle.dumps(_render_pixels(cPickle.loads(cPickle.dumps(task, 2))), 2))
+                # only a handle to the record comes back, not the pixels
+                self.assertLess(len(cPickle.dumps(shared, 2)), 1024)
+                numpy.testing.assert_allclose(framebuffer.arrays['image'][rows, columns], pixels, atol=1e-12)
+
+                shared.adopt()
+                record = TraceRecord.attach(shared)
+                shared.close()
+                self.assertEqual(os.listdir(directory), [])
+                numpy.testing.assert_array_equal(record.pixels, expected.pixels)
+                numpy.testing.assert_array_equal(record.occluders, expected.occluders)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_files_removed(self):
+        before = shared_files()
+        raytracer = ParallelRaytracer(demo_scene(), workers=2, tile_size=8)
+        raytracer.render(quantised=True)
+        record = TraceRecord(len(raytracer.scene.lights))
+        list(raytracer.render_progressive(coarsest=4, record=record))
+        self.assertEqual(len(numpy.unique(record.pixels)), 32 * 24)
+
+        cancel = threading.Event()
+        cancel.set()
+        self.assertRaises(RenderCancelled, raytracer.render, cancel=cancel)
+        self.assertRaises(RenderCancelled, lambda: list(raytracer.render_progressive(record=record, cancel=cancel)))
+        self.assertEqual(shared_files(), before)
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy
+
+from ..raytracer import Raytracer
+from ..parallel import ParallelRaytracer
+from ..stats import RenderStats
+from raytracer_tests import demo_scene
+
+
+class RenderStatsTests(unittest.TestCase):
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(Raytracer(demo_scene()).stats)
+        self.assertIsNone(ParallelRaytracer(demo_scene(), workers=1).stats)
+
+    def test_instrumentation_leaves_image_unchanged(self):
+        scene = demo_scene()
+        numpy.testing.assert_array_equal(
+            Raytracer(scene).render(vectorized=True),
+            Raytracer(scene, RenderStats()).render(vectorized=True)
+        )
+
+    def test_scalar_and_vectorized_counts_agree(self):
+        scalar, vectorized = RenderStats(), RenderStats()
+        Raytracer(demo_scene(), scalar).render()
+        Raytracer(demo_scene(), vectorized).render(vectorized=True)
+
+        self.assertEqual(scalar.primary_rays, 32 * 24)
+        self.assertEqual(vectorized.primary_rays, scalar.primary_rays)
+        self.assertEqual(vectorized.reflection_rays, scalar.reflection_rays)
+        self.assertEqual(vectorized.shadow_rays, scalar.shadow_rays)
+        self.assertGreater(scalar.reflection_rays, 0)
+        self.assertGreater(scalar.intersection_tests['Sphere'], 0)
+        self.assertGreater(scalar.intersection_tests['Plane'], 0)
+        self.assertGreater(scalar.elapsed, 0)
+        self.assertEqual(set(scalar.stage_seconds), {'primary', 'reflection', 'shadow'})
+
+    def test_average_reflection_depth(self):
+        stats = RenderStats()
+        stats.primary_rays, stats.reflection_rays = 10, 25
+        self.assertAlmostEqual(stats.average_reflection_depth, 2.5)
+        self.assertEqual(RenderStats().average_reflection_depth, 0.0)
+
+    def test_parallel_stats_merged(self):
+        serial = RenderStats()
+        Raytracer(demo_scene(), serial).render(vectorized=True)
+
+        raytracer = ParallelRaytracer(demo_scene(), workers=2, tile_size=8, instrument=True)
+        raytracer.render()
+        self.assertEqual(raytracer.stats.rays, serial.rays)
+        # intersection test counts depend on the tile size through the cached occluders, so only check they arrive
+        self.assertEqual(set(raytracer.stats.intersection_tests), set(serial.intersection_tests))
+        self.assertIn('shadow', raytracer.stats.summary())
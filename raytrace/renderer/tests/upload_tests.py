@@ -0,0 +1,159 @@
+import unittest
+import ftplib
+import shutil
+import tempfile
+import threading
+import os
+
+import numpy
+
+from ..upload import FTPConnectionPool, Uploader
+from ..png import PNGWriter
+
+
+class FakeFTP(object):
+    """
+    Local stand-in for ftplib.FTP recording stored files, failing the next few stores on request
+    """
+
+    def __init__(self, server, host, user, password):
+        self.server = server
+        self.closed = False
+        self.directory = ''
+        server.connections += 1
+
+    def cwd(self, directory):
+        self.directory = directory
+
+    def storbinary(self, command, source, blocksize=8192):
+        data = b''
+        while True:
+            block = source.read(blocksize)
+            if not block:
+                break
+            data += block
+        with self.server.lock:
+            if self.server.failures:
+                self.server.failures -= 1
+                raise ftplib.error_temp('421 Service not available')
+        self.server.files[self.directory + '/' + command.split(' ', 1)[1]] = data
+
+    def close(self):
+        self.closed = True
+
+
+class FakeFTPServer(object):
+
+    def __init__(self, failures=0):
+        self.files = {}
+        self.failures = failures
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, host, user, password):
+        return FakeFTP(self, host, user, password)
+
+
+class UploaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'render.png')
+        with open(self.path, 'wb') as image:
+            image.write(b'image data')
+        self.sleeps = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def uploader(self, server, retries=3):
+        return Uploader(FTPConnectionPool('host', 'user', 'password', 'application', factory=server),
+                        retries=retries, backoff=0.5, sleep=self.sleeps.append)
+
+    def test_upload_reuses_connection(self):
+        server = FakeFTPServer()
+        uploader = self.uploader(server)
+        self.assertTrue(uploader.submit(self.path, 'a.png').wait(5))
+        self.assertTrue(uploader.submit(self.path, 'b.png').wait(5))
+        self.assertEqual(server.files, {'application/a.png': b'image data', 'application/b.png': b'image data'})
+        self.assertEqual(server.connections, 1)
+
+    def test_retries_with_backoff(self):
+        server = FakeFTPServer(failures=2)
+        job = self.uploader(server).submit(self.path, 'render.png')
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.attempts, 3)
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+        # failed connections are dropped rather than reused
+        self.assertEqual(server.connections, 3)
+
+    def test_gives_up_after_retries(self):
+        job = self.uploader(FakeFTPServer(failures=10), retries=2).submit(self.path, 'render.png')
+        self.assertFalse(job.wait(5))
+        self.assertEqual(job.attempts, 3)
+        self.assertIsInstance(job.error, ftplib.error_temp)
+
+    def test_contents_read_on_submit(self):
+        server = FakeFTPServer()
+        uploader = self.uploader(server)
+        job = uploader.submit(self.path, 'render.png')
+        with open(self.path, 'wb') as image:
+            image.write(b'overwritten')
+        job.wait(5)
+        self.assertEqual(server.files['application/render.png'], b'image data')
+
+    def test_stream_uploads_while_writing(self):
+        server = FakeFTPServer()
+        stream = self.uploader(server).stream(self.path, 'render.png')
+        with stream:
+            stream.write(b'first ')
+            stream.write(b'second')
+        self.assertTrue(stream.job.wait(5))
+        self.assertEqual(server.files['application/render.png'], b'first second')
+        with open(self.path, 'rb') as image:
+            self.assertEqual(image.read(), b'first second')
+
+    def test_stream_uploads_whole_png(self):
+        server = FakeFTPServer()
+        with self.uploader(server).stream(self.path, 'render.png') as stream:
+            with PNGWriter(stream, 4, 4) as writer:
+                writer.write_rows(numpy.zeros((4, 4, 3)))
+        self.assertTrue(stream.job.wait(5))
+        self.assertEqual(stream.job.attempts, 1)
+        with open(self.path, 'rb') as image:
+            # IEND's empty data used to end the upload before its crc
+            self.assertEqual(server.files['application/render.png'], image.read())
+
+    def test_stream_retried_from_local_file(self):
+        server = FakeFTPServer(failures=1)
+        with self.uploader(server).stream(self.path, 'render.png') as stream:
+            stream.write(b'streamed')
+        self.assertTrue(stream.job.wait(5))
+        self.assertEqual(stream.job.attempts, 2)
+        self.assertEqual(server.files['application/render.png'], b'streamed')
+
+    def test_failed_write_not_retried(self):
+        server = FakeFTPServer()
+        try:
+            with self.uploader(server).stream(self.path, 'render.png') as stream:
+                stream.write(b'partial')
+                raise RuntimeError('render failed')
+        except RuntimeError:
+            pass
+        self.assertFalse(stream.job.wait(5))
+        self.assertEqual(stream.job.attempts, 1)
+        self.assertNotIn('application/render.png', server.files)
+
+    def test_superseded_uploads_skipped(self):
+        server = FakeFTPServer()
+        uploader = self.uploader(server)
+        # hold the upload thread on a stream so the previews queue up behind it
+        stream = uploader.stream(os.path.join(self.directory, 'other.png'), 'other.png')
+        previews = [uploader.submit(self.path, 'render.png') for _ in range(3)]
+        stream.close()
+
+        self.assertTrue(previews[-1].wait(5))
+        for preview in previews[:-1]:
+            preview.wait(5)
+            self.assertTrue(preview.superseded)
+            self.assertEqual(preview.attempts, 0)
@@ -0,0 +1,304 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+import threading
+import ftplib
+import Queue
+import time
+import io
+
+
+class FTPConnectionPool(object):
+
+    def __init__(self, host, user, password, directory=None, size=2, factory=ftplib.FTP):
+        # type: (str, str, str, Optional[str], int, Callable[..., ftplib.FTP]) -> None
+        """
+        Keeps logged in FTP connections open between uploads.  Connections that fail are dropped rather than
+        returned, so a server side timeout costs one failed attempt and a fresh connection.
+        :param host: server to connect to
+        :param user: login name
+        :param password: login password
+        :param directory: directory to change to after logging in
+        :param size: maximum number of idle connections kept open
+        :param factory: called with host, user and password to open a connection, ftplib.FTP or a stand-in
+        """
+        self.host = host
+        self.user = user
+        self.password = password
+        self.directory = directory
+        self.size = size
+        self.factory = factory
+        self._idle = [] # type: List[ftplib.FTP]
+        self._lock = threading.Lock()
+
+    def acquire(self): # type: () -> ftplib.FTP
+        """
+        :return: an idle connection, or a new one if there are none
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+
+        connection = self.factory(self.host, self.user, self.password)
+        if self.directory:
+            connection.cwd(self.directory)
+        return connection
+
+    def release(self, connection, broken=False): # type: (ftplib.FTP, bool) -> None
+        """
+        Return a connection to the pool
+        :param connection: connection from acquire
+        :param broken: close the connection instead of keeping it, for connections that raised an error
+        """
+        with self._lock:
+            if not broken and len(self._idle) < self.size:
+                self._idle.append(connection)
+                return
+        _close(connection)
+
+    @contextmanager
+    def connection(self): # type: () -> Iterator[ftplib.FTP]
+        """
+        Borrow a connection for the duration of a with block, dropping it if the block raises
+        """
+        connection = self.acquire()
+        try:
+            yield connection
+        except BaseException:
+            self.release(connection, broken=True)
+            raise
+        self.release(connection)
+
+    def close(self): # type: () -> None
+        """
+        Close every idle connection
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            _close(connection)
+
+
+def _close(connection): # type: (ftplib.FTP) -> None
+    try:
+        connection.close()
+    except ftplib.all_errors:
+        pass
+
+
+class UploadJob(object):
+
+    def __init__(self, filename, data=None, stream=None): # type: (str, Optional[bytes], Optional[UploadStream]) -> None
+        """
+        A queued upload, from either a snapshot of a file's contents or an UploadStream
+        :param filename: name to store the file under
+        :param data: file contents
+        :param stream: stream the file is being written to
+        """
+        self.filename = filename
+        self.data = data
+        self.stream = stream
+        self.attempts = 0
+        self.succeeded = False
+        # a newer upload of the same file was queued before this one started
+        self.superseded = False
+        self.error = None # type: Optional[Exception]
+        self._done = threading.Event()
+
+    @property # type: bool
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None): # type: (Optional[float]) -> bool
+        """
+        Block until the upload has finished
+        :param timeout: seconds to wait, forever if None
+        :return: True if the file was uploaded
+        """
+        self._done.wait(timeout)
+        return self.succeeded
+
+
+class UploadStream(object):
+
+    def __init__(self, path): # type: (str) -> None
+        """
+        File like object that writes to a local file while handing the same data to an upload in progress, so the
+        upload can start before the file is finished.  Retries upload from the local file once it's complete.
+        :param path: local path of the file
+        """
+        self.path = path
+        self._file = open(path, 'wb')
+        self._chunks = Queue.Queue()
+        # cleared once the live upload stops reading, so chunks no longer pile up in memory
+        self._live = True
+        self._closed = threading.Event()
+        self.aborted = False
+
+    def write(self, data): # type: (bytes) -> None
+        self._file.write(data)
+        # an empty chunk would read as the end of the file
+        if self._live and data:
+            self._chunks.put(data)
+
+    def read(self, size=-1): # type: (int) -> bytes
+        """
+        Read the data written so far for the upload, blocking until more arrives.  Chunks are returned as written
+        so size is only a hint.
+        """
+        data = self._chunks.get()
+        if data is None and self.aborted:
+            raise IOError('Writing {0} failed part way through'.format(self.path))
+        return data or b''
+
+    def close(self): # type: () -> None
+        self._file.close()
+        self._chunks.put(None)
+        self._closed.set()
+
+    def abort(self): # type: () -> None
+        """
+        Close the stream after a failure writing it, ending the upload
+        """
+        self.aborted = True
+        self.close()
+
+    def detach(self): # type: () -> None
+        """
+        Stop handing data to the live upload
+        """
+        self._live = False
+
+    def replay(self): # type: () -> Optional[file]
+        """
+        Stop feeding the live upload and reopen the finished file for another attempt
+        :return: the local file, or None if writing it failed
+        """
+        self.detach()
+        self._closed.wait()
+        return None if self.aborted else open(self.path, 'rb')
+
+    def __enter__(self): # type: () -> UploadStream
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class Uploader(object):
+
+    def __init__(self, connections, retries=3, backoff=0.5, sleep=time.sleep):
+        # type: (FTPConnectionPool, int, float, Callable[[float], Any]) -> None
+        """
+        Uploads files on a background thread, retrying failures with exponential backoff.  When several uploads of
+        the same filename are queued only the most recent is sent, so progressive previews never hold up the
+        finished image.
+        :param connections: pool to take FTP connections from
+        :param retries: number of further attempts after a failure
+        :param backoff: seconds to wait before the first retry, doubling for each one after
+        :param sleep: called with the number of seconds to wait between attempts
+        """
+        self.connections = connections
+        self.retries = retries
+        self.backoff = backoff
+        self.sleep = sleep
+        self._jobs = Queue.Queue()
+        self._latest = {} # type: Dict[str, UploadJob]
+        self._lock = threading.Lock()
+        self._thread = None # type: Optional[threading.Thread]
+
+    def submit(self, path, filename): # type: (str, str) -> UploadJob
+        """
+        Queue a file for upload.  Its contents are read straight away so the file is free to be overwritten.
+        :param path: local path of the file
+        :param filename: name to store the file under
+        :return: UploadJob to wait on
+        """
+        with open(path, 'rb') as source:
+            return self._queue(UploadJob(filename, data=source.read()))
+
+    def stream(self, path, filename): # type: (str, str) -> UploadStream
+        """
+        Start uploading a file that is still being written.  Write to the returned stream and close it once
+        finished, its job attribute is the UploadJob to wait on.
+        :param path: local path to write the file to
+        :param filename: name to store the file under
+        :return: UploadStream to write the file to
+        """
+        stream = UploadStream(path)
+        stream.job = self._queue(UploadJob(filename, stream=stream))
+        return stream
+
+    def _queue(self, job): # type: (UploadJob) -> UploadJob
+        with self._lock:
+            self._latest[job.filename] = job
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='uploader')
+                # don't keep the process alive just to finish uploading a preview
+                self._thread.daemon = True
+                self._thread.start()
+        self._jobs.put(job)
+        return job
+
+    def _run(self): # type: () -> None
+        while True:
+            job = self._jobs.get()
+            with self._lock:
+                job.superseded = self._latest.get(job.filename) is not job
+            if job.superseded:
+                if job.stream is not None:
+                    # nothing will read the stream so stop it filling memory
+                    job.stream.detach()
+            else:
+                try:
+                    self._upload(job)
+                except Exception as error:
+                    # keep the thread alive for the next upload
+                    job.error = error
+                with self._lock:
+                    if self._latest.get(job.filename) is job:
+                        del self._latest[job.filename]
+            job._done.set()
+
+    def _upload(self, job): # type: (UploadJob) -> None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.sleep(self.backoff * 2 ** (attempt - 1))
+
+            if job.stream is None:
+                source = io.BytesIO(job.data)
+            elif attempt == 0:
+                source = job.stream
+            else:
+                source = job.stream.replay()
+                if source is None:
+                    return
+
+            job.attempts += 1
+            try:
+                with self.connections.connection() as connection:
+                    connection.storbinary('STOR {0}'.format(job.filename), source)
+                job.succeeded = True
+                job.error = None
+                return
+            except ftplib.all_errors as error:
+                job.error = error
+                if job.stream is not None and job.stream.aborted:
+                    return
+            finally:
+                if source is not job.stream:
+                    source.close()
+
+    def close(self, timeout=None): # type: (Optional[float]) -> None
+        """
+        Wait for queued uploads to finish and close the pooled connections
+        :param timeout: seconds to wait for each outstanding upload
+        """
+        with self._lock:
+            outstanding = self._latest.values()
+        for job in outstanding:
+            job.wait(timeout)
+        self.connections.close()
+
@@ -1,13 +1,37 @@
+from collections import OrderedDict
+import functools
+import threading
 import random
 import os.path
-import ftplib
 
-from matplotlib.pyplot import imsave
 from tropofy.widgets import StaticImage, ExecuteFunction
 
 import renderer
-import models
-from parameters import CameraParameters, ImageParameters
+from loader import SceneLoader
+from models import Keyframe
+from parameters import CameraParameters, ImageParameters, AnimationParameters
+
+# scenes loaded from recently rendered data sets
+scene_loader = SceneLoader()
+
+# rendered images keyed by scene content, shared by every render in this process
+render_cache = renderer.RenderCache(os.path.join('static', 'cache'))
+
+# previous render of recently rendered data sets, so edits only retrace the pixels they affect.  Renders run on the
+# scheduler's threads so the lock guards the dict, each renderer is only used by the render that took it out.
+MAX_INCREMENTAL_RENDERERS = 8
+incremental_renderers = OrderedDict()
+incremental_renderers_lock = threading.Lock()
+
+# uploads run in the background over pooled connections so they overlap rendering
+uploader = renderer.Uploader(renderer.FTPConnectionPool('tjwakeham.com', 'tropofy', 'N0T@RealPW!', 'application'))
+
+# renders run a couple at a time, queueing per data set, as each already uses every cpu
+MAX_CONCURRENT_RENDERS = 2
+render_jobs = renderer.RenderScheduler(MAX_CONCURRENT_RENDERS)
+
+# larger images are streamed to disk a band at a time rather than rendered progressively in memory
+MAX_PROGRESSIVE_PIXELS = 600 * 600
 
 
 class OutputImage(StaticImage):
@@ -17,79 +41,177 @@ class OutputImage(StaticImage):
         return 'http://fs.tjwakeham.com/tropofy/{0}?dummy={1}'.format(filename, random.randint(10000, 99999))
 
 
+def floor(materials): # type: (renderer.MaterialTable) -> list
+    """
+    The floor added to every scene, its material interned in the data set's table alongside the spheres'
+    :param materials: the data set's MaterialTable
+    :return: list of shapes
+    """
+    white = materials.get_or_create('_white', 1.0, 1.0, 1.0, 0.9)
+    return [renderer.Plane(renderer.Vector(0.0, -0.5, 0.0), renderer.Vector(0.0, 1.0, 0.0), white)]
+
+
+def load_scene(app_session): # type: (object) -> renderer.Scene
+    """
+    Scene for the app session's data set seen through the camera parameters, with a floor added
+    """
+    app_session.task_manager.send_progress_message('Generating scene')
+
+    # set up scene objects
+    camera = renderer.Camera(
+        x=app_session.data_set.get_param(CameraParameters.x.name),
+        y=app_session.data_set.get_param(CameraParameters.y.name),
+        z=app_session.data_set.get_param(CameraParameters.z.name),
+        ray_depth=app_session.data_set.get_param(CameraParameters.depth.name),
+        width=app_session.data_set.get_param(ImageParameters.width.name),
+        height=app_session.data_set.get_param(ImageParameters.height.name),
+        min_weight=app_session.data_set.get_param(CameraParameters.min_weight.name),
+        roulette=app_session.data_set.get_param(CameraParameters.roulette.name),
+        precision=app_session.data_set.get_param(CameraParameters.precision.name),
+        min_light=app_session.data_set.get_param(CameraParameters.min_light.name),
+    )
+
+    scene = scene_loader.scene(app_session.data_set, camera, extra_shapes=floor)
+    app_session.task_manager.send_progress_message('{0} scene of {1} spheres in {2:.3f}s'.format(
+        'Reused cached' if scene_loader.cached else 'Loaded', len(scene.shapes) - 1, scene_loader.load_seconds
+    ))
+    return scene
+
+
+def render_scene(job, scene, data_set_id, key, path, filename):
+    # type: (renderer.RenderJob, renderer.Scene, int, str, str, str) -> renderer.upload.UploadJob
+    """
+    Render a scene to path and start uploading it, run by the render scheduler with progress going to the job
+    :return: UploadJob for the finished image
+    """
+    camera = scene.camera
+    job.progress('Rendering scene')
+
+    with incremental_renderers_lock:
+        incremental = incremental_renderers.pop(data_set_id, None) or renderer.IncrementalRaytracer()
+    if camera.width * camera.height > MAX_PROGRESSIVE_PIXELS:
+        # too big to keep the image and ray metadata around for incremental updates
+        incremental = None
+        raytracer = renderer.ParallelRaytracer(scene, instrument=True)
+        # the upload starts with the first band rather than waiting for the whole image
+        with uploader.stream(path, filename) as stream:
+            with renderer.PNGWriter(stream, camera.width, camera.height) as writer:
+                raytracer.render_stream(writer, update_callback=job.progress, cancel=job.cancelled)
+        upload = stream.job
+        render_stats = raytracer.stats
+    elif incremental.can_update(scene):
+        # only retrace the pixels affected by edits since this data set's last render
+        render_stats = renderer.RenderStats()
+        image = incremental.render(scene, update_callback=job.progress, stats=render_stats, cancel=job.cancelled)
+        renderer.write_png(path, image)
+        upload = uploader.submit(path, filename)
+    else:
+        record = renderer.TraceRecord(len(scene.lights))
+        raytracer = renderer.ParallelRaytracer(scene, instrument=True)
+        frames = raytracer.render_progressive(update_callback=job.progress, record=record, cancel=job.cancelled)
+        for image in frames:
+            # upload every pass so the output image shows a coarse preview while the render refines,
+            # previews still queued when the next pass finishes are skipped
+            renderer.write_png(path, image)
+            upload = uploader.submit(path, filename)
+        incremental.reset(scene, image, record)
+        render_stats = raytracer.stats
+
+    job.progress('Render stats: ' + render_stats.summary())
+
+    # most recently rendered data sets last so the oldest are dropped first
+    with incremental_renderers_lock:
+        if incremental is not None:
+            incremental_renderers[data_set_id] = incremental
+        while len(incremental_renderers) > MAX_INCREMENTAL_RENDERERS:
+            incremental_renderers.popitem(last=False)
+
+    render_cache.put(key, path)
+    job.progress('Rendering complete!')
+    return upload
+
+
 class ExecuteRender(ExecuteFunction):
     def get_button_text(self, app_session):
         return "Render"
 
     def execute_function(self, app_session):
-        app_session.task_manager.send_progress_message('Generating scene')
-
-        # set up scene objects
-        camera = renderer.Camera(
-            x=app_session.data_set.get_param(CameraParameters.x.name),
-            y=app_session.data_set.get_param(CameraParameters.y.name),
-            z=app_session.data_set.get_param(CameraParameters.z.name),
-            ray_depth=app_session.data_set.get_param(CameraParameters.depth.name),
-            width=app_session.data_set.get_param(ImageParameters.width.name),
-            height=app_session.data_set.get_param(ImageParameters.height.name),
-        )
-
-        materials = {}
-        for material in app_session.data_set.query(models.Material).all():
-            materials[material.name] = renderer.Material(
-                name=material.name,
-                r=min(material.red, 1.0),
-                g=min(material.green, 1.0),
-                b=min(material.blue, 1.0),
-                reflectance=material.reflectance
-            )
-
-        shapes = []
-        for sphere in app_session.data_set.query(models.Sphere).all():
-            shapes.append(renderer.Sphere(
-                x=sphere.x,
-                y=sphere.y,
-                z=sphere.z,
-                radius=max(sphere.radius, 0.0),
-                material=materials[sphere.material]
-            ))
-
-        lights = []
-        for light in app_session.data_set.query(models.Light).all():
-            lights.append(renderer.Light(
-                x=light.x,
-                y=light.y,
-                z=light.z,
-                power=light.power
-            ))
-
-        # add in a floor
-        white = renderer.Material('_white', 1.0, 1.0, 1.0, 0.9)
-        shapes.append(renderer.Plane(renderer.Vector(0.0, -0.5, 0.0), renderer.Vector(0.0, 1.0, 0.0), white))
-
-        scene = renderer.Scene(shapes, lights, camera)
-
-        app_session.task_manager.send_progress_message('Rendering scene')
+        scene = load_scene(app_session)
 
         filename = app_session.data_set.get_param(ImageParameters.filename.name)
         path = os.path.join('static', filename)
 
-        raytracer = renderer.Raytracer(scene)
-        image = raytracer.render(update_callback=app_session.task_manager.send_progress_message)
-        imsave(path, image)
+        # unchanged scenes are served straight from the cache
+        key = renderer.scene_key(scene, subsamples=0)
+        if render_cache.get(key, path):
+            app_session.task_manager.send_progress_message('Loaded unchanged scene from cache')
+            upload = uploader.submit(path, filename)
+        else:
+            # a data set belongs to one user so its renders queue behind each other, and a new render replaces
+            # any of the data set's renders still queued or running as their image is about to be overwritten.
+            # Clicking render again on an unchanged scene follows the render already in progress.
+            job = render_jobs.submit(
+                app_session.data_set.id, (key, path),
+                functools.partial(render_scene, scene=scene, data_set_id=app_session.data_set.id, key=key, path=path,
+                                  filename=filename),
+                supersede=True
+            )
+            try:
+                upload = job.follow(app_session.task_manager.send_progress_message)
+            except renderer.RenderCancelled:
+                app_session.task_manager.send_progress_message('Render cancelled, replaced by a newer render')
+                return
+
+        if not upload.wait():
+            # the render is cached so trying again only repeats the upload
+            app_session.task_manager.send_progress_message('Failed to upload image, please try again')
+            return
 
-        app_session.task_manager.send_progress_message('Rendering complete!')
+        stats = render_cache.stats
+        app_session.task_manager.send_progress_message(
+            'Render cache: {hits} hits, {misses} misses, {entries} images ({bytes} bytes)'.format(**stats)
+        )
+        app_session.task_manager.send_progress_message('Done!')
 
-        app_session.task_manager.send_progress_message('Uploading image')
 
-        # upload file to server
-        try:
-            session = ftplib.FTP('tjwakeham.com', 'tropofy', 'N0T@RealPW!')
-            session.cwd('application')
-            with open(path, 'rb') as img_file:
-                session.storbinary('STOR {0}'.format(filename), img_file)
-            session.close()
-            app_session.task_manager.send_progress_message('Done!')
-        except ftplib.all_errors:
-            app_session.task_manager.send_progress_message('Failed to upload image, please try again')
+class ExecuteAnimation(ExecuteFunction):
+    def get_button_text(self, app_session):
+        return "Render animation"
+
+    def execute_function(self, app_session):
+        keyframes = app_session.data_set.query(Keyframe).all()
+        if not keyframes:
+            app_session.task_manager.send_progress_message('Add at least one keyframe to animate the camera')
+            return
+
+        scene = load_scene(app_session)
+        path = renderer.CameraPath([
+            (keyframe.time, renderer.Vector(keyframe.x, keyframe.y, keyframe.z)) for keyframe in keyframes
+        ])
+
+        # frames are numbered after the output image, render.png becomes render_0000.png, render_0001.png, ...
+        stem = os.path.splitext(app_session.data_set.get_param(ImageParameters.filename.name))[0]
+        pattern = stem + '_{0:04d}.png'
+        uploads = []
+
+        def upload_frame(frame, frame_path):
+            uploads.append(uploader.submit(frame_path, pattern.format(frame)))
+
+        app_session.task_manager.send_progress_message('Rendering animation')
+        animation = renderer.Animation(
+            scene, path, app_session.data_set.get_param(AnimationParameters.frames.name), instrument=True
+        )
+        animation.render(
+            os.path.join('static', pattern), update_callback=app_session.task_manager.send_progress_message,
+            frame_callback=upload_frame
+        )
+        app_session.task_manager.send_progress_message('Render stats: ' + animation.stats.summary())
+        app_session.task_manager.send_progress_message(
+            'Rendered {0} frames at {1:.1f} frames/minute'.format(len(uploads), animation.frames_per_minute)
+        )
 
+        failed = len([upload for upload in uploads if not upload.wait()])
+        if failed:
+            app_session.task_manager.send_progress_message('Failed to upload {0} frames, please try again'.format(failed))
+            return
+        app_session.task_manager.send_progress_message('Done!')
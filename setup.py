@@ -13,4 +13,8 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=requires,
+    extras_require={
+        # native intersection and shading kernels, see renderer/kernels.py.  0.47 is the last release for python 2
+        'jit': ['numba<0.48'],
+    },
 )